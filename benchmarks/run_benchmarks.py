@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+run_benchmarks.py
+
+Time the checks in tests/, run() end to end and the reductions behind
+show_single over synthetic RAMIP-like datasets of increasing number, and
+compare the results against a stored baseline.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks --sizes 2 8 32 --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json --threshold 0.2
+    python -m benchmarks.run_benchmarks --long --sizes 2
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Callable
+from benchmarks.synthetic import write_datasets
+from tests.utils import convert_paths, find_majority_ds
+from tests.test_monotonic import test_monotonic, test_time_steps
+from tests.test_calendar import test_calendar, get_calendar_fingerprint
+from tests.test_units import test_units
+from tests.test_variable_name import test_variable_name
+from tests.test_spatial_coords import test_spatial_coords
+from tests.test_values import test_values, test_value_magnitudes
+from tests.test_bounds import test_bounds, test_bounds_consensus
+from tests.test_chunks import test_chunk_layout
+from tests.summary import summarize_single
+from tests.run_tests import run
+
+# Each scenario is passed to write_datasets(). A few datasets in every scenario
+# get a defect injected so the failure paths of the checks are timed as well.
+SCENARIOS = {
+    "monthly_1deg_noleap": {"grid": 1.0, "calendar": "noleap", "frequency": "mon", "years": 10},
+    "monthly_0.5deg_360day_levels": {"grid": 0.5, "calendar": "360_day", "frequency": "mon", "years": 5, "levels": 4},
+    "daily_1deg_gregorian_members": {"grid": 1.0, "calendar": "gregorian", "frequency": "day", "years": 2, "members": 3},
+    "monthly_1deg_noleap_zarr": {"grid": 1.0, "calendar": "noleap", "frequency": "mon", "years": 10, "file_format": "zarr"},
+}
+
+# Centuries-long daily runs, only benchmarked with --long since writing them takes minutes. The
+# time checks scale with the number of timesteps rather than the grid, so a coarse grid keeps
+# each dataset at about 240 MB instead of the 24 GB of 250 daily years at 1 degree.
+LONG_SCENARIOS = {
+    "daily_10deg_noleap_250yr": {"grid": 10.0, "calendar": "noleap", "frequency": "day", "years": 250},
+}
+
+DEFECTS = ["duplicate_time", "calendar", "units", "lat_shift", "missing_time"]
+
+
+def measure(func: Callable, *args, **kwargs) -> tuple:
+    """
+    Runs func(*args, **kwargs) and returns its result, the wall time in
+    seconds and the peak memory allocated while it ran, in bytes.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def run_quietly(paths: list[str], **kwargs):
+    # run() prints its summary, which would bury the benchmark output
+    with redirect_stdout(io.StringIO()):
+        return run(paths, **kwargs)
+
+
+def benchmark_scenario(name: str, params: dict, n: int, directory: str) -> dict:
+    """
+    Writes 'n' datasets for a scenario and times opening them, every check,
+    the consensus vote, the show_single reductions and run() end to end:
+    with the default checks, with every check, and with a validation cache
+    both when it is filled and when it is reused on unchanged datasets.
+    """
+    params = dict(params)
+    file_format = params.pop("file_format", "nc")
+    defects = DEFECTS[:max(0, (n - 1) // 2)]
+    paths = write_datasets(os.path.join(directory, f"{name}_{n}"), n, file_format=file_format, defects=defects, **params)
+
+    timings = {}
+    peak_memory = {}
+    datasets, timings["open"], peak_memory["open"] = measure(convert_paths, paths)
+    checks = {
+        "monotonic": test_monotonic,
+        "time_steps": test_time_steps,
+        "calendar": test_calendar,
+        "units": test_units,
+        "variable_name": test_variable_name,
+        "spatial_coords": test_spatial_coords,
+        "values": test_values,
+        "value_magnitudes": test_value_magnitudes,
+        "bounds": test_bounds,
+        "bounds_consensus": test_bounds_consensus,
+        "chunk_layout": test_chunk_layout,
+    }
+    for check_name, test in checks.items():
+        _, timings[check_name], peak_memory[check_name] = measure(test, datasets)
+    _, timings["find_majority_ds"], peak_memory["find_majority_ds"] = measure(find_majority_ds, datasets, get_calendar_fingerprint)
+    _, timings["show_single_reductions"], peak_memory["show_single_reductions"] = measure(summarize_single, datasets[-1])
+
+    for ds in datasets:
+        ds.close()
+
+    cache = os.path.join(directory, f"{name}_{n}.sqlite")
+    runs = {
+        "run": {},
+        "run_all_checks": {"check_values": True, "check_chunks": True},
+        "run_cache_fill": {"cache": cache},
+        "run_cache_reuse": {"cache": cache},
+    }
+    for run_name, kwargs in runs.items():
+        _, timings[run_name], peak_memory[run_name] = measure(run_quietly, paths, **kwargs)
+    return {"scenario": name, "n": n, "params": params, "file_format": file_format,
+            "timings": timings, "peak_memory": peak_memory}
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float = 0.2, min_seconds: float = 0.05) -> list[str]:
+    """
+    Compares benchmark results against a baseline produced by this script.
+
+    Parameters
+    ----------
+    results, baseline : dict
+        Benchmark results as written to the output file
+    threshold : float [optional, default=0.2]
+        Relative slowdown above which a timing counts as a regression
+    min_seconds : float [optional, default=0.05]
+        Timings faster than this in the baseline are ignored, as they are
+        dominated by noise
+
+    Returns
+    -------
+    regressions : list[str]
+        One description per regressed timing. Empty if there are none.
+    """
+    baseline_runs = {(run["scenario"], run["n"]): run for run in baseline["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        baseline_run = baseline_runs.get((run["scenario"], run["n"]))
+        if baseline_run is None:
+            continue
+        for name, seconds in run["timings"].items():
+            before = baseline_run["timings"].get(name)
+            if before is None or before < min_seconds:
+                continue
+            if seconds > before * (1 + threshold):
+                regressions.append(f"{run['scenario']} (N={run['n']}) {name}: {before:.3f}s -> {seconds:.3f}s (+{(seconds / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the RAMIP checks on synthetic datasets.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 8, 32], help="numbers of datasets to benchmark (2 to 500)")
+    parser.add_argument("--scenarios", nargs="+", default=None, choices=list(SCENARIOS) + list(LONG_SCENARIOS),
+                        help="scenarios to benchmark (default: every scenario, and the long ones with --long)")
+    parser.add_argument("--long", action="store_true", help="also benchmark the centuries-long daily scenarios")
+    parser.add_argument("--output", default="bench_output.json", help="file to write the results to")
+    parser.add_argument("--baseline", default=None, help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown that counts as a regression")
+    parser.add_argument("--directory", default=None, help="where to write the synthetic datasets (default: a temporary directory)")
+    args = parser.parse_args(argv)
+    scenarios = {**SCENARIOS, **LONG_SCENARIOS}
+    if args.scenarios is None:
+        args.scenarios = list(SCENARIOS) + (list(LONG_SCENARIOS) if args.long else [])
+
+    results = {
+        "created": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.directory or tmp
+        for name in args.scenarios:
+            for n in args.sizes:
+                run = benchmark_scenario(name, scenarios[name], n, directory)
+                results["runs"].append(run)
+                timings = ", ".join(f"{check}={seconds:.3f}s" for check, seconds in run["timings"].items())
+                print(f"{name} (N={n}): {timings}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if len(regressions) > 0:
+            print(f"{len(regressions)} timings regressed by more than {args.threshold * 100:.0f}%:")
+            for regression in regressions:
+                print("    " + regression)
+            return 1
+        print("No regressions compared to the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
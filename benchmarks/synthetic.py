@@ -0,0 +1,162 @@
+"""
+synthetic.py
+
+Generate synthetic RAMIP-like datasets (netCDF files or zarr stores) with
+configurable grids, levels, calendars, time lengths, members and injected
+defects, for benchmarking and exercising the checks in tests/.
+"""
+import os
+import shutil
+import numpy as np
+import xarray as xr
+import dask.array as da
+
+# Defects that can be injected into a generated dataset. Each one should make
+# at least one of the checks in tests/ fail for that dataset.
+DEFECTS = ["duplicate_time", "reversed_time", "missing_time", "calendar", "units", "var_name", "lat_shift", "fill_value"]
+
+FREQUENCIES = {"day": "D", "mon": "MS"}
+TABLES = {"day": "day", "mon": "Amon"}
+
+
+def make_dataset(grid: float = 1.0, levels: int = 0, calendar: str = "noleap", frequency: str = "mon",
+                 years: int = 10, members: int = 0, defect: str = None, variable: str = "pr",
+                 start: str = "2015-01-01", seed: int = 0) -> xr.Dataset:
+    """
+    Builds a lazy, dask-backed dataset that looks like a RAMIP model output.
+
+    Parameters
+    ----------
+    grid : float [optional, default=1.0]
+        Horizontal resolution in degrees, e.g. 1.0 or 0.5
+    levels : int [optional, default=0]
+        Number of vertical levels. No level dimension is created if 0.
+    calendar : str [optional, default="noleap"]
+        CF calendar of the time axis, e.g. "noleap", "360_day" or "gregorian"
+    frequency : str [optional, default="mon"]
+        "mon" for monthly or "day" for daily data
+    years : int [optional, default=10]
+        Length of the time axis in years
+    members : int [optional, default=0]
+        Number of ensemble members. No member dimension is created if 0.
+    defect : str [optional, default=None]
+        One of DEFECTS to inject into the dataset, or None
+    variable : str [optional, default="pr"]
+        Name of the data variable
+    start : str [optional, default="2015-01-01"]
+        First timestep
+    seed : int [optional, default=0]
+        Seed for the random data values
+
+    Returns
+    -------
+    ds : xr.Dataset
+        The generated dataset. Data values are generated chunk by chunk when
+        the dataset is written, so large datasets never have to fit in memory.
+    """
+    if defect is not None and defect not in DEFECTS:
+        raise ValueError(f"Unknown defect: {defect}. Expected one of {DEFECTS}")
+
+    if defect == "calendar":
+        calendar = "360_day" if calendar != "360_day" else "noleap"
+    periods = years * (12 if frequency == "mon" else (360 if calendar == "360_day" else 365))
+    edges = np.array(xr.date_range(start, periods=periods + 1, freq=FREQUENCIES[frequency], calendar=calendar, use_cftime=True))
+    # each timestep is labelled by the start of its bounds
+    index = np.arange(periods)
+    if defect == "duplicate_time":
+        index[periods // 2] = periods // 2 - 1
+    elif defect == "reversed_time":
+        index[[periods // 2, periods // 2 + 1]] = [periods // 2 + 1, periods // 2]
+    elif defect == "missing_time":
+        index = np.delete(index, periods // 2)
+    times = edges[index]
+
+    lat = np.arange(-90 + grid / 2, 90, grid)
+    lon = np.arange(0, 360, grid)
+    if defect == "lat_shift":
+        lat = lat + 1e-6
+
+    dims = ["time", "lat", "lon"]
+    coords = {"time": times, "lat": lat, "lon": lon}
+    if levels > 0:
+        dims.insert(1, "lev")
+        coords["lev"] = np.linspace(1000, 10, levels)
+    if members > 0:
+        dims.insert(0, "member")
+        coords["member"] = np.arange(1, members + 1)
+
+    shape = tuple(len(coords[dim]) for dim in dims)
+    # one chunk per year of data, which is a typical layout for model output
+    chunks = tuple(12 if dim == "time" and frequency == "mon" else 365 if dim == "time" else -1 for dim in dims)
+    rng = da.random.default_rng(seed)
+    data = rng.random(shape, chunks=chunks, dtype=np.float32)
+    if defect == "fill_value":
+        data[(slice(None),) * dims.index("time") + (len(times) // 2,)] = 1e20
+
+    if defect == "var_name":
+        variable = variable + "_wrong"
+    units = "mm/day" if defect == "units" else "kg m-2 s-1"
+
+    ds = xr.Dataset({variable: (dims, data, {"units": units})}, coords=coords)
+    ds["time_bnds"] = (("time", "bnds"), np.stack([edges[index], edges[index + 1]], axis=1))
+    ds.time.attrs["bounds"] = "time_bnds"
+    ds.time.encoding["units"] = f"days since {start}"
+    ds.time.encoding["calendar"] = calendar
+    return ds
+
+
+def write_dataset(ds: xr.Dataset, path: str) -> str:
+    """
+    Writes a dataset to a netCDF file or zarr store depending on the extension
+    of 'path', replacing anything already there.
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+    if path.endswith(".zarr"):
+        ds.to_zarr(path, consolidated=True, zarr_format=2)
+    elif path.endswith(".nc"):
+        ds.to_netcdf(path)
+    else:
+        raise ValueError(f"File type not supported: {path}")
+    return path
+
+
+def write_datasets(directory: str, n: int, file_format: str = "nc", defects: list[str] = None,
+                   model: str = "SYNTH", experiment: str = "ssp370", **kwargs) -> list[str]:
+    """
+    Writes 'n' synthetic datasets with CMIP-style file names to 'directory'.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to write to. Created if it does not exist.
+    n : int
+        Number of datasets to write
+    file_format : str [optional, default="nc"]
+        "nc" or "zarr"
+    defects : list[str] [optional, default=None]
+        Defects to inject, one per dataset, into the first len(defects)
+        datasets. Should be fewer than n / 2 so that a majority remains.
+    model, experiment : str
+        Used for the file names
+    **kwargs
+        Passed to make_dataset()
+
+    Returns
+    -------
+    paths : list[str]
+        Paths to the written datasets
+    """
+    os.makedirs(directory, exist_ok=True)
+    defects = [] if defects is None else defects
+    paths = []
+    for i in range(n):
+        defect = defects[i] if i < len(defects) else None
+        table = TABLES[kwargs.get("frequency", "mon")]
+        name = f"{kwargs.get('variable', 'pr')}_{table}_{model}_{experiment}_r{i + 1}i1p1f1_gn.{file_format}"
+        ds = make_dataset(defect=defect, seed=i, **kwargs)
+        paths.append(write_dataset(ds, os.path.join(directory, name)))
+    return paths
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from tests.utils import DatasetHandle, convert_paths, get_fact, has_time_dim, is_url, report_path_failures
+from tests.incremental import get_append_state, get_appended_facts
+
+# Version of the facts stored in the cache. Increase it whenever a fact function changes what it
+# returns, so that facts stored by an older version are recomputed instead of served.
+FACTS_VERSION = 2
+
+
+def get_cache_key(path: str) -> str:
+    """
+    Returns a key that changes whenever the file or store at 'path' changes.
+    For netCDF files this is the size and modification time of the file. For
+    zarr stores it is the size and modification time of the consolidated
+    metadata plus a hash of its contents, since appending to a store does not
+    change the modification time of the store directory itself.
+
+    Parameters
+    ----------
+    path : str
+        Path or fsspec URL to a netCDF file or zarr store
+
+    Returns
+    -------
+    key : str
+        Key identifying the current version of the file or store
+    """
+    if is_url(path):
+        return get_url_cache_key(path)
+    if os.path.isdir(path):
+        for name in [".zmetadata", "zarr.json"]:
+            metadata_path = os.path.join(path, name)
+            if os.path.exists(metadata_path):
+                stat = os.stat(metadata_path)
+                with open(metadata_path, "rb") as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()
+                return f"{stat.st_size}:{stat.st_mtime_ns}:{digest}"
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def get_url_cache_key(url: str) -> str:
+    """
+    Like get_cache_key() for an fsspec URL. Object stores do not all report
+    modification times, so whatever version information the filesystem
+    returns (mtime, LastModified or ETag) is used.
+    """
+    import fsspec
+    fs, path = fsspec.core.url_to_fs(url)
+    path = path.rstrip("/")
+    if path.endswith(".zarr"):
+        for name in [".zmetadata", "zarr.json"]:
+            if fs.exists(f"{path}/{name}"):
+                contents = fs.cat_file(f"{path}/{name}")
+                return f"{len(contents)}:{hashlib.sha1(contents).hexdigest()}"
+    info = fs.info(path)
+    version = info.get("mtime", info.get("LastModified", info.get("ETag", info.get("created"))))
+    return f"{info.get('size')}:{version}"
+
+
+def normalize_path(path: str) -> str:
+    # Cache entries are keyed by absolute path, or by the URL itself
+    return path if is_url(path) else os.path.abspath(path)
+
+
+def freeze(value):
+    """
+    Converts the lists produced by decoding JSON back into tuples so cached
+    facts are hashable and compare equal to freshly computed ones.
+    """
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class ValidationCache:
+    r"""
+    Persistent on-disk cache of the facts extracted from each dataset by the
+    checks (calendar, units, variable names, coordinate digests, monotonic
+    status, ...), stored in a local SQLite file. Entries are keyed by the
+    absolute path and are only returned while get_cache_key() for that path
+    is unchanged and they were stored with the current FACTS_VERSION, so a
+    rerun only has to open files that changed.
+
+    Lookups and stores are written in one transaction, which flush() (or
+    close()) commits after evicting the least recently used entries, so a
+    run pays for one commit rather than one per dataset.
+
+    Parameters
+    ----------
+    path : str [optional, default=".ramip_cache.sqlite"]
+        Location of the SQLite cache file
+    max_entries : int [optional, default=100000]
+        Maximum number of datasets kept in the cache. The least recently used
+        entries are evicted when this is exceeded.
+    """
+    def __init__(self, path: str = ".ramip_cache.sqlite", max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS facts (path TEXT PRIMARY KEY, key TEXT, facts TEXT, last_used REAL, version INTEGER)")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(facts)")]
+        if "version" not in columns:
+            # Caches written before facts were versioned, whose entries are never served again
+            self.connection.execute("ALTER TABLE facts ADD COLUMN version INTEGER")
+        # Eviction orders the entries by when they were last used
+        self.connection.execute("CREATE INDEX IF NOT EXISTS facts_last_used ON facts (last_used)")
+        self.connection.commit()
+
+    def get(self, path: str) -> dict:
+        """
+        Returns the cached facts for 'path', or None if there are none, the
+        file has changed since they were stored or they were stored by another
+        FACTS_VERSION.
+        """
+        path = normalize_path(path)
+        row = self.connection.execute("SELECT key, facts FROM facts WHERE path = ? AND version = ?", (path, FACTS_VERSION)).fetchone()
+        if row is None:
+            return None
+        try:
+            key = get_cache_key(path)
+        except OSError:
+            self.invalidate(path)
+            return None
+        if row[0] != key:
+            # The outdated facts are kept until they are replaced, see get_previous()
+            return None
+        self.connection.execute("UPDATE facts SET last_used = ? WHERE path = ?", (time.time(), path))
+        return {name: freeze(value) for name, value in json.loads(row[1]).items()}
+
+    def get_previous(self, path: str) -> dict:
+        """
+        Returns the facts last stored for 'path' even if the file has changed
+        since, or None if there are none or they were stored by another
+        FACTS_VERSION.
+        """
+        row = self.connection.execute("SELECT facts FROM facts WHERE path = ? AND version = ?", (normalize_path(path), FACTS_VERSION)).fetchone()
+        if row is None:
+            return None
+        return {name: freeze(value) for name, value in json.loads(row[0]).items()}
+
+    def put(self, path: str, facts: dict) -> None:
+        """
+        Stores the facts for 'path' under its current cache key. Entries whose
+        key and facts are unchanged are only marked as used. Like get(), the
+        change is committed by flush().
+        """
+        path = normalize_path(path)
+        key, text = get_cache_key(path), json.dumps(facts, sort_keys=True)
+        row = self.connection.execute("SELECT key, facts, version FROM facts WHERE path = ?", (path,)).fetchone()
+        if row is not None and tuple(row) == (key, text, FACTS_VERSION):
+            self.connection.execute("UPDATE facts SET last_used = ? WHERE path = ?", (time.time(), path))
+            return
+        self.connection.execute("INSERT OR REPLACE INTO facts (path, key, facts, last_used, version) VALUES (?, ?, ?, ?, ?)",
+                                (path, key, text, time.time(), FACTS_VERSION))
+
+    def flush(self) -> None:
+        """
+        Evicts the least recently used entries if the cache is full and
+        commits everything looked up and stored since the last flush.
+        """
+        if len(self) > self.max_entries:
+            self.connection.execute("DELETE FROM facts WHERE path NOT IN (SELECT path FROM facts ORDER BY last_used DESC LIMIT ?)",
+                                    (self.max_entries,))
+        self.connection.commit()
+
+    def invalidate(self, paths: list[str] | str = None) -> None:
+        """
+        Removes the cached facts for the given paths, or every entry if
+        'paths' is None.
+        """
+        if paths is None:
+            self.connection.execute("DELETE FROM facts")
+        else:
+            if isinstance(paths, str):
+                paths = [paths]
+            self.connection.executemany("DELETE FROM facts WHERE path = ?", [(normalize_path(p),) for p in paths])
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+
+def get_cached_facts(cache: ValidationCache, path: str, incremental: bool = False) -> dict:
+    """
+    Returns the cached facts for 'path', or None if it has to be opened. If
+    'incremental' is True, a zarr store that was appended to since it was
+    cached only has its new timesteps validated, see get_appended_facts().
+    """
+    facts = cache.get(path)
+    if facts is None and incremental and path.rstrip("/").endswith(".zarr"):
+        facts = get_appended_facts(path, cache.get_previous(path))
+    return facts
+
+
+def convert_paths_cached(paths: list[str], cache: ValidationCache, workers: int = 1, header_only: bool = False, failures: dict = None, incremental: bool = False) -> list[DatasetHandle]:
+    """
+    Like convert_paths(), but returns DatasetHandles carrying any facts found
+    in 'cache'. Only the paths without valid cache entries are opened.
+
+    Parameters
+    ----------
+    paths : list[str]
+        List of file paths to netCDF files or zarr stores
+    cache : ValidationCache
+        Cache to look up facts in
+    workers, header_only, failures
+        Passed to convert_paths() for the paths that need to be opened
+    incremental : bool [optional, default=False]
+        Whether to validate only the new timesteps of appended zarr stores,
+        see get_cached_facts()
+
+    Returns
+    -------
+    datasets : list[DatasetHandle]
+        List of handles, in the same order as 'paths'. Paths that could not be
+        opened are left out.
+    """
+    cached_facts = {path: get_cached_facts(cache, path, incremental) for path in paths}
+    to_open = [path for path in paths if cached_facts[path] is None]
+
+    open_failures = {}
+    datasets = convert_paths(to_open, workers=workers, header_only=header_only, failures=open_failures)
+    opened = dict(zip([path for path in to_open if path not in open_failures], datasets))
+
+    report_path_failures(open_failures, paths, failures)
+
+    handles = []
+    for path in paths:
+        if path in open_failures:
+            continue
+        handles.append(DatasetHandle(path, facts=cached_facts[path], ds=opened.get(path), header_only=header_only))
+    return handles
+
+
+def update_cache(cache: ValidationCache, datasets: list[DatasetHandle], incremental: bool = False) -> None:
+    """
+    Stores the facts collected on each handle during a run back into 'cache'
+    and commits them in one transaction (see ValidationCache.flush()). If
+    'incremental' is True, the state needed to validate only the timesteps
+    appended later is recorded for every zarr store with a time dimension.
+    """
+    for ds in datasets:
+        if incremental and ds.path.rstrip("/").endswith(".zarr") and get_fact(ds, has_time_dim):
+            get_fact(ds, get_append_state)
+        if len(ds.facts) > 0:
+            cache.put(ds.path, ds.facts)
+    cache.flush()
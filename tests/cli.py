@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+cli.py
+
+Command-line entry point that runs the RAMIP checks over directory trees,
+glob patterns or single datasets, e.g. from a batch job:
+
+    python -m tests.cli /data/ramip "s3://bucket/ramip/*.zarr" --workers 16 --output report.json
+
+One JSON object per line is written to stdout as results become available:
+a "dataset" event with the individual checks of each dataset as soon as it
+has been processed, a "failure" event for each path that could not be opened,
+a "check" event for every check over all datasets, and a final "summary"
+event. Datasets that make a check raise fail that check, with the error in
+its "check" event, and an error that stops the run is reported in the
+"summary" event, so the final events and the report are always written. The
+human-readable output of run() goes to stderr. The exit code is 0 if every
+check passed, and 1 if any check failed, any path could not be opened or the
+run stopped with an error.
+"""
+import os
+import sys
+import json
+import argparse
+from contextlib import redirect_stdout
+from tests.run_tests import run
+from tests.registry import get_checks
+from tests.results import CheckResults, RunReport
+from tests.utils import expand_paths, is_url, get_fact, get_source, has_time_dim
+
+# Files and directories that make up a dataset when discovered in a directory tree
+DATASET_EXTENSIONS = (".nc", ".zarr")
+
+
+def discover_paths(paths: list[str]) -> list[str]:
+    """
+    Expands directories (recursively, not descending into zarr stores) into
+    the netCDF files and zarr stores they contain, and glob patterns into
+    their matches (see expand_paths()). Other paths and URLs are kept as
+    they are.
+    """
+    discovered = []
+    for path in expand_paths(paths):
+        if is_url(path) or not os.path.isdir(path) or path.rstrip("/").endswith(".zarr"):
+            discovered.append(path)
+            continue
+        for root, directories, files in os.walk(path):
+            directories.sort()
+            stores = [name for name in directories if name.endswith(".zarr")]
+            directories[:] = [name for name in directories if not name.endswith(".zarr")]
+            discovered += sorted(os.path.join(root, name) for name in files + stores if name.endswith(DATASET_EXTENSIONS))
+    return discovered
+
+
+def get_dataset_results(ds, checks: list, parameters: dict) -> dict:
+    # Runs the individual checks on one dataset from its facts, for the "dataset" events
+    results = CheckResults()
+    has_time = get_fact(ds, has_time_dim)
+    for check in checks:
+        if check.level == "experiment" and (has_time or not check.needs_time):
+            try:
+                check.test([ds], False, results, False, **{name: parameters[name] for name in check.parameters})
+            except Exception:
+                # The error is reported with the "check" event of the same check after the run
+                results[check.name] = False
+    return dict(results)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m tests.cli", description="Run the RAMIP checks over many datasets and stream the results as JSON lines.")
+    parser.add_argument("paths", nargs="+", help="Directories, netCDF files, zarr stores, URLs or glob patterns")
+    parser.add_argument("--checks", nargs="+", metavar="NAME", help="Names of the checks to run (default: every check that is enabled by default)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes that extract the facts of the datasets")
+    parser.add_argument("--threads", type=int, default=1, help="Number of threads that open the datasets when there are no worker processes")
+    parser.add_argument("--max-open", type=int, default=None, help="Maximum number of datasets kept open at once")
+    parser.add_argument("--header-only", action="store_true", help="Open datasets without reading more than their metadata and coordinates")
+    parser.add_argument("--cache", default=None, help="Path of a validation cache, so unchanged datasets are not read again")
+    parser.add_argument("--fail-fast", action="store_true", help="Stop at the first failing check")
+    sample = parser.add_mutually_exclusive_group()
+    sample.add_argument("--sample-count", type=int, default=None, metavar="N", help="Only check a random sample of N datasets")
+    sample.add_argument("--sample-fraction", type=float, default=None, metavar="F", help="Only check a random sample of this fraction (0 < F <= 1) of the datasets")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random sample of the datasets and of their time chunks")
+    parser.add_argument("--output", default=None, help="Path to write the full report to as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Print the detailed error output of the checks to stderr")
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Runs the command line interface described at the top of this module with
+    the given arguments (by default, those of the process) and returns the
+    exit code.
+    """
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if args.sample_count is not None and args.sample_count < 1:
+        parser.error("--sample-count must be at least 1")
+    if args.sample_fraction is not None and not 0 < args.sample_fraction <= 1:
+        parser.error("--sample-fraction must be above 0 and at most 1")
+    try:
+        checks = get_checks(args.checks) if args.checks is not None else [check for check in get_checks() if check.default]
+    except ValueError as err:
+        parser.error(str(err))
+    out = sys.stdout
+
+    def emit(event: dict):
+        out.write(json.dumps(event) + "\n")
+        out.flush()
+
+    paths = discover_paths(args.paths)
+    if len(paths) == 0:
+        print(f"No datasets found in {args.paths}", file=sys.stderr)
+        return 1
+    # A count is an int and a fraction a float, see sample_paths()
+    sample = args.sample_count if args.sample_count is not None else args.sample_fraction
+    parameters = {"valid_ranges": None, "sample": sample is not None, "seed": args.seed}
+
+    report = RunReport()
+    with redirect_stdout(sys.stderr):
+        try:
+            run(paths, verbose=args.verbose, workers=args.workers, threads=args.threads, header_only=args.header_only, cache=args.cache,
+                max_open=args.max_open, checks=[check.name for check in checks], fail_fast=args.fail_fast, sample=sample,
+                seed=args.seed, report=report,
+                on_dataset=lambda ds: emit({"event": "dataset", "path": get_source(ds), "checks": get_dataset_results(ds, checks, parameters)}))
+        except Exception as err:
+            # The results collected up to the error are still reported
+            report.error = f"{type(err).__name__}: {err}"
+            print(f"The run stopped with an error: {report.error}")
+
+    for path, err in report.failures.items():
+        emit({"event": "failure", "path": path, "error": str(err)})
+    for check in report.checks:
+        emit({"event": "check", **check.to_dict()})
+    emit({"event": "summary", "passed": report.passed, "datasets": len(report.paths) - len(report.failures),
+          "failures": len(report.failures), "checks_passed": sum(check.passed for check in report.checks),
+          "checks": len(report.checks), "skipped": report.skipped, "error": report.error})
+    if args.output is not None:
+        report.to_json(args.output)
+    return 0 if report.passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
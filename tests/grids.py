@@ -0,0 +1,184 @@
+import collections
+import numpy as np
+import xarray as xr
+from tests.utils import get_array_digest, open_path, possible_spatial_dims
+
+# Names of the latitude and longitude coordinates. Curvilinear grids have 2D ones over their own dimensions.
+LAT_NAMES = ["lat", "latitude", "nav_lat"]
+LON_NAMES = ["lon", "longitude", "nav_lon"]
+LEVEL_DIMS = ["lev", "level"]
+# Sources of area weights, from least to most accurate
+WEIGHT_SOURCES = ["uniform", "cos_lat", "cell_area"]
+
+
+def get_cell_measure_names(ds: xr.Dataset) -> list[str]:
+    """
+    Returns the names of the cell area variables of a dataset, i.e. the ones
+    named in the "cell_measures" attribute of a data variable (e.g. "area:
+    areacella") and any "areacella" variable.
+    """
+    names = []
+    for var in ds.data_vars.values():
+        words = str(var.attrs.get("cell_measures", "")).split()
+        names += [name for measure, name in zip(words[:-1], words[1:]) if measure == "area:"]
+    return [name for name in dict.fromkeys(names + ["areacella"]) if name in ds.variables]
+
+
+def get_lat_lon(ds: xr.Dataset) -> tuple:
+    # Names of the latitude and longitude coordinates, or None for each one that is missing
+    lat = next((name for name in LAT_NAMES if name in ds.variables), None)
+    lon = next((name for name in LON_NAMES if name in ds.variables), None)
+    return lat, lon
+
+
+def get_horizontal_dims(ds: xr.Dataset) -> list[str]:
+    """
+    Returns the horizontal dimensions of a dataset: those of its 2D latitude
+    coordinate on curvilinear grids (e.g. ["j", "i"]), and otherwise the
+    dimensions in possible_spatial_dims that are not level dimensions.
+    """
+    lat, _ = get_lat_lon(ds)
+    if lat is not None and ds[lat].ndim > 1:
+        return list(ds[lat].dims)
+    return [dim for dim in possible_spatial_dims if dim in ds.dims and dim not in LEVEL_DIMS]
+
+
+def get_grid_key(ds: xr.Dataset) -> str:
+    """
+    Returns a key that is the same for every dataset on the same horizontal
+    grid (e.g. all experiments of a model), from the digests of its
+    latitude and longitude values and the sizes of its horizontal
+    dimensions.
+    """
+    dims = get_horizontal_dims(ds)
+    parts = [f"{dim}={ds.sizes[dim]}" for dim in dims]
+    parts += [f"{name}:{get_array_digest(ds[name].values)}" for name in get_lat_lon(ds) if name is not None]
+    return "|".join(parts)
+
+
+class GridRegistry:
+    r"""
+    Area weights of the horizontal grids seen so far, keyed by get_grid_key(),
+    so that the weights of a grid are built once and reused by every dataset
+    on it. Weights come from the most accurate source available:
+        cell_area: cell areas, either from a variable in a dataset on the grid
+            (see get_cell_measure_names()) or added with add_cell_areas()
+        cos_lat: the cosine of the 1D or 2D latitudes
+        uniform: no weights, e.g. for grids without latitudes
+    A grid whose weights were built from a less accurate source is rebuilt as
+    soon as a dataset on it provides cell areas.
+
+    Parameters
+    ----------
+    max_grids : int [optional, default=64]
+        Maximum number of grids whose built weights are kept. The least
+        recently used grid is dropped when this is exceeded, and its weights
+        are built again if a dataset on it comes up later. Cell areas added
+        with add_cell_areas() are always kept.
+    """
+    def __init__(self, max_grids: int = 64):
+        self.max_grids = max_grids
+        self.added = {}
+        self.grids = collections.OrderedDict()
+
+    def add_cell_areas(self, areas: xr.Dataset | str) -> str:
+        """
+        Adds the cell areas of a grid, e.g. a CMIP "areacella" file, to use for
+        every dataset on that grid.
+
+        Parameters
+        ----------
+        areas : xr.Dataset or str
+            Dataset (or path to one) with a cell area variable and the
+            latitude and longitude coordinates of the grid
+
+        Returns
+        -------
+        key : str
+            Key of the grid, see get_grid_key()
+        """
+        if isinstance(areas, str):
+            areas = open_path(areas)
+        names = get_cell_measure_names(areas) or [name for name in areas.data_vars if 'bnds' not in areas[name].dims]
+        if len(names) != 1:
+            raise ValueError(f"Expected exactly one cell area variable, found {names}")
+        key = get_grid_key(areas)
+        self.added[key] = self.to_weights(areas[names[0]])
+        self.grids.pop(key, None)
+        return key
+
+    def get_source(self, ds: xr.Dataset) -> str:
+        """
+        Returns the source (see WEIGHT_SOURCES) of the area weights that
+        get_weights() returns for the horizontal grid of a dataset.
+        """
+        key = get_grid_key(ds)
+        if key in self.added:
+            return "cell_area"
+        lat, _ = get_lat_lon(ds)
+        source = "cell_area" if len(get_cell_measure_names(ds)) > 0 else "cos_lat" if lat is not None else "uniform"
+        if key in self.grids and WEIGHT_SOURCES.index(self.grids[key][0]) > WEIGHT_SOURCES.index(source):
+            return self.grids[key][0]
+        return source
+
+    def get_weights(self, ds: xr.Dataset) -> xr.DataArray:
+        """
+        Returns the area weights for the horizontal grid of a dataset, or None
+        if the grid has neither cell areas nor latitudes and every cell
+        counts the same.
+        """
+        key = get_grid_key(ds)
+        if key in self.added:
+            return self.added[key]
+        source = self.get_source(ds)
+        if key in self.grids and self.grids[key][0] == source:
+            self.grids.move_to_end(key)
+            return self.grids[key][1]
+
+        if source == "cell_area":
+            weights = self.to_weights(ds[get_cell_measure_names(ds)[0]])
+        elif source == "cos_lat":
+            lat, _ = get_lat_lon(ds)
+            weights = self.to_weights(np.cos(np.deg2rad(ds[lat])))
+        else:
+            weights = None
+        self.grids[key] = (source, weights)
+        self.grids.move_to_end(key)
+        while len(self.grids) > self.max_grids:
+            self.grids.popitem(last=False)
+        return weights
+
+    def clear(self) -> None:
+        """
+        Drops the weights of every grid, including added cell areas.
+        """
+        self.added.clear()
+        self.grids.clear()
+
+    def __len__(self) -> int:
+        return len(self.added) + len(self.grids)
+
+    @staticmethod
+    def to_weights(weights: xr.DataArray) -> xr.DataArray:
+        # Loaded once, without coordinates that could conflict with the data, and without missing
+        # values (e.g. cell areas that are only defined over land), which weighted() does not allow
+        weights = weights.reset_coords(drop=True).fillna(0).load()
+        weights.name = "weights"
+        return weights
+
+
+def get_area_weights(ds: xr.Dataset, grids: GridRegistry = None) -> xr.DataArray:
+    """
+    Returns the area weights of a dataset from 'grids', see
+    GridRegistry.get_weights(). If 'grids' is None, the weights are built
+    for this dataset alone, so nothing is kept once it is done.
+    """
+    return (GridRegistry() if grids is None else grids).get_weights(ds)
+
+
+def get_weight_source(ds: xr.Dataset, grids: GridRegistry = None) -> str:
+    """
+    Returns the source of the area weights get_area_weights() returns for a
+    dataset, see GridRegistry.get_source().
+    """
+    return (GridRegistry() if grids is None else grids).get_source(ds)
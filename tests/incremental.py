@@ -0,0 +1,143 @@
+import json
+import hashlib
+import numpy as np
+import xarray as xr
+from tests.utils import open_path, has_time_dim, get_time_offsets
+from tests.metadata import read_zarr_metadata
+from tests.test_monotonic import find_time_problems, get_time_facts
+from tests.test_calendar import get_calendar_fingerprint
+from tests.test_units import get_units_fingerprint
+from tests.test_variable_name import get_var_names_fingerprint
+from tests.test_spatial_coords import get_spatial_coords_fingerprint
+
+# Facts that only depend on the metadata and the non-time coordinates, so they stay valid when
+# timesteps are appended to a store. Facts about the data values are recomputed in full.
+KEPT_FACTS = [has_time_dim, get_calendar_fingerprint, get_units_fingerprint, get_var_names_fingerprint, get_spatial_coords_fingerprint]
+
+# Stores with more distinct time steps than this (i.e. irregular time axes) are always checked in full
+MAX_DISTINCT_STEPS = 100
+
+
+def get_metadata_digest(path: str) -> str:
+    """
+    Returns a digest of the consolidated metadata of a zarr store that does not
+    change when timesteps are appended to it, i.e. with the length of every
+    time dimension left out.
+    """
+    metadata = read_zarr_metadata(path)
+    variables = {}
+    for name, var in metadata["variables"].items():
+        shape = [None if dim == "time" else size for dim, size in zip(var["dims"], var["shape"])]
+        variables[name] = {"dims": list(var["dims"]), "shape": shape, "attrs": var["attrs"]}
+    text = json.dumps({"attrs": metadata["attrs"], "variables": variables}, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def get_append_state(ds: xr.Dataset) -> dict:
+    """
+    Records what is needed to validate only the timesteps appended to a zarr
+    store later on: the metadata digest, the number of timesteps, the first
+    and last time offsets and how often each time step length occurs.
+
+    Parameters
+    ----------
+    ds : xr.Dataset or DatasetHandle
+        Opened zarr store with a time dimension
+
+    Returns
+    -------
+    state : dict
+        State passed to get_appended_facts() on the next run
+    """
+    offsets = get_time_offsets(ds)
+    steps, counts = np.unique(np.diff(offsets), return_counts=True)
+    step_counts = [[float(step), int(count)] for step, count in zip(steps, counts)]
+    return {
+        "metadata_digest": get_metadata_digest(ds.encoding["source"]),
+        "length": len(offsets),
+        "first": float(offsets[0]) if len(offsets) > 0 else None,
+        "last": float(offsets[-1]) if len(offsets) > 0 else None,
+        "step_counts": step_counts if len(step_counts) <= MAX_DISTINCT_STEPS else None,
+    }
+
+
+def get_typical_step(step_counts: list) -> float:
+    # Same as the median of the positive steps computed by find_time_problems()
+    positive = [(step, count) for step, count in step_counts if step > 0]
+    if len(positive) == 0:
+        return None
+    return float(np.median(np.repeat([step for step, _ in positive], [count for _, count in positive])))
+
+
+def get_appended_facts(path: str, previous: dict) -> dict:
+    """
+    Validates only the timesteps appended to a zarr store since it was last
+    validated. The time values are read from the last validated timestep
+    onwards, so the seam between the old and the new timesteps is checked as
+    well. The previous facts are reused for everything that cannot have been
+    changed by the append.
+
+    Parameters
+    ----------
+    path : str
+        Path to a zarr store
+    previous : dict
+        Facts stored for the previous version of the store, including the
+        result of get_append_state(). May be None.
+
+    Returns
+    -------
+    facts : dict
+        Facts for the current version of the store, or None if it has to be
+        checked in full: there is no previous state, the metadata changed,
+        the previously validated timesteps changed, or there are time
+        problems whose exact position in the whole store is needed.
+    """
+    if previous is None or get_append_state.__name__ not in previous or get_time_facts.__name__ not in previous:
+        return None
+    state = previous[get_append_state.__name__]
+    violations, duplicates, irregular = previous[get_time_facts.__name__]
+    if state["step_counts"] is None or state["length"] < 1 or len(violations) > 0 or len(duplicates) > 0:
+        return None
+
+    try:
+        if get_metadata_digest(path) != state["metadata_digest"]:
+            return None
+        ds = open_path(path, header_only=True)
+    except (OSError, ValueError, KeyError):
+        return None
+    try:
+        if ds.sizes.get("time", 0) < state["length"]:
+            return None
+        first = get_time_offsets(ds.isel(time=[0]))
+        offsets = get_time_offsets(ds.isel(time=slice(state["length"] - 1, None)))
+    finally:
+        ds.close()
+    if first[0] != state["first"] or offsets[0] != state["last"]:
+        return None
+
+    new_steps, new_counts = np.unique(np.diff(offsets), return_counts=True)
+    step_counts = {step: count for step, count in state["step_counts"]}
+    for step, count in zip(new_steps, new_counts):
+        step_counts[float(step)] = step_counts.get(float(step), 0) + int(count)
+    step_counts = sorted([step, count] for step, count in step_counts.items())
+    if len(step_counts) > MAX_DISTINCT_STEPS:
+        return None
+
+    # A different typical step could change which of the old steps are irregular
+    typical_step = get_typical_step(step_counts)
+    if typical_step != get_typical_step(state["step_counts"]):
+        return None
+    new_violations, new_duplicates, new_irregular = find_time_problems(offsets, typical_step)
+    if len(new_violations) > 0 or len(new_duplicates) > 0:
+        return None
+
+    facts = {fact.__name__: previous[fact.__name__] for fact in KEPT_FACTS if fact.__name__ in previous}
+    facts[get_time_facts.__name__] = ((), (), tuple(irregular) + tuple(state["length"] - 1 + i for i in new_irregular))
+    facts[get_append_state.__name__] = {
+        **state,
+        "length": state["length"] - 1 + len(offsets),
+        "last": float(offsets[-1]),
+        "step_counts": step_counts,
+    }
+    return facts
@@ -0,0 +1,181 @@
+import xarray as xr
+from colorama import Fore, Style
+from typing import Callable
+from tests.utils import DatasetHandle, HandlePool, convert_paths, convert_paths_pooled, expand_paths, get_fact, get_filename, has_time_dim, parse_cmip_filename, report_path_failures
+# Importing the check modules registers their checks
+import tests.test_monotonic
+import tests.test_calendar
+import tests.test_units
+import tests.test_variable_name
+import tests.test_spatial_coords
+import tests.test_values
+import tests.test_chunks
+import tests.test_bounds
+from tests.registry import get_checks, get_facts
+from tests.cache import ValidationCache, convert_paths_cached, get_cached_facts, update_cache
+from tests.parallel import convert_paths_parallel
+
+
+# Each check runs within groups of datasets at its level (see Check):
+#     "experiment": every dataset on its own, reported per model and experiment
+#     "model": consensus across all experiments and members of a model
+#     "all": consensus across all models
+DEFAULT_MATRIX_CHECKS = [check.name for check in get_checks() if check.default]
+
+
+def get_dataset_info(ds: xr.Dataset) -> dict:
+    """
+    Returns the model, experiment and member of a dataset, parsed from its
+    CMIP-style file name or, if the name does not follow the pattern, from
+    the CMIP global attributes (source_id, experiment_id, variant_label).
+    Values that cannot be found are "unknown".
+    """
+    parts = parse_cmip_filename(get_filename(ds))
+    if parts is not None:
+        return {"model": parts["model"], "experiment": parts["experiment"], "member": parts["member"]}
+    return {"model": str(ds.attrs.get("source_id", "unknown")),
+            "experiment": str(ds.attrs.get("experiment_id", "unknown")),
+            "member": str(ds.attrs.get("variant_label", "unknown"))}
+
+
+def get_groups(datasets: list, level: str) -> list[list]:
+    """
+    Splits datasets into the groups a check runs in at the given level
+    ("experiment", "model" or "all"), keeping the order of 'datasets'.
+    """
+    if level == "all":
+        return [list(datasets)] if len(datasets) > 0 else []
+    keys = ["model"] if level == "model" else ["model", "experiment"]
+    groups = {}
+    for ds in datasets:
+        info = get_fact(ds, get_dataset_info)
+        groups.setdefault(tuple(info[key] for key in keys), []).append(ds)
+    return list(groups.values())
+
+
+def open_handles(paths: list[str], workers: int = 1, header_only: bool = False, cache: ValidationCache = None,
+                 failures: dict = None, facts: list[Callable] = None, pool: HandlePool = None) -> list[DatasetHandle]:
+    # Every dataset is opened once and wrapped in a handle, so each fact is computed once and
+    # reused by every group the dataset is in. With a pool, at most pool.max_open datasets are
+    # open at once, as in run().
+    facts = [get_dataset_info] + (facts or [])
+    if workers > 1:
+        return convert_paths_parallel(paths, facts, workers, header_only=header_only, failures=failures, cache=cache, pool=pool)
+    if pool is not None:
+        known_facts = {path: get_cached_facts(cache, path) for path in paths} if cache is not None else None
+        return convert_paths_pooled(paths, pool, facts, header_only=header_only, failures=failures, known_facts=known_facts)
+    if cache is not None:
+        return convert_paths_cached(paths, cache, header_only=header_only, failures=failures)
+    open_failures = {}
+    datasets = convert_paths(paths, header_only=header_only, failures=open_failures)
+    if failures is None and len(open_failures) > 0:
+        # Nothing is returned, so the datasets that did open are closed again
+        for ds in datasets:
+            ds.close()
+    report_path_failures(open_failures, paths, failures)
+    opened = [path for path in paths if path not in open_failures]
+    return [DatasetHandle(path, ds=ds, header_only=header_only) for path, ds in zip(opened, datasets)]
+
+
+def validate_matrix(paths: list[str] | str, checks: list[str] = None, verbose: bool = False, workers: int = 1,
+                    header_only: bool = False, cache: str | ValidationCache = None, failures: dict = None,
+                    max_open: int = None) -> dict:
+    """
+    Runs every check at its grouping level (see Check) over the
+    datasets of many models and experiments, and reports the result for each
+    model and experiment. A model/experiment fails a check if any of its
+    datasets fails it, e.g. because its calendar differs from the rest of
+    the model.
+
+    Parameters
+    ----------
+    paths : list[str] or str
+        Paths, URLs or glob patterns of netCDF files and zarr stores, see
+        expand_paths()
+    checks : list[str] [optional, default=DEFAULT_MATRIX_CHECKS]
+        Names of the registered checks to run, see get_checks()
+    verbose : bool [optional, default=False]
+        Whether to print the detailed error output of the checks
+    workers : int [optional, default=1]
+        If greater than 1, the facts are extracted across a process pool
+    header_only : bool [optional, default=False]
+        Passed to open_path()
+    cache : str or ValidationCache [optional, default=None]
+        If given, cached facts are reused and the new facts are stored
+    failures : dict[str, Exception] [optional, default=None]
+        If given, paths that could not be opened are skipped and recorded
+        here. Otherwise, a ValueError listing every failed path is raised.
+    max_open : int [optional, default=None]
+        If given, at most this many datasets are open at once and the others
+        are reopened on demand, see HandlePool
+
+    Returns
+    -------
+    matrix : dict
+        Maps each (model, experiment) to a dictionary from check name to True
+        (passed), False (failed) or None (not applicable, e.g. no dataset of
+        the experiment has a time dimension)
+    """
+    checks = get_checks(DEFAULT_MATRIX_CHECKS if checks is None else checks)
+    # A cache given by its path is only open for this call
+    own_cache = isinstance(cache, str)
+    if own_cache:
+        cache = ValidationCache(cache)
+
+    pool = HandlePool(max_open) if max_open is not None else None
+    datasets = []
+    try:
+        datasets = open_handles(expand_paths(paths), workers, header_only, cache, failures, get_facts(checks), pool)
+        datasets_with_time = [ds for ds in datasets if get_fact(ds, has_time_dim)]
+
+        matrix = {}
+        for ds in datasets:
+            info = get_fact(ds, get_dataset_info)
+            matrix.setdefault((info["model"], info["experiment"]), {check.name: None for check in checks})
+
+        for check in checks:
+            for group in get_groups(datasets_with_time if check.needs_time else datasets, check.level):
+                failed = check.find(group, verbose)
+                for ds in group:
+                    info = get_fact(ds, get_dataset_info)
+                    results = matrix[(info["model"], info["experiment"])]
+                    passed = not any(ds is other for other in failed)
+                    results[check.name] = passed if results[check.name] is None else (results[check.name] and passed)
+
+        if cache is not None:
+            update_cache(cache, datasets)
+    finally:
+        # The datasets are not needed after the checks, so their files are not left open
+        for ds in datasets:
+            ds.close()
+        if own_cache:
+            cache.close()
+        elif cache is not None:
+            cache.flush()
+    return matrix
+
+
+def format_matrix(matrix: dict) -> str:
+    """
+    Formats the output of validate_matrix() as a table with one row per
+    model and experiment and one column per check.
+    """
+    if len(matrix) == 0:
+        return "No datasets passed in."
+    checks = list(next(iter(matrix.values())))
+    model_width = max(len("model"), *(len(model) for model, _ in matrix))
+    experiment_width = max(len("experiment"), *(len(experiment) for _, experiment in matrix))
+    widths = [max(len(check), 4) for check in checks]
+
+    lines = ["  ".join(["model".ljust(model_width), "experiment".ljust(experiment_width)] + [check.ljust(width) for check, width in zip(checks, widths)])]
+    for (model, experiment), results in sorted(matrix.items()):
+        cells = []
+        for check, width in zip(checks, widths):
+            if results[check] is None:
+                cells.append("-".ljust(width))
+            elif results[check]:
+                cells.append(Fore.GREEN + "PASS".ljust(width) + Style.RESET_ALL)
+            else:
+                cells.append(Fore.RED + "FAIL".ljust(width) + Style.RESET_ALL)
+        lines.append("  ".join([model.ljust(model_width), experiment.ljust(experiment_width)] + cells))
+    return "\n".join(lines)
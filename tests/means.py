@@ -0,0 +1,345 @@
+import os
+import json
+import shutil
+import itertools
+import numpy as np
+import xarray as xr
+from tests.utils import open_path, get_filename, get_time_attr, get_time_offsets, parse_cmip_filename, report_path_failures
+from tests.summary import get_data_vars
+from tests.grids import GridRegistry, get_area_weights, get_horizontal_dims, get_lat_lon
+from tests.cache import get_cache_key, normalize_path
+from tests.parallel import get_process_pool
+
+# Regions the means are computed over as (south, north, west, east) in degrees: the RAMIP emission
+# regions (Africa and the Middle East, East Asia, North America and Europe, South Asia) and the globe
+REGIONS = {
+    "global": None,
+    "AFR": (-35, 35, -20, 60),
+    "EAS": (20, 53, 95, 133),
+    "NAE": (25, 70, -150, 45),
+    "SAS": (5, 35, 65, 95),
+}
+# Variables of the store with one value per entry, i.e. per time series
+ENTRY_VARS = ["path", "model", "experiment", "member", "variable", "subset", "units", "calendar", "source_key", "row_size"]
+
+
+def get_region_mask(ds: xr.Dataset, box: tuple) -> xr.DataArray:
+    """
+    Returns whether each cell of the horizontal grid of a dataset lies in a
+    (south, north, west, east) box. Longitudes are compared modulo 360, so
+    boxes may cross the prime meridian. Returns None for grids without
+    latitudes and longitudes.
+    """
+    lat, lon = get_lat_lon(ds)
+    if lat is None or lon is None:
+        return None
+    south, north, west, east = box
+    lats, lons = ds[lat].reset_coords(drop=True), ds[lon].reset_coords(drop=True)
+    in_lon = (lons - west) % 360 <= (east - west) % 360
+    return (lats >= south) & (lats <= north) & in_lon
+
+
+def compute_region_means(ds: xr.Dataset, regions: dict = REGIONS, grids: GridRegistry = None) -> xr.DataArray:
+    """
+    Computes the area-weighted mean of the single data variable of a dataset
+    over each region, per timestep. The means of all regions are built as one
+    lazy graph and evaluated with a single compute, reading the variable one
+    chunk of timesteps at a time, like summarize_single().
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        Dataset with exactly one data variable that is not a bounds or cell
+        area variable, and a time dimension
+    regions : dict [optional, default=REGIONS]
+        Maps each region name to its (south, north, west, east) box, or to
+        None for the whole grid
+    grids : GridRegistry [optional, default=None]
+        Registry to take the area weights from, see get_area_weights()
+
+    Returns
+    -------
+    means : xr.DataArray
+        Means with the dimensions "region", the dimensions of the variable
+        that are neither horizontal nor time (e.g. "member" or "lev"), and
+        "time". Regions that do not overlap the grid are NaN.
+    """
+    data_vars = get_data_vars(ds)
+    if len(data_vars) != 1:
+        raise ValueError(f"Expected exactly one valid data variable, found {len(data_vars)}")
+    data = data_vars[0]
+    if 'time' not in data.dims:
+        raise ValueError(f"{get_filename(ds)} has no time dimension")
+
+    horizontal_dims = [dim for dim in get_horizontal_dims(ds) if dim in data.dims]
+    other_dimensions = [dim for dim in data.dims if dim not in horizontal_dims and dim != 'time']
+    if data.chunks is None:
+        data = data.chunk({'time': 'auto', **{dim: 1 for dim in other_dimensions}})
+
+    weights = get_area_weights(ds, grids)
+    if weights is None:
+        weights = xr.DataArray(np.ones([ds.sizes[dim] for dim in horizontal_dims]), dims=horizontal_dims)
+    means = []
+    for box in regions.values():
+        mask = None if box is None else get_region_mask(ds, box)
+        if box is not None and mask is None:
+            # Regions cannot be located on grids without latitudes and longitudes
+            means.append(xr.full_like(data.isel({dim: 0 for dim in horizontal_dims}, drop=True), np.nan, dtype=np.float64))
+            continue
+        region_weights = weights if mask is None else weights * mask
+        means.append(data.weighted(region_weights).mean(dim=horizontal_dims))
+    means = xr.concat(means, dim="region").assign_coords(region=list(regions))
+    return means.transpose("region", *other_dimensions, "time").reset_coords(drop=True).compute()
+
+
+def extract_means(path: str, regions: dict = REGIONS, grids: GridRegistry = None) -> dict:
+    """
+    Opens a dataset and computes its region means (see
+    compute_region_means()). Runs inside the worker processes of
+    write_means(), so only the small table of means is sent back to the
+    parent process. The area weights are taken from 'grids', see
+    compute_region_means().
+
+    Returns
+    -------
+    entries : dict
+        The values of ENTRY_VARS for each time series (one per combination of
+        the non-horizontal dimensions, named by "subset"), their "time"
+        offsets (see get_time_offsets()) and their "means" with the
+        dimensions (region, time)
+    """
+    key = get_cache_key(path)
+    # The times are only needed as offsets, which raw times give without decoding every timestamp
+    ds = open_path(path, decode_times=False)
+    try:
+        means = compute_region_means(ds, regions, grids)
+        offsets = get_time_offsets(ds)
+        parts = parse_cmip_filename(path) or {}
+        info = {
+            "path": normalize_path(path),
+            "model": parts.get("model", str(ds.attrs.get("source_id", "unknown"))),
+            "experiment": parts.get("experiment", str(ds.attrs.get("experiment_id", "unknown"))),
+            "member": parts.get("member", str(ds.attrs.get("variant_label", "unknown"))),
+            "variable": str(get_data_vars(ds)[0].name),
+            "units": str(get_data_vars(ds)[0].attrs.get("units", "")),
+            "calendar": str(get_time_attr(ds, "calendar") or "standard"),
+            "source_key": key,
+        }
+    finally:
+        ds.close()
+
+    other_dimensions = list(means.dims[1:-1])
+    entries = []
+    for index in itertools.product(*[range(means.sizes[dim]) for dim in other_dimensions]):
+        selection = dict(zip(other_dimensions, index))
+        subset = ",".join(f"{dim}={means[dim].values[i] if dim in means.coords else i}" for dim, i in selection.items())
+        entries.append({**info, "subset": subset, "row_size": len(offsets), "time": offsets,
+                        "means": means.isel(selection).values.astype(np.float32)})
+    return entries
+
+
+def try_extract_means(path: str, regions: dict, grids: GridRegistry = None) -> tuple:
+    try:
+        return extract_means(path, regions, grids), None
+    except Exception as err:
+        return None, err
+
+
+def read_entries(store: xr.Dataset) -> list[dict]:
+    # Splits a store back into one dictionary per time series, see extract_means()
+    starts = np.concatenate([[0], np.cumsum(store["row_size"].values)])
+    entries = []
+    for i in range(store.sizes["entry"]):
+        rows = slice(int(starts[i]), int(starts[i + 1]))
+        entry = {name: str(store[name].values[i]) for name in ENTRY_VARS if name != "row_size"}
+        entry["row_size"] = int(store["row_size"].values[i])
+        entry.update({"time": store["time"].values[rows], "means": store["means"].values[:, rows]})
+        entries.append(entry)
+    return entries
+
+
+def build_store(entries: list[dict], regions: dict) -> xr.Dataset:
+    """
+    Builds the means store from a list of time series. The series of all
+    entries are concatenated along one "sample" dimension (a CF contiguous
+    ragged array), so series of different lengths and calendars take no
+    padding: entry i holds the samples between the sums of "row_size" over
+    the entries before it and up to and including it.
+    """
+    store = xr.Dataset(
+        {
+            "means": (("region", "sample"), np.concatenate([entry["means"] for entry in entries], axis=1) if entries else np.empty((len(regions), 0), np.float32)),
+            "time": ("sample", np.concatenate([entry["time"] for entry in entries]) if entries else np.empty(0)),
+            **{name: ("entry", np.array([entry[name] for entry in entries], dtype=np.int64 if name == "row_size" else object)) for name in ENTRY_VARS},
+        },
+        coords={"region": list(regions)},
+    )
+    store["row_size"].attrs["sample_dimension"] = "sample"
+    store["time"].attrs["units"] = "seconds since 1970-01-01 in the calendar of each entry"
+    store.attrs["regions"] = json.dumps(regions)
+    return store
+
+
+def open_means(target: str) -> xr.Dataset:
+    """
+    Opens and loads a store written by write_means(). The store is small, so
+    lookups (see get_series()) do not touch the data it was computed from.
+    """
+    if target.rstrip("/").endswith(".zarr"):
+        with xr.open_zarr(target, decode_times=False) as store:
+            return store.load()
+    with xr.open_dataset(target, decode_times=False) as store:
+        return store.load()
+
+
+def write_means(paths: list[str], target: str, workers: int = 1, regions: dict = REGIONS, failures: dict = None,
+                grids: GridRegistry = None) -> xr.Dataset:
+    """
+    Computes the area-weighted global and regional means per timestep of
+    every dataset (see compute_region_means()) and writes them all to one
+    compact netCDF file or zarr store, depending on the extension of
+    'target'. Datasets are reduced one per worker process, and only their
+    means are sent back, so the memory use does not grow with the size of
+    the archive.
+
+    If 'target' already exists, the means of datasets that have not changed
+    since they were written (see tests.cache.get_cache_key()) are kept and
+    only new or changed datasets are read.
+
+    Parameters
+    ----------
+    paths : list[str]
+        List of file paths to netCDF files or zarr stores
+    target : str
+        Path of the netCDF file (".nc") or zarr store (".zarr") to write
+    workers : int [optional, default=1]
+        Number of worker processes
+    regions : dict [optional, default=REGIONS]
+        Regions to compute the means over, see compute_region_means()
+    failures : dict[str, Exception] [optional, default=None]
+        If given, datasets that could not be reduced are recorded here.
+        Otherwise, a ValueError listing every failed path is raised.
+    grids : GridRegistry [optional, default=None]
+        Registry to take the area weights from, e.g. with the cell areas of
+        the grids added. By default, a new registry is used for this call,
+        and each worker process builds the weights of its datasets itself.
+
+    Returns
+    -------
+    store : xr.Dataset
+        The written store, see build_store()
+    """
+    entries = []
+    if os.path.exists(target):
+        previous = open_means(target)
+        if list(previous["region"].values) == list(regions):
+            entries = read_entries(previous)
+
+    # Series of unchanged datasets are kept, all others are computed again
+    requested = {normalize_path(path) for path in paths}
+    keys = {}
+    for path in paths:
+        try:
+            keys[normalize_path(path)] = get_cache_key(path)
+        except OSError:
+            keys[normalize_path(path)] = None
+    entries = [entry for entry in entries if entry["path"] not in requested or keys[entry["path"]] == entry["source_key"]]
+    kept = {entry["path"] for entry in entries}
+    todo = [path for path in paths if normalize_path(path) not in kept]
+
+    if workers > 1 and len(todo) > 1:
+        with get_process_pool(workers) as executor:
+            results = list(executor.map(try_extract_means, todo, [regions] * len(todo), [grids] * len(todo)))
+    else:
+        grids = GridRegistry() if grids is None else grids
+        results = [try_extract_means(path, regions, grids) for path in todo]
+
+    path_failures = {}
+    for path, (path_entries, err) in zip(todo, results):
+        if err is not None:
+            path_failures[path] = err
+        else:
+            entries += path_entries
+
+    order = {normalize_path(path): i for i, path in enumerate(paths)}
+    entries.sort(key=lambda entry: (order.get(entry["path"], len(order)), entry["path"], entry["subset"]))
+    store = build_store(entries, regions)
+    # Written to a temporary path first, so that readers never see a partial store
+    temporary_path = f"{target.rstrip('/')}.{os.getpid()}.tmp"
+    if target.rstrip("/").endswith(".zarr"):
+        store.to_zarr(temporary_path, mode="w", consolidated=True, zarr_format=2)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(temporary_path, target)
+    else:
+        store.to_netcdf(temporary_path)
+        os.replace(temporary_path, target)
+
+    report_path_failures(path_failures, paths, failures, "compute the means of")
+    return store
+
+
+def get_series(store: xr.Dataset, model: str, experiment: str, member: str = None, variable: str = None,
+               region: str = "global", subset: str = None) -> xr.DataArray:
+    """
+    Returns the mean time series of one region for a model and experiment
+    from a store opened with open_means(), joining the files a series is
+    split across. If 'member' is None, the ensemble mean over every member
+    is returned, over the timesteps they share.
+
+    'subset' selects one combination of the non-horizontal dimensions, e.g.
+    "lev=10.0" (see extract_means()). It can be left out if the means of
+    only one subset are stored, e.g. for variables without levels. Means of
+    different subsets are never averaged together.
+
+    Returns
+    -------
+    series : xr.DataArray
+        Mean with a "time" dimension of cftime dates in the calendar of the
+        model
+    """
+    import cftime
+    entries = [entry for entry in read_entries(store.sel(region=[region]))
+               if entry["model"] == model and entry["experiment"] == experiment
+               and (member is None or entry["member"] == member)
+               and (variable is None or entry["variable"] == variable)
+               and (subset is None or entry["subset"] == subset)]
+    if len(entries) == 0:
+        raise ValueError(f"No means stored for model={model}, experiment={experiment}, member={member}, variable={variable}, subset={subset}")
+    variables = {entry["variable"] for entry in entries}
+    if len(variables) > 1:
+        raise ValueError(f"Means of several variables are stored for {model}/{experiment}: {sorted(variables)}. Pass 'variable'.")
+    subsets = {entry["subset"] for entry in entries}
+    if len(subsets) > 1:
+        raise ValueError(f"Means of several subsets are stored for {model}/{experiment}: {sorted(subsets)}. Pass 'subset'.")
+
+    members = {}
+    for entry in entries:
+        members.setdefault(entry["member"], []).append(entry)
+    series = []
+    for pieces in members.values():
+        time = np.concatenate([entry["time"] for entry in pieces])
+        means = np.concatenate([entry["means"][0] for entry in pieces])
+        order = np.argsort(time, kind="stable")
+        series.append(xr.DataArray(means[order], dims="time", coords={"time": time[order]}))
+    series = xr.concat(xr.align(*series, join="inner"), dim="member").mean("member")
+    series = series.assign_coords(time=cftime.num2date(series.time.values, "seconds since 1970-01-01", entries[0]["calendar"]))
+    series.name = entries[0]["variable"]
+    series.attrs = {"units": entries[0]["units"], "model": model, "experiment": experiment, "region": region, "subset": entries[0]["subset"]}
+    return series
+
+
+def get_experiment_difference(store: xr.Dataset, model: str, experiment: str, control: str = "ssp370",
+                              variable: str = None, region: str = "global", subset: str = None) -> xr.DataArray:
+    """
+    Returns the ensemble mean of 'experiment' minus the ensemble mean of
+    'control' for one model, region and subset (see get_series()), over the
+    timesteps both share, e.g. the response of a model to the ssp370-126aer
+    aerosol reductions.
+    """
+    perturbed = get_series(store, model, experiment, variable=variable, region=region, subset=subset)
+    reference = get_series(store, model, control, variable=variable, region=region, subset=subset)
+    difference = perturbed - reference
+    difference.name = perturbed.name
+    difference.attrs = {**perturbed.attrs, "control": control}
+    return difference
@@ -0,0 +1,226 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from tests.utils import DatasetHandle, HandlePool, has_time_dim, is_url, report_path_failures
+from tests.test_calendar import get_calendar_fingerprint
+from tests.test_units import get_units_fingerprint
+from tests.test_variable_name import get_var_names_fingerprint
+
+
+def exists(path: str, name: str) -> bool:
+    # Whether the file 'name' exists in the local or fsspec (URL) zarr store at 'path'
+    if is_url(path):
+        import fsspec
+        fs, root = fsspec.core.url_to_fs(path)
+        return fs.exists(f"{root.rstrip('/')}/{name}")
+    return os.path.exists(os.path.join(path, name))
+
+
+def read_bytes(path: str, name: str) -> bytes:
+    if is_url(path):
+        import fsspec
+        fs, root = fsspec.core.url_to_fs(path)
+        return fs.cat_file(f"{root.rstrip('/')}/{name}")
+    with open(os.path.join(path, name), "rb") as f:
+        return f.read()
+
+
+def read_zarr_metadata(path: str) -> dict:
+    """
+    Reads the variables, dimensions, shapes and attributes of a zarr store from
+    its consolidated metadata (.zmetadata for zarr v2, zarr.json for zarr v3)
+    without opening any arrays.
+
+    Parameters
+    ----------
+    path : str
+        Path or fsspec URL to a zarr store with consolidated metadata
+
+    Returns
+    -------
+    metadata : dict
+        See read_metadata()
+    """
+    variables = {}
+    if exists(path, ".zmetadata"):
+        entries = json.loads(read_bytes(path, ".zmetadata"))["metadata"]
+        global_attrs = dict(entries.get(".zattrs", {}))
+        for key, value in entries.items():
+            if not key.endswith("/.zarray") or "/" in key[:-len("/.zarray")]:
+                continue
+            name = key[:-len("/.zarray")]
+            attrs = dict(entries.get(f"{name}/.zattrs", {}))
+            dims = attrs.pop("_ARRAY_DIMENSIONS", [])
+            variables[name] = {"dims": tuple(dims), "shape": tuple(value["shape"]), "attrs": attrs}
+    elif exists(path, "zarr.json"):
+        group = json.loads(read_bytes(path, "zarr.json"))
+        if "consolidated_metadata" not in group or group["consolidated_metadata"] is None:
+            raise ValueError(f"Zarr store has no consolidated metadata: {path}")
+        global_attrs = dict(group.get("attributes", {}))
+        for name, value in group["consolidated_metadata"]["metadata"].items():
+            if value.get("node_type") != "array" or "/" in name:
+                continue
+            variables[name] = {"dims": tuple(value.get("dimension_names") or ()), "shape": tuple(value["shape"]),
+                               "attrs": dict(value.get("attributes", {}))}
+    else:
+        raise ValueError(f"Zarr store has no consolidated metadata: {path}")
+    return {"source": path, "attrs": global_attrs, "variables": variables}
+
+
+def read_netcdf_metadata(path: str) -> dict:
+    """
+    Reads the variables, dimensions, shapes and attributes of a netCDF file from
+    its header without decoding times or building any indexes. Uses netCDF4 if
+    it is installed, and otherwise xarray with all decoding switched off.
+
+    Parameters
+    ----------
+    path : str
+        Path to a netCDF file
+
+    Returns
+    -------
+    metadata : dict
+        See read_metadata()
+    """
+    variables = {}
+    try:
+        import netCDF4
+    except ImportError:
+        import xarray
+        with xarray.open_dataset(path, decode_cf=False, create_default_indexes=False) as ds:
+            for name, var in ds.variables.items():
+                variables[name] = {"dims": var.dims, "shape": var.shape, "attrs": dict(var.attrs)}
+            return {"source": path, "attrs": dict(ds.attrs), "variables": variables}
+
+    with netCDF4.Dataset(path) as nc:
+        global_attrs = {attr: nc.getncattr(attr) for attr in nc.ncattrs()}
+        for name, var in nc.variables.items():
+            variables[name] = {"dims": tuple(var.dimensions), "shape": tuple(var.shape),
+                               "attrs": {attr: var.getncattr(attr) for attr in var.ncattrs()}}
+    return {"source": path, "attrs": global_attrs, "variables": variables}
+
+
+def read_metadata(path: str) -> dict:
+    """
+    Reads the metadata of a netCDF file or zarr store without going through
+    xarray's decoding.
+
+    Parameters
+    ----------
+    path : str
+        Path to a netCDF file (.nc) or zarr store (.zarr)
+
+    Returns
+    -------
+    metadata : dict
+        Dictionary with the keys:
+            source: the path
+            attrs: the global attributes
+            variables: maps each variable name to a dictionary with its
+                "dims", "shape" and "attrs"
+    """
+    if path.endswith(".nc"):
+        return read_netcdf_metadata(path)
+    elif path.rstrip("/").endswith(".zarr"):
+        return read_zarr_metadata(path)
+    else:
+        raise ValueError(f"File type not supported: {path}")
+
+
+def get_metadata_facts(metadata: dict) -> dict:
+    """
+    Computes, from metadata returned by read_metadata(), the same facts that the
+    calendar, units and variable name checks compute from an opened dataset.
+
+    Parameters
+    ----------
+    metadata : dict
+        Metadata returned by read_metadata()
+
+    Returns
+    -------
+    facts : dict
+        Maps the names of the fact functions to their values, as stored on a
+        DatasetHandle
+    """
+    variables = metadata["variables"]
+    dims = {dim for var in variables.values() for dim in var["dims"]}
+
+    # Like xarray, variables named after a dimension or listed in a "coordinates"
+    # attribute are coordinates, and everything else is a data variable
+    coordinates = set(dims)
+    for attrs in [metadata["attrs"]] + [var["attrs"] for var in variables.values()]:
+        coordinates.update(str(attrs.get("coordinates", "")).split())
+    data_vars = [name for name in variables if name not in coordinates]
+
+    var_names = tuple(data_vars)
+    units = tuple(sorted((var, variables[var]["attrs"].get("units")) for var in data_vars if 'bnds' not in var))
+    facts = {
+        has_time_dim.__name__: "time" in dims,
+        get_var_names_fingerprint.__name__: var_names,
+        get_units_fingerprint.__name__: (var_names, units),
+    }
+    if "time" in variables:
+        facts[get_calendar_fingerprint.__name__] = variables["time"]["attrs"].get("calendar")
+    return facts
+
+
+def convert_paths_metadata(paths: list[str], workers: int = 1, header_only: bool = False, failures: dict = None, cache=None, pool: HandlePool = None) -> list[DatasetHandle]:
+    """
+    Converts a list of file paths to DatasetHandles carrying the metadata facts
+    read by read_metadata(). No dataset is opened with xarray, so the calendar,
+    units and variable name checks run on the headers alone. Any other check
+    opens the datasets it needs on demand.
+
+    Parameters
+    ----------
+    paths : list[str]
+        List of file paths to netCDF files or zarr stores
+    workers : int [optional, default=1]
+        Number of threads used to read the metadata concurrently
+    header_only : bool [optional, default=False]
+        Passed to open_path() when a dataset is opened on demand
+    failures : dict[str, Exception] [optional, default=None]
+        If given, paths whose metadata could not be read are skipped and
+        recorded here. Otherwise, a ValueError listing every failed path is
+        raised.
+    cache : ValidationCache [optional, default=None]
+        If given, cached facts are used and the metadata is only read for
+        paths without a valid cache entry
+    pool : HandlePool [optional, default=None]
+        If given, datasets opened on demand are opened through it
+
+    Returns
+    -------
+    datasets : list[DatasetHandle]
+        List of handles, in the same order as 'paths'
+    """
+    # The cache is only used from this thread, since SQLite connections cannot be shared between threads
+    known_facts = {path: (cache.get(path) if cache is not None else None) or {} for path in paths}
+
+    def try_read(path):
+        facts = known_facts[path]
+        if get_var_names_fingerprint.__name__ in facts:
+            return facts, None
+        try:
+            return {**get_metadata_facts(read_metadata(path)), **facts}, None
+        except Exception as err:
+            return None, err
+
+    if workers > 1 and len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(try_read, paths))
+    else:
+        results = [try_read(path) for path in paths]
+
+    handles = []
+    path_failures = {}
+    for path, (facts, err) in zip(paths, results):
+        if err is None:
+            handles.append(DatasetHandle(path, facts=facts, header_only=header_only, pool=pool))
+        else:
+            path_failures[path] = err
+
+    report_path_failures(path_failures, paths, failures, "read the metadata of")
+    return handles
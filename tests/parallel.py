@@ -0,0 +1,133 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Callable
+from tests.utils import DatasetHandle, HandlePool, Logger, open_path, has_time_dim, get_fact, get_logger, set_logger, get_basename, report_path_failures
+from tests.cache import get_cached_facts
+
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns a pool of 'workers' processes. Forking a process that already runs
+    dask or HDF5 threads can deadlock the children, so the workers are started
+    from a clean server process instead.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+
+
+def extract_facts(path: str, facts: list[Callable], header_only: bool = False, profile: bool = False) -> tuple:
+    """
+    Opens a dataset and computes the given facts for it. Runs inside the worker
+    processes of convert_paths_parallel(), so only the small dictionary of facts
+    is sent back to the parent process.
+
+    Parameters
+    ----------
+    path : str
+        Path to a netCDF file or zarr store
+    facts : list[Callable]
+        Fact functions to compute, e.g. the fingerprint functions of the checks
+    header_only : bool [optional, default=False]
+        Passed to open_path()
+    profile : bool [optional, default=False]
+        Whether to record profiling events in the worker
+
+    Returns
+    -------
+    facts : dict
+        Maps the name of each fact function to its value. Facts that raise an
+        exception are left out, so they are recomputed (and raise the same
+        exception) in the parent process if a check needs them.
+    events : list[dict]
+        Profiling events recorded in the worker. Empty if profile is False.
+    """
+    logger = Logger() if profile else None
+    previous = set_logger(logger)
+    values = {}
+    try:
+        with logger.timer("extract_facts", dataset=get_basename(path)) if profile else nullcontext():
+            ds = open_path(path, header_only)
+            try:
+                for fact in facts:
+                    try:
+                        values[fact.__name__] = get_fact(ds, fact)
+                    except Exception:
+                        continue
+            finally:
+                ds.close()
+    finally:
+        set_logger(previous)
+    return values, ([] if logger is None else logger.getLogs())
+
+
+def convert_paths_parallel(paths: list[str], facts: list[Callable], workers: int, header_only: bool = False, failures: dict = None, cache=None, incremental: bool = False, pool: HandlePool = None,
+                           on_extracted: Callable = None) -> list[DatasetHandle]:
+    """
+    Converts a list of file paths to DatasetHandles whose facts have been
+    computed across a pool of 'workers' processes. Each worker re-opens its
+    datasets by path, so nothing is opened in the parent process unless a
+    check later needs more than the precomputed facts (e.g. verbose output).
+
+    Parameters
+    ----------
+    paths : list[str]
+        List of file paths to netCDF files or zarr stores
+    facts : list[Callable]
+        Fact functions needed by the checks that will be run
+    workers : int
+        Number of worker processes
+    header_only : bool [optional, default=False]
+        Passed to open_path() in the workers and for on-demand opening
+    failures : dict[str, Exception] [optional, default=None]
+        If given, paths that could not be processed are skipped and recorded
+        here. Otherwise, a ValueError listing every failed path is raised.
+    cache : ValidationCache [optional, default=None]
+        If given, paths with valid cached facts are not sent to the workers
+    incremental : bool [optional, default=False]
+        Passed to get_cached_facts()
+    pool : HandlePool [optional, default=None]
+        If given, datasets opened on demand later are opened through it
+    on_extracted : Callable [optional, default=None]
+        If given, called with the handle of each dataset as soon as its facts
+        are known, in the order the workers finish, e.g. to report results
+        while the other datasets are still being processed
+
+    Returns
+    -------
+    datasets : list[DatasetHandle]
+        List of handles, in the same order as 'paths'
+    """
+    # run() always needs to know which datasets have a time dimension
+    facts = [has_time_dim] + [fact for fact in facts if fact is not has_time_dim]
+
+    known_facts = {path: (get_cached_facts(cache, path, incremental) if cache is not None else None) or {} for path in paths}
+    to_extract = [path for path in paths if any(fact.__name__ not in known_facts[path] for fact in facts)]
+
+    handles = {path: DatasetHandle(path, facts=known_facts[path], header_only=header_only, pool=pool) for path in paths}
+    if on_extracted is not None:
+        for path in paths:
+            if path not in to_extract:
+                on_extracted(handles[path])
+
+    path_failures = {}
+    with get_process_pool(workers) as executor:
+        logger = get_logger()
+        futures = {executor.submit(extract_facts, path, facts, header_only, logger is not None): path for path in to_extract}
+        # Collected in submission order so the output does not depend on which worker finishes first,
+        # unless every dataset is handed on as soon as it is done
+        for future in (futures if on_extracted is None else as_completed(futures)):
+            path = futures[future]
+            try:
+                values, events = future.result()
+                known_facts[path].update(values)
+                for event in events:
+                    logger.log(event)
+            except Exception as err:
+                path_failures[path] = err
+                continue
+            if on_extracted is not None:
+                on_extracted(handles[path])
+
+    report_path_failures(path_failures, paths, failures)
+
+    return [handles[path] for path in paths if path not in path_failures]
@@ -0,0 +1,211 @@
+import os
+import json
+import itertools
+import numpy as np
+import xarray as xr
+import zarr
+from tests.utils import get_basename, get_spatial_dims, report_path_failures
+from tests.cache import get_cache_key
+from tests.test_chunks import check_chunk_layout
+
+# Target size of the chunks written by rechunk_store()
+TARGET_CHUNK_BYTES = 32 * 2**20
+
+
+def open_raw(path: str) -> xr.Dataset:
+    # The stored values are copied as they are, without masking, scaling or decoding times
+    kwargs = {"chunks": {}, "mask_and_scale": False, "decode_times": False}
+    if path.rstrip("/").endswith(".zarr"):
+        return xr.open_zarr(path, **kwargs)
+    if path.endswith(".nc"):
+        return xr.open_dataset(path, **kwargs)
+    raise ValueError(f"File type not supported: {path}")
+
+
+def get_target_chunks(var: xr.DataArray, spatial_dims: tuple, target_chunk_bytes: int = TARGET_CHUNK_BYTES) -> dict:
+    """
+    Returns a chunk shape for 'var' that is contiguous in time: every chunk
+    holds the whole time series (or as much of it as fits in
+    'target_chunk_bytes') of a tile of the spatial dimensions, and a single
+    index of every other dimension (e.g. "member").
+    """
+    itemsize = var.dtype.itemsize
+    chunks = {dim: 1 for dim in var.dims}
+    chunks['time'] = int(min(var.sizes['time'], max(target_chunk_bytes // itemsize, 1)))
+    # The spatial tile is halved along its longest side until the chunk fits
+    budget = max(target_chunk_bytes // (chunks['time'] * itemsize), 1)
+    tile = {dim: var.sizes[dim] for dim in var.dims if dim in spatial_dims}
+    while int(np.prod(list(tile.values()))) > budget:
+        longest = max(tile, key=tile.get)
+        tile[longest] = int(np.ceil(tile[longest] / 2))
+    chunks.update(tile)
+    return chunks
+
+
+def get_blocks(shape: tuple, chunks: tuple, itemsize: int, max_bytes: int) -> list[tuple]:
+    """
+    Splits an array into blocks of whole chunks that each take at most
+    'max_bytes' in memory. Blocks grow along the last dimensions first, which
+    are usually the spatial dimensions that source chunks span in full, so
+    that fewer blocks read the same source chunk.
+
+    Returns
+    -------
+    blocks : list[tuple]
+        Tuple of slices for each block
+    """
+    chunk_bytes = int(np.prod(chunks)) * itemsize
+    if chunk_bytes > max_bytes:
+        raise ValueError(f"A single chunk ({chunk_bytes} bytes) does not fit in max_memory ({max_bytes} bytes)")
+    grid = [int(np.ceil(size / chunk)) for size, chunk in zip(shape, chunks)]
+    counts = [1] * len(shape)
+    for axis in reversed(range(len(shape))):
+        # The block is as long along this axis as fits with the counts chosen for the axes after it
+        others = int(np.prod([chunk * count for i, (chunk, count) in enumerate(zip(chunks, counts)) if i != axis]))
+        counts[axis] = int(min(grid[axis], max(max_bytes // (others * chunks[axis] * itemsize), 1)))
+    starts = [range(0, size, chunk * count) for size, chunk, count in zip(shape, chunks, counts)]
+    return [tuple(slice(start, min(start + chunk * count, size)) for start, size, chunk, count in zip(block, shape, chunks, counts))
+            for block in itertools.product(*starts)]
+
+
+def read_progress(progress_path: str, key: str) -> dict:
+    # The blocks already written for the current version of the source, or None to start over
+    if not os.path.exists(progress_path):
+        return None
+    with open(progress_path) as f:
+        progress = json.load(f)
+    return progress if progress["source_key"] == key else None
+
+
+def write_progress(progress_path: str, progress: dict) -> None:
+    temporary_path = f"{progress_path}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(temporary_path, progress_path)
+
+
+def rechunk_store(path: str, target: str, max_memory: int = 2**30, target_chunk_bytes: int = None,
+                  overwrite: bool = False) -> str:
+    """
+    Writes a copy of a zarr store (or netCDF file) to a new zarr store whose
+    data variables are chunked contiguously in time (see
+    get_target_chunks()), so that time series and the time reductions of
+    show_single() read few, large chunks.
+
+    The data is copied in blocks of whole target chunks, so at most about
+    'max_memory' bytes are held in memory at once. Progress is recorded in
+    "<target>.progress.json" after every block; if the copy is interrupted,
+    calling rechunk_store() again resumes after the last written block, as
+    long as the source has not changed in the meantime. Once the copy is
+    complete, the progress file records that, so the copy is only written
+    again when the source changes.
+
+    Parameters
+    ----------
+    path : str
+        Path to the zarr store or netCDF file to copy
+    target : str
+        Path of the zarr store to write
+    max_memory : int [optional, default=2**30]
+        Approximate upper bound in bytes of the memory used for the copy
+    target_chunk_bytes : int [optional, default=None]
+        Target size of the written chunks. By default TARGET_CHUNK_BYTES, or
+        a quarter of 'max_memory' if that is smaller, so that each block of
+        the copy holds at least two chunks.
+    overwrite : bool [optional, default=False]
+        Whether to write the copy again even if 'target' is a completed copy
+        of the current source, or to replace a 'target' that was not written
+        by rechunk_store()
+
+    Returns
+    -------
+    target : str
+        Path of the written zarr store
+    """
+    progress_path = f"{target}.progress.json"
+    key = get_cache_key(path)
+    if os.path.exists(target) and not os.path.exists(progress_path) and not overwrite:
+        raise ValueError(f"{target} already exists and was not written by rechunk_store()")
+    progress = None if overwrite else read_progress(progress_path, key)
+    if progress is not None and progress["complete"]:
+        return target
+    if target_chunk_bytes is None:
+        target_chunk_bytes = min(TARGET_CHUNK_BYTES, max(max_memory // 4, 1))
+
+    source = open_raw(path)
+    try:
+        spatial_dims = get_spatial_dims(source)
+        large = [name for name in source.data_vars if 'time' in source[name].dims and any(dim in spatial_dims for dim in source[name].dims)]
+        target_chunks = {name: get_target_chunks(source[name], spatial_dims, target_chunk_bytes) for name in large}
+
+        if progress is None:
+            # The metadata, coordinates and small variables are written up front. The large variables
+            # are only created here and filled block by block below.
+            template = source.copy()
+            for name in template.variables:
+                # The chunks and codecs of the source do not carry over
+                template[name].encoding = {}
+                if name not in large:
+                    template[name] = template[name].load()
+            for name in large:
+                template[name] = template[name].chunk(target_chunks[name])
+            template.to_zarr(target, mode="w", compute=False, consolidated=True)
+            progress = {"source_key": key, "complete": False, "done": {name: [] for name in large}}
+            write_progress(progress_path, progress)
+
+        group = zarr.open_group(target, mode="r+")
+        for name in large:
+            var = source[name]
+            chunks = tuple(target_chunks[name][dim] for dim in var.dims)
+            # Each block takes up to max_memory / 2, since dask may hold the source chunks while assembling it
+            blocks = get_blocks(var.shape, chunks, var.dtype.itemsize, max_memory // 2)
+            done = set(progress["done"][name])
+            for i, block in enumerate(blocks):
+                if i in done:
+                    continue
+                group[name][block] = var[block].values
+                progress["done"][name].append(i)
+                write_progress(progress_path, progress)
+    finally:
+        source.close()
+    progress["complete"] = True
+    write_progress(progress_path, progress)
+    return target
+
+
+def rechunk_flagged(paths: list[str], output_dir: str, max_memory: int = 2**30, failures: dict = None,
+                    target_chunk_bytes: int = None) -> dict:
+    """
+    Rechunks every dataset that fails the chunk layout check (see
+    tests.test_chunks) into '<output_dir>/<name>.zarr' with rechunk_store(),
+    one after another, so the memory use stays below 'max_memory'. Copies
+    that were interrupted are resumed, and completed copies of unchanged
+    datasets are not written again. 'target_chunk_bytes' is passed to
+    rechunk_store().
+
+    Returns
+    -------
+    rechunked : dict
+        Maps each rechunked path to the path of its copy
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rechunked = {}
+    path_failures = {}
+    for path in paths:
+        try:
+            ds = open_raw(path)
+            try:
+                flagged = not check_chunk_layout(ds)
+            finally:
+                ds.close()
+            if flagged:
+                name = get_basename(path)
+                for extension in [".nc", ".zarr"]:
+                    if name.endswith(extension):
+                        name = name[:-len(extension)]
+                rechunked[path] = rechunk_store(path, os.path.join(output_dir, f"{name}.zarr"), max_memory, target_chunk_bytes)
+        except Exception as err:
+            path_failures[path] = err
+
+    report_path_failures(path_failures, paths, failures, "rechunk")
+    return rechunked
@@ -0,0 +1,124 @@
+from typing import Callable
+from tests.utils import find_wrong_datasets, find_different_datasets
+
+
+class Check:
+    r"""
+    Description of a check that run() and validate_matrix() can run without
+    knowing anything else about it. Check modules create one per check and
+    pass it to register_check().
+
+    Parameters
+    ----------
+    name : str
+        Name used in the summary, e.g. "Calendar Check"
+    test : Callable
+        Function test(datasets, verbose, checks, fail_fast, **parameters) -> str
+        that runs the check over a list of datasets, records the result in the
+        'checks' dictionary and returns the summary message. With fail_fast,
+        it may stop as soon as the check is known to fail.
+    facts : list[Callable]
+        Fact functions the check uses. The pipeline computes each fact once
+        per dataset (see get_fact()) before the checks run, so checks that
+        need the same fact share it.
+    find : Callable
+        Function find(datasets, verbose) -> list that returns the datasets of
+        a group that fail the check, see individual() and consensus()
+    level : str [optional, default="experiment"]
+        Grouping level of the check in validate_matrix(): "experiment" for
+        individual checks, "model" for a consensus within each model and
+        "all" for a consensus across all models
+    needs_time : bool [optional, default=False]
+        Whether the check only runs on datasets with a time dimension
+    option : str [optional, default=None]
+        Name of the run() argument that enables the check, e.g.
+        "check_calendar". Checks without one are enabled by 'default'.
+    default : bool [optional, default=True]
+        Whether the check runs if it is not explicitly enabled or disabled
+    parameters : list[str] [optional, default=None]
+        Names of run() arguments passed on to 'test', e.g. ["valid_ranges"]
+    sampled_facts : list[Callable] or Callable [optional, default=None]
+        Fact functions the check uses instead of 'facts' in sample mode, e.g.
+        statistics of a subset of the timesteps, or a function that returns
+        them for the seed of the run
+    order : int [optional, default=100]
+        Checks run and are reported in increasing order
+    """
+    def __init__(self, name: str, test: Callable, facts: list[Callable], find: Callable, level: str = "experiment",
+                 needs_time: bool = False, option: str = None, default: bool = True, parameters: list[str] = None,
+                 sampled_facts: list[Callable] | Callable = None, order: int = 100):
+        if level not in ["experiment", "model", "all"]:
+            raise ValueError(f"Unknown level: {level}. Expected 'experiment', 'model' or 'all'")
+        self.name = name
+        self.test = test
+        self.facts = facts
+        self.find = find
+        self.level = level
+        self.needs_time = needs_time
+        self.option = option
+        self.default = default
+        self.parameters = [] if parameters is None else parameters
+        self.sampled_facts = facts if sampled_facts is None else sampled_facts
+        self.order = order
+
+    def __repr__(self) -> str:
+        return f"Check({self.name!r}, level={self.level!r}, facts={[fact.__name__ for fact in self.facts]})"
+
+    def get_facts(self, sample: bool = False, seed: int = 0) -> list[Callable]:
+        """
+        Returns the facts the check uses, or the ones it uses in sample mode
+        with the given seed if 'sample' is True.
+        """
+        if not sample:
+            return self.facts
+        return self.sampled_facts(seed) if callable(self.sampled_facts) else self.sampled_facts
+
+
+_registry = {}
+
+
+def register_check(check: Check) -> Check:
+    """
+    Adds a check to the registry, replacing any check with the same name.
+    """
+    _registry[check.name] = check
+    return check
+
+
+def get_checks(names: list[str] = None) -> list[Check]:
+    """
+    Returns the registered checks in the order they run, or only the checks
+    with the given names.
+    """
+    checks = sorted(_registry.values(), key=lambda check: check.order)
+    if names is None:
+        return checks
+    unknown = [name for name in names if name not in _registry]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown checks: {unknown}. Expected any of {[check.name for check in checks]}")
+    return [check for check in checks if check.name in names]
+
+
+def get_facts(checks: list[Check], sample: bool = False, seed: int = 0) -> list[Callable]:
+    """
+    Returns the facts needed by the given checks, each one once. If 'sample'
+    is True, the facts needed in sample mode with the given seed.
+    """
+    facts = []
+    for check in checks:
+        facts += [fact for fact in check.get_facts(sample, seed) if fact not in facts]
+    return facts
+
+
+def individual(check: Callable) -> Callable:
+    # Finds the datasets of a group that fail an individual integrity check
+    return lambda datasets, verbose: find_wrong_datasets(datasets, check, verbose)
+
+
+def consensus(fingerprint: Callable, check_equiv: Callable) -> Callable:
+    # Finds the datasets of a group that differ from the group's majority. If there is no
+    # majority, every dataset in the group fails.
+    def find(datasets, verbose):
+        different_datasets, _ = find_different_datasets(datasets, fingerprint, check_equiv, verbose)
+        return list(datasets) if different_datasets is None else different_datasets
+    return find
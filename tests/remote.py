@@ -0,0 +1,193 @@
+import json
+import asyncio
+import itertools
+import numpy as np
+import xarray as xr
+import fsspec
+import fsspec.asyn
+from zarr.storage import FsspecStore, WrapperStore
+
+# Coordinate and bounds arrays with at most this many elements are prefetched
+MAX_PREFETCH_SIZE = 1000000
+
+
+class PrefetchedStore(WrapperStore):
+    r"""
+    Zarr store that serves keys fetched ahead of time from memory and passes
+    every other request on to the wrapped store.
+
+    Parameters
+    ----------
+    store : zarr.abc.store.Store
+        Store to wrap, e.g. an FsspecStore
+    prefetched : dict[str, bytes] [optional, default=None]
+        Contents of already fetched keys, relative to the store root. Keys
+        mapped to None are known not to exist.
+    """
+    def __init__(self, store, prefetched: dict = None):
+        super().__init__(store)
+        self.prefetched = {} if prefetched is None else prefetched
+
+    def _with_store(self, store):
+        return type(self)(store, self.prefetched)
+
+    async def get(self, key, prototype, byte_range=None):
+        if byte_range is None and key in self.prefetched:
+            value = self.prefetched[key]
+            return None if value is None else prototype.buffer.from_bytes(value)
+        return await self._store.get(key, prototype, byte_range)
+
+    async def exists(self, key) -> bool:
+        if key in self.prefetched:
+            return self.prefetched[key] is not None
+        return await self._store.exists(key)
+
+
+def get_coordinate_keys(metadata_key: str, metadata: dict) -> list[str]:
+    """
+    Returns the keys of every chunk of the coordinate and bounds arrays in a
+    zarr store, which xarray reads when it opens the store, from its
+    consolidated metadata (.zmetadata for zarr v2, zarr.json for zarr v3).
+    """
+    # name -> (dims, shape, chunk shape, attrs, prefix of the chunk keys, separator of the chunk indices)
+    arrays = {}
+    if metadata_key == ".zmetadata":
+        entries = metadata["metadata"]
+        for key, value in entries.items():
+            if key.endswith("/.zarray") and "/" not in key[:-len("/.zarray")]:
+                name = key[:-len("/.zarray")]
+                attrs = entries.get(f"{name}/.zattrs", {})
+                arrays[name] = (attrs.get("_ARRAY_DIMENSIONS", []), value["shape"], value["chunks"], attrs,
+                                f"{name}/", value.get("dimension_separator", "."))
+    else:
+        for name, value in (metadata.get("consolidated_metadata") or {}).get("metadata", {}).items():
+            if value.get("node_type") != "array" or "/" in name:
+                continue
+            encoding = value.get("chunk_key_encoding", {"name": "default"})
+            separator = encoding.get("configuration", {}).get("separator", "/" if encoding["name"] == "default" else ".")
+            prefix = f"{name}/c{separator}" if encoding["name"] == "default" else f"{name}/"
+            arrays[name] = (value.get("dimension_names") or [], value["shape"], value["chunk_grid"]["configuration"]["chunk_shape"],
+                            value.get("attributes", {}), prefix, separator)
+
+    # Like xarray, arrays named after a dimension or listed in a "coordinates" attribute are coordinates
+    coordinates = {dim for dims, *_ in arrays.values() for dim in dims}
+    for _, _, _, attrs, _, _ in arrays.values():
+        coordinates.update(str(attrs.get("coordinates", "")).split())
+        coordinates.update(str(attrs.get("bounds", "")).split())
+
+    keys = []
+    for name, (_, shape, chunks, _, prefix, separator) in arrays.items():
+        if name not in coordinates or len(shape) == 0 or np.prod(shape) > MAX_PREFETCH_SIZE:
+            continue
+        counts = [range(int(np.ceil(size / chunk))) for size, chunk in zip(shape, chunks)]
+        keys += [prefix + separator.join(str(i) for i in index) for index in itertools.product(*counts)]
+    return keys
+
+
+async def fetch_keys(fs, root: str, keys: list[str], semaphore: asyncio.Semaphore) -> dict:
+    # Keys that do not exist, e.g. chunks that were never written because they only hold fill
+    # values, map to None so that they are not requested again
+    async def fetch(key):
+        async with semaphore:
+            try:
+                return key, await asyncio.to_thread(fs.cat_file, f"{root}/{key}")
+            except FileNotFoundError:
+                return key, None
+
+    return dict(await asyncio.gather(*[fetch(key) for key in keys]))
+
+
+async def prefetch_store(url: str, semaphore: asyncio.Semaphore) -> dict:
+    fs, root = fsspec.core.url_to_fs(url)
+    root = root.rstrip("/")
+    prefetched = {}
+    for metadata_key in ["zarr.json", ".zmetadata"]:
+        fetched = await fetch_keys(fs, root, [metadata_key], semaphore)
+        prefetched.update(fetched)
+        if fetched[metadata_key] is None:
+            continue
+        metadata = json.loads(fetched[metadata_key])
+        if metadata_key == ".zmetadata":
+            # zarr reads the group metadata from these keys before it looks at the consolidated metadata
+            for key in [".zgroup", ".zattrs"]:
+                prefetched[key] = json.dumps(metadata["metadata"].get(key, {})).encode()
+        elif metadata.get("consolidated_metadata") is None:
+            break
+        prefetched.update(await fetch_keys(fs, root, get_coordinate_keys(metadata_key, metadata), semaphore))
+        break
+    return prefetched
+
+
+def prefetch_stores(urls: list[str], max_requests: int = 32) -> dict:
+    """
+    Fetches the consolidated metadata and the small coordinate arrays of many
+    zarr stores concurrently, with at most 'max_requests' requests in flight,
+    so that opening the stores afterwards does not wait on one request after
+    another.
+
+    Parameters
+    ----------
+    urls : list[str]
+        fsspec URLs of zarr stores
+    max_requests : int [optional, default=32]
+        Maximum number of concurrent requests
+
+    Returns
+    -------
+    prefetched : dict
+        Maps each URL to a dictionary of the fetched keys and their contents,
+        to be passed to open_url(). Stores that could not be read map to an
+        empty dictionary and fail later, when they are opened.
+    """
+    async def prefetch_all():
+        semaphore = asyncio.Semaphore(max_requests)
+        results = await asyncio.gather(*[prefetch_store(url, semaphore) for url in urls], return_exceptions=True)
+        return {url: ({} if isinstance(result, Exception) else result) for url, result in zip(urls, results)}
+
+    # Runs on the event loop fsspec keeps in its own thread, so this also works where a loop is
+    # already running in this thread, e.g. in a Jupyter notebook
+    return fsspec.asyn.sync(fsspec.asyn.get_loop(), prefetch_all)
+
+
+def close_with(ds: xr.Dataset, f) -> xr.Dataset:
+    # xarray does not close file objects it was given, so closing the dataset closes 'f' as well
+    close_dataset = ds._close
+
+    def close():
+        try:
+            if close_dataset is not None:
+                close_dataset()
+        finally:
+            f.close()
+
+    ds.set_close(close)
+    return ds
+
+
+def open_url(url: str, kwargs: dict, prefetched: dict = None) -> xr.Dataset:
+    """
+    Opens a netCDF file or zarr store at an fsspec URL. See open_path().
+
+    Parameters
+    ----------
+    url : str
+        fsspec URL, e.g. "s3://bucket/x.zarr"
+    kwargs : dict
+        Passed to xarray.open_dataset() or xarray.open_zarr()
+    prefetched : dict [optional, default=None]
+        Keys of a zarr store returned by prefetch_stores()
+    """
+    if url.rstrip("/").endswith(".zarr"):
+        store = PrefetchedStore(FsspecStore.from_url(url.rstrip("/"), read_only=True), prefetched)
+        ds = xr.open_zarr(store, **kwargs)
+    elif url.endswith(".nc"):
+        f = fsspec.open(url, mode="rb").open()
+        try:
+            ds = close_with(xr.open_dataset(f, **kwargs), f)
+        except Exception:
+            f.close()
+            raise
+    else:
+        raise ValueError(f"File type not supported: {url}")
+    ds.encoding["source"] = url
+    return ds
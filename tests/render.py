@@ -0,0 +1,201 @@
+import os
+import json
+import html
+import time
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from tests.utils import open_path, get_filename, get_basename, parse_cmip_filename, report_path_failures
+from tests.summary import get_data_vars, summarize_single
+from tests.show_single import iter_figures, MAX_TIME_POINTS
+from tests.parallel import get_process_pool
+
+MANIFEST = "figures.json"
+
+
+def get_source_mtime(path: str) -> float:
+    """
+    Returns the time a netCDF file or zarr store was last modified. For a zarr
+    store this is the newest of the store directory and its metadata files,
+    which change whenever an array is written or appended to.
+    """
+    mtimes = [os.path.getmtime(path)]
+    for name in [".zmetadata", "zarr.json"]:
+        if os.path.exists(os.path.join(path, name)):
+            mtimes.append(os.path.getmtime(os.path.join(path, name)))
+    return max(mtimes)
+
+
+def get_output_dir(path: str, output_dir: str) -> str:
+    """
+    Returns the directory the figures of 'path' are written to:
+    <output_dir>/<model>/<experiment>/<file name>. Files that do not follow the
+    CMIP naming pattern are written to <output_dir>/other/other/<file name>.
+    """
+    filename = get_basename(path)
+    parts = parse_cmip_filename(filename) or {"model": "other", "experiment": "other"}
+    return os.path.join(output_dir, parts["model"], parts["experiment"], filename)
+
+
+def new_agg_figure() -> Figure:
+    # Figures made without pyplot are drawn by the Agg backend whatever backend is active, are never
+    # shown and are freed as soon as they are saved
+    return FigureCanvasAgg(Figure()).figure
+
+
+def render_single(path: str, output_dir: str, formats: tuple = ("png",), force: bool = False,
+                  max_points: int = MAX_TIME_POINTS) -> dict:
+    """
+    Renders every figure of show_single() for one dataset to image files,
+    without a display.
+
+    Parameters
+    ----------
+    path : str
+        Path to a netCDF file or zarr store
+    output_dir : str
+        Root directory of the rendered figures, see get_output_dir()
+    formats : tuple [optional, default=("png",)]
+        File formats to save every figure in, e.g. ("png", "pdf")
+    force : bool [optional, default=False]
+        If False, nothing is rendered when the figures of the dataset are
+        newer than the dataset itself
+    max_points : int [optional, default=MAX_TIME_POINTS]
+        Maximum number of timesteps drawn in the time series plots
+
+    Returns
+    -------
+    manifest : dict
+        Dictionary with the keys "source", "rendered" (the time the figures
+        were rendered), "figures" (maps each figure name to its files, relative
+        to the directory of the manifest) and "skipped" (True if the existing
+        figures were reused)
+    """
+    directory = get_output_dir(path, output_dir)
+    manifest_path = os.path.join(directory, MANIFEST)
+    if not force and os.path.exists(manifest_path) and os.path.getmtime(manifest_path) > get_source_mtime(path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if all(os.path.exists(os.path.join(directory, file)) for files in manifest["figures"].values() for file in files):
+            return {**manifest, "skipped": True}
+
+    os.makedirs(directory, exist_ok=True)
+    # Times are decoded only for the axis labels, see format_time_axis()
+    ds = open_path(path, decode_times=False)
+    try:
+        if len(get_data_vars(ds)) > 1:
+            raise ValueError(f"More than one valid data variable in {path}")
+        summary = summarize_single(ds)
+        figures = {}
+        for name, fig in iter_figures(summary, get_filename(ds), new_figure=new_agg_figure, max_points=max_points):
+            figures[name] = []
+            for file_format in formats:
+                fig.savefig(os.path.join(directory, f"{name}.{file_format}"), bbox_inches="tight")
+                figures[name].append(f"{name}.{file_format}")
+    finally:
+        ds.close()
+
+    manifest = {"source": os.path.abspath(path), "rendered": time.time(), "figures": figures}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return {**manifest, "skipped": False}
+
+
+def try_render_single(path: str, output_dir: str, formats: tuple, force: bool, max_points: int) -> tuple:
+    # Runs inside the worker processes of render_batch(), so an error in one dataset does not stop the batch
+    try:
+        return render_single(path, output_dir, formats, force, max_points), None
+    except Exception as err:
+        return None, err
+
+
+def write_index(directory: str, entries: dict) -> str:
+    """
+    Writes an index.html to 'directory' that shows the figures of every
+    dataset in it, one section per dataset.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of a model/experiment, see get_output_dir()
+    entries : dict
+        Maps the file name of each dataset to its manifest, see render_single()
+
+    Returns
+    -------
+    path : str
+        Path to the written index page
+    """
+    sections = []
+    for filename in sorted(entries):
+        images = []
+        for name, files in entries[filename]["figures"].items():
+            image = next((file for file in files if file.endswith(".png")), files[0])
+            src = html.escape(f"{filename}/{image}")
+            if image.endswith(".png"):
+                images.append(f'<a href="{src}"><img src="{src}" alt="{html.escape(name)}" width="400"></a>')
+            else:
+                images.append(f'<a href="{src}">{html.escape(name)}</a>')
+        sections.append(f"<h2>{html.escape(filename)}</h2>\n" + "\n".join(images))
+
+    title = html.escape(" / ".join(os.path.normpath(directory).split(os.sep)[-2:]))
+    page = f"<!DOCTYPE html>\n<html>\n<head><title>{title}</title></head>\n<body>\n<h1>{title}</h1>\n" \
+           + "\n".join(sections) + "\n</body>\n</html>\n"
+    path = os.path.join(directory, "index.html")
+    with open(path, "w") as f:
+        f.write(page)
+    return path
+
+
+def render_batch(paths: list[str], output_dir: str, workers: int = 1, formats: tuple = ("png",),
+                 force: bool = False, max_points: int = MAX_TIME_POINTS, failures: dict = None) -> dict:
+    """
+    Renders the show_single() figures of many datasets to image files, one
+    dataset per worker process, and writes an index page for every
+    model/experiment. Datasets whose figures are newer than the dataset are
+    skipped unless 'force' is True.
+
+    Parameters
+    ----------
+    paths : list[str]
+        List of file paths to netCDF files or zarr stores
+    output_dir : str
+        Root directory of the rendered figures
+    workers : int [optional, default=1]
+        Number of worker processes
+    formats, force, max_points
+        See render_single()
+    failures : dict[str, Exception] [optional, default=None]
+        If given, datasets that could not be rendered are recorded here.
+        Otherwise, a ValueError listing every failed path is raised.
+
+    Returns
+    -------
+    manifests : dict
+        Maps each path that was rendered or skipped to its manifest
+    """
+    args = [(path, output_dir, tuple(formats), force, max_points) for path in paths]
+    if workers > 1 and len(paths) > 1:
+        with get_process_pool(workers) as executor:
+            results = list(executor.map(try_render_single, *zip(*args)))
+    else:
+        results = [try_render_single(*arg) for arg in args]
+
+    manifests = {}
+    path_failures = {}
+    for path, (manifest, err) in zip(paths, results):
+        if err is None:
+            manifests[path] = manifest
+        else:
+            path_failures[path] = err
+
+    # The index pages also list datasets rendered by earlier batches
+    for directory in sorted({os.path.dirname(get_output_dir(path, output_dir)) for path in manifests}):
+        entries = {}
+        for filename in os.listdir(directory):
+            if os.path.exists(os.path.join(directory, filename, MANIFEST)):
+                with open(os.path.join(directory, filename, MANIFEST)) as f:
+                    entries[filename] = json.load(f)
+        write_index(directory, entries)
+
+    report_path_failures(path_failures, paths, failures, "render")
+    return manifests
@@ -0,0 +1,117 @@
+import json
+
+
+class CheckResult:
+    r"""
+    Outcome of one check over a list of datasets, in a form that can be
+    exported (see to_dict()) instead of read off the colored summary.
+
+    Parameters
+    ----------
+    name : str
+        Name of the check, e.g. "Calendar Check"
+    passed : bool
+        Whether every dataset passed the check
+    message : str
+        Summary message without colors
+    failed : list[str]
+        Paths of the datasets that failed the check. For a consensus check
+        without a majority, every dataset fails.
+    total : int
+        Number of datasets that were checked
+    num_opinions : int [optional, default=None]
+        For consensus checks, the number of distinct opinions found
+    datasets : list[str] [optional, default=None]
+        Paths of the datasets that were checked
+    errors : dict[str, str] [optional, default=None]
+        Errors raised while checking, by path, for the datasets that failed
+        because the check could not be run on them
+    """
+    def __init__(self, name: str, passed: bool, message: str, failed: list[str], total: int, num_opinions: int = None,
+                 datasets: list[str] = None, errors: dict = None):
+        self.name = name
+        self.passed = passed
+        self.message = message
+        self.failed = failed
+        self.total = total
+        self.num_opinions = num_opinions
+        self.datasets = [] if datasets is None else datasets
+        self.errors = {} if errors is None else errors
+
+    def __repr__(self) -> str:
+        return f"CheckResult({self.name!r}, passed={self.passed}, failed={len(self.failed)}/{self.total})"
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "passed": self.passed, "message": self.message, "failed": list(self.failed),
+                "total": self.total, "num_opinions": self.num_opinions, "datasets": list(self.datasets),
+                "errors": dict(self.errors)}
+
+
+class CheckResults(dict):
+    r"""
+    Dictionary from check name to whether it passed, as filled in by the
+    test functions of the checks (see get_indiv_check_msg() and
+    get_consensus_check_msg()), that also keeps the CheckResult of each check
+    in 'details'.
+    """
+    def __init__(self):
+        super().__init__()
+        self.details = {}
+
+
+class RunReport:
+    r"""
+    Structured results of a run() over many datasets: one CheckResult per
+    check that ran, the checks that were skipped, the paths that could not
+    be opened, which checks each dataset passed, and the error that stopped
+    the run, if any.
+
+    Pass an empty RunReport as run(report=...) to have it filled in.
+    """
+    def __init__(self):
+        self.checks = []
+        self.skipped = []
+        self.failures = {}
+        self.paths = []
+        self.error = None
+
+    @property
+    def passed(self) -> bool:
+        """
+        Whether the run finished, every check passed and every path could be
+        opened.
+        """
+        return self.error is None and len(self.failures) == 0 and all(check.passed for check in self.checks)
+
+    def get_dataset_results(self) -> dict:
+        """
+        Maps each checked path to a dictionary from check name to whether the
+        dataset passed it. Checks that did not look at a dataset (e.g. time
+        checks of a dataset without a time dimension) are left out.
+        """
+        datasets = {path: {} for path in self.paths if path not in self.failures}
+        for check in self.checks:
+            failed = set(check.failed)
+            for path in check.datasets:
+                datasets.setdefault(path, {})[check.name] = path not in failed
+        return datasets
+
+    def to_dict(self) -> dict:
+        return {
+            "passed": self.passed,
+            "checks": [check.to_dict() for check in self.checks],
+            "skipped": list(self.skipped),
+            "failures": {path: str(err) for path, err in self.failures.items()},
+            "datasets": self.get_dataset_results(),
+            "error": self.error,
+        }
+
+    def to_json(self, path: str = None, indent: int = 2) -> str:
+        """
+        Returns the report as a JSON string, and writes it to 'path' if given.
+        """
+        text = json.dumps(self.to_dict(), indent=indent)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
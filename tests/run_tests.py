@@ -9,63 +9,221 @@ Developers: Willow Lin Stenglein, Cameron Cummins
 Contact: cameron.cummins@utexas.edu
 Last Header Update: 10/10/24
 """
-from tests.test_monotonic import test_monotonic
-from tests.test_calendar import test_calendar
-from tests.test_units import test_units
-from tests.test_variable_name import test_variable_name
-from tests.test_spatial_coords import test_spatial_coords
-from tests.utils import convert_paths, get_filename
+# Importing the check modules registers their checks
+import tests.test_monotonic
+import tests.test_calendar
+import tests.test_units
+import tests.test_variable_name
+import tests.test_spatial_coords
+import tests.test_values
+import tests.test_chunks
+import tests.test_bounds
+from tests.registry import get_checks, get_facts
+from tests.utils import convert_paths, convert_paths_pooled, expand_paths, has_glob, sample_paths, DatasetHandle, HandlePool, get_filename, get_fact, get_source, has_time_dim, Logger, set_logger, time_check, collect_errors
+from tests.results import CheckResult, CheckResults, RunReport
+from tests.cache import ValidationCache, convert_paths_cached, get_cached_facts, update_cache
+from tests.parallel import convert_paths_parallel
+from tests.metadata import convert_paths_metadata
 from tests.show_single import show_single
 from colorama import Fore, Style
+from typing import Callable
 
-def check_model(paths: list[str], verbose: bool=False) -> None:
-    run(paths, check_variable_name=False, check_units=False, verbose=verbose)
+def check_model(paths: list[str], verbose: bool=False, workers: int=1, cache: str | ValidationCache=None, profile: bool=False,
+                threads: int=1) -> Logger | None:
+    return run(paths, check_variable_name=False, check_units=False, verbose=verbose, workers=workers, cache=cache, profile=profile,
+               threads=threads)
 
 
 def run(paths: str | list[str], verbose: bool=False, check_monotonic: bool=True, check_calendar: bool=True, 
-        check_units: bool=True, check_variable_name: bool=True, check_spatial_coords: bool=True) -> None:
+        check_units: bool=True, check_variable_name: bool=True, check_spatial_coords: bool=True, 
+        check_time_steps: bool=True, workers: int=1, header_only: bool=False, cache: str | ValidationCache=None, 
+        profile: bool=False, fast_metadata: bool=False, check_values: bool=False, valid_ranges: dict=None, 
+        incremental: bool=False, max_open: int=None, checks: list[str]=None, summaries: str=None, 
+        fail_fast: bool=False, sample: int | float=None, seed: int=0, check_chunks: bool=False, 
+        check_bounds: bool=True, report: RunReport=None, on_dataset: Callable=None, threads: int=1) -> Logger | None:
+    """
+    Runs the enabled checks over the datasets at 'paths' and prints a summary.
+    There are two kinds of concurrency: 'workers' > 1 opens the datasets and
+    extracts their facts across a pool of that many processes (see
+    convert_paths_parallel()), while 'threads' > 1 only opens the datasets
+    concurrently in this process (see convert_paths()), which suits runs that
+    are dominated by opening headers. With fast_metadata, which has no
+    process pool, the headers are read with the larger of the two.
+    """
 
-    datasets = convert_paths(paths)
-
-    if(isinstance(paths, str)):
-        show_single(datasets[0], verbose)
+    if(isinstance(paths, str) and not has_glob(paths)):
+        show_single(convert_paths(paths)[0], verbose, summaries)
         return 
+
+    # Glob patterns (local or fsspec URLs, e.g. "s3://bucket/ramip/*.zarr") are expanded up front
+    paths = expand_paths(paths)
+    # For a quick triage, only a random subset of the datasets (and of the time chunks for the
+    # value checks) is checked
+    num_paths = len(paths)
+    if sample is not None:
+        paths = sample_paths(paths, sample, seed)
+
+    # A cache given by its path is only open for this run
+    own_cache = isinstance(cache, str)
+    if own_cache:
+        cache = ValidationCache(cache)
+    # When profiling, timings, bytes loaded and call counts are recorded per check and per dataset
+    logger = Logger() if profile else None
+    previous_logger = set_logger(logger)
+    datasets = []
+    try:
+        # Paths that cannot be opened are reported in the summary instead of aborting the run
+        failures = {}
+        if incremental and cache is None:
+            raise ValueError("Incremental validation needs a cache to remember what was already validated.")
+        # With max_open, at most that many datasets are open at once and the others are reopened on demand
+        pool = HandlePool(max_open) if max_open is not None else None
+
+        # The registered checks to run, either by name or enabled by the check_* arguments, and
+        # the per-dataset facts they need
+        options = {"check_monotonic": check_monotonic, "check_calendar": check_calendar, "check_units": check_units,
+                   "check_variable_name": check_variable_name, "check_spatial_coords": check_spatial_coords,
+                   "check_time_steps": check_time_steps, "check_values": check_values, "check_chunks": check_chunks,
+                   "check_bounds": check_bounds}
+        parameters = {"valid_ranges": valid_ranges, "sample": sample is not None, "seed": seed}
+        if checks is None:
+            enabled_checks = [check for check in get_checks() if options.get(check.option, check.default)]
+        else:
+            enabled_checks = get_checks(checks)
+        facts = [has_time_dim] + get_facts(enabled_checks, sample is not None, seed)
+
+        if fast_metadata:
+            # The metadata checks read the headers directly and other checks open datasets on demand
+            with time_check("open"):
+                datasets = convert_paths_metadata(paths, workers=max(workers, threads), header_only=header_only, failures=failures, cache=cache, pool=pool)
+        elif workers > 1:
+            # The facts are extracted across a process pool
+            with time_check("open"):
+                datasets = convert_paths_parallel(paths, facts, workers, header_only=header_only, failures=failures, cache=cache, incremental=incremental, pool=pool,
+                                                  on_extracted=on_dataset)
+        elif pool is not None:
+            # Every dataset is opened once to extract its facts and closed again when the pool is full
+            known_facts = {path: get_cached_facts(cache, path, incremental) for path in paths} if cache is not None else None
+            with time_check("open"):
+                datasets = convert_paths_pooled(paths, pool, facts, header_only=header_only, failures=failures, known_facts=known_facts)
+        elif cache is not None:
+            # Facts for unchanged files are read from the cache, so only changed files are opened. With
+            # incremental validation, zarr stores that were appended to only have their new timesteps read.
+            with time_check("open"):
+                datasets = convert_paths_cached(paths, cache, workers=threads, header_only=header_only, failures=failures, incremental=incremental)
+        else:
+            with time_check("open"):
+                opened = convert_paths(paths, workers=threads, header_only=header_only, failures=failures)
+            # Handles memoize the facts, so each one is computed once and shared by every check
+            datasets = [DatasetHandle(path, ds=ds, header_only=header_only) for path, ds in zip([path for path in paths if path not in failures], opened)]
     
-    if(len(datasets) == 0):
-        print(Fore.RED + "No datasets passed in." + Style.RESET_ALL)
-        return 
+        if report is not None:
+            report.paths = list(paths)
+            report.failures.update(failures)
+
+        if(len(datasets) == 0):
+            if len(failures) > 0:
+                print(Fore.RED + f"None of the datasets could be opened: {failures}" + Style.RESET_ALL)
+            else:
+                print(Fore.RED + "No datasets passed in." + Style.RESET_ALL)
+            return logger
+
+        results = CheckResults() # Dictionary to store the results of each check
+        summary_msg = "" 
+
+        if verbose:
+            print(f"Checking {len(datasets)} datasets: {[get_filename(ds) for ds in datasets]}")
+            print("\n")
+
+        if sample is not None:
+            summary_msg += f"NOTE: Only a random sample of {len(paths)}/{num_paths} datasets (seed {seed}) was checked, and the value checks only read a sample of the timesteps.\n\n"
+
+        if len(failures) > 0:
+            summary_msg += f"WARNING: The following paths could not be opened and will not be checked: {list(failures.keys())}\n"
+            if verbose:
+                summary_msg += "".join(f"    {path}: {err}\n" for path, err in failures.items())
+            summary_msg += "\n"
+
+        datasets_with_time = [ds for ds in datasets if get_fact(ds, has_time_dim)]
+        if len(datasets) != len(datasets_with_time) and any(check.needs_time for check in enabled_checks):
+            tmp = [get_filename(ds) for ds in datasets if not get_fact(ds, has_time_dim)]
+            summary_msg += f"WARNING: The following datasets do not have a time dimension and will not be checked for monotonicity, regular time steps or correct calendar encoding: {tmp}\n\n"
 
-    checks = {} # Dictionary to store the results of each check
-    summary_msg = "" 
+        # Every fact is computed once per dataset before any check runs. Facts that raise are left
+        # out here and raise again in the check that needs them. With fail_fast, facts are only
+        # computed when a check needs them, so a run that stops early does not compute them all.
+        # With on_dataset, each dataset is handed on once its facts are known, unless the workers already did.
+        with time_check("facts"):
+            for ds in datasets:
+                if not fail_fast:
+                    ds_time = get_fact(ds, has_time_dim)
+                    for fact in get_facts([check for check in enabled_checks if ds_time or not check.needs_time], sample is not None, seed):
+                        try:
+                            get_fact(ds, fact)
+                        except Exception:
+                            continue
+                if on_dataset is not None and not (workers > 1 and not fast_metadata):
+                    on_dataset(ds)
 
-    if verbose:
-        print(f"Checking {len(datasets)} datasets: {[get_filename(ds) for ds in datasets]}")
-        print("\n")
+        # Datasets that make a check raise fail that check, and a check that raises altogether fails
+        # every dataset, so one malformed dataset does not stop the other checks
+        for i, check in enumerate(enabled_checks):
+            with time_check(check.name), collect_errors() as errors:
+                kwargs = {name: parameters[name] for name in check.parameters}
+                checked = datasets_with_time if check.needs_time else datasets
+                try:
+                    summary_msg += check.test(checked, verbose, results, fail_fast, **kwargs) + "\n"
+                except Exception as err:
+                    error = f"{type(err).__name__}: {err}"
+                    results[check.name] = False
+                    results.details[check.name] = CheckResult(check.name, False, f"The check raised {error}", [], len(checked))
+                    summary_msg += Style.BRIGHT + Fore.RED + f"{check.name} failed: " + Style.RESET_ALL
+                    summary_msg += Fore.RED + f"The check raised {error}\n" + Style.RESET_ALL + "\n"
+            if check.name in results.details:
+                details = results.details[check.name]
+                details.datasets = [get_source(ds) for ds in checked]
+                details.errors = errors
+                if not details.passed and len(details.failed) == 0:
+                    # A consensus check without a majority fails every dataset
+                    details.failed = list(details.datasets)
+            if fail_fast and not results.get(check.name, True):
+                summary_msg += "NOTE: Stopped at the first failing check (fail_fast), so only the first failing datasets are listed above."
+                skipped = [other.name for other in enabled_checks[i + 1:]]
+                summary_msg += f" These checks were skipped: {skipped}\n" if len(skipped) > 0 else "\n"
+                if report is not None:
+                    report.skipped = skipped
+                break
 
-    datasets_with_time = [ds for ds in datasets if 'time' in ds.dims]
-    if len(datasets) != len(datasets_with_time) and (check_monotonic or check_calendar):
-        tmp = [get_filename(ds) for ds in datasets if 'time' not in ds.dims]
-        summary_msg += f"WARNING: The following datasets do not have a time dimension and will not be checked for monotonicity or correct calendar encoding: {tmp}\n\n"
+        if report is not None:
+            report.checks = list(results.details.values())
 
-    if check_monotonic:
-        summary_msg += test_monotonic(datasets_with_time, verbose, checks) + "\n"
-    if check_calendar:
-        summary_msg += test_calendar(datasets_with_time, verbose, checks) + "\n"
-    if check_units:
-        summary_msg += test_units(datasets, verbose, checks) + "\n"
-    if check_variable_name:
-        summary_msg += test_variable_name(datasets, verbose, checks) + "\n"
-    if check_spatial_coords:
-        summary_msg += test_spatial_coords(datasets, verbose, checks) + "\n"
+        if cache is not None:
+            update_cache(cache, datasets, incremental)
 
-    print(f"\n\nSUMMARY: {sum(checks.values())}/{len(checks)} checks passed.")
-    print("=============================================================")
-    print(summary_msg)
+        print(f"\n\nSUMMARY: {sum(results.values())}/{len(results)} checks passed.")
+        print("=============================================================")
+        print(summary_msg)
 
-    # Check if we should offer some helpful advice 
-    if int(sum(checks.values())) < len(checks) and not verbose:
-        print("If you would like more information on why the checks failed, run the function with the verbose flag set to True. To avoid this output becoming too long, we would recommend running the function with just two files at a time.")
+        # Check if we should offer some helpful advice 
+        if int(sum(results.values())) < len(results) and not verbose:
+            print("If you would like more information on why the checks failed, run the function with the verbose flag set to True. To avoid this output becoming too long, we would recommend running the function with just two files at a time.")
+    finally:
+        # The datasets opened for the checks are not needed after the run, even if a check raised
+        for ds in datasets:
+            ds.close()
+        # Commits what was looked up in the cache, even if the run stopped before update_cache()
+        if own_cache:
+            cache.close()
+        elif cache is not None:
+            cache.flush()
+        set_logger(previous_logger)
+    if profile:
+        print("\nPROFILE (times in seconds):")
+        print(logger.getTable())
+    return logger
 
 
-# if __name__ == "__main__":
-#     pass
\ No newline at end of file
+if __name__ == "__main__":
+    import sys
+    from tests.cli import main
+    sys.exit(main())
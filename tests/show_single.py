@@ -1,127 +1,179 @@
 import xarray as xr
-import matplotlib.pyplot as plt
 import numpy as np
-import itertools
+import matplotlib.pyplot as plt
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+from typing import Callable
 from tests.utils import get_filename
+from tests.summary import get_data_vars
+from tests.summary_store import SummaryStore, get_summary
+from tests.grids import GridRegistry
 
-def show_single(ds: xr.Dataset, verbose: bool=False):
-    """
-    Given a single dataset, this function prints out several plots that show different aspects of the dataset. 
-
-    Plot 1: A line plot of timeseries data averaged over all spatial dimensions. Other dimensions, such as 
-        "member" are plotted as separate lines. If there are multiple other dimensions, then their combinations are plotted.
-    Plot 2: Instead of a line plot, a heat map is generated using the same specifications as #1. 
-    Plot 3: A map of the mean of all dimensions other than latitude and longitude for the entire time period.
-    Plot 3.5 (Optional): If lev or level is a spatial dimension, then a map of the mean over all dimensions other
-        than lev/level. 
-    Plot 4: A map of the mean of all dimensions other than latitude and longitude for the first timestep.
-    Plot 5: A map of the mean of all dimensions other than latitude and longitude for the last timestep.
-    """
-
-    path = get_filename(ds)
+# Time series longer than this are averaged down before plotting, which is still more points than
+# there are pixels across a figure, so drawing time does not grow with the length of the run
+MAX_TIME_POINTS = 2000
+# At most this many combinations of the other dimensions are labelled on the color mesh plot
+MAX_LABELS = 40
 
-    if verbose:
-        print("Checking single zarr store: ", path)
-        print(ds) 
-        print("\n\n")
-        print(ds.info())
-        print("\n\n")
 
-    data_vars = []
-    for var in ds.data_vars:
-        # we want to ignore all data variables that are actually bounds
-        if 'bnds' not in ds[var].dims:
-            data_vars.append(ds[var])
+def downsample_time(data: xr.DataArray, max_points: int = MAX_TIME_POINTS) -> xr.DataArray:
+    """
+    Averages consecutive timesteps so that 'data' has at most 'max_points'
+    timesteps. Each new timestep is labelled with the first timestep it covers.
+    """
+    if max_points is None or 'time' not in data.dims or data.sizes['time'] <= max_points:
+        return data
+    factor = int(np.ceil(data.sizes['time'] / max_points))
+    return data.coarsen(time=factor, boundary='trim', coord_func={'time': 'min'}).mean()
 
-    if len(data_vars) > 1: 
-        print("More than one valid data variable in zarr store")
-        return 
-    
-    data = data_vars[0]
 
-    # TASK 1
-    if verbose: 
-        print(data)
-        print()
+def format_time_axis(ax, summary: xr.Dataset):
+    # Raw times are plotted as numbers and only the tick positions are decoded to dates
+    if "time_units" not in summary.attrs:
+        return
+    import cftime
+    units, calendar = summary.attrs["time_units"], summary.attrs["time_calendar"]
+    ax.xaxis.set_major_formatter(FuncFormatter(lambda x, _: cftime.num2date(x, units, calendar).strftime("%Y-%m-%d")))
+    ax.xaxis.set_major_locator(MaxNLocator(nbins=4))
+    ax.set_xlabel("time")
 
-    possible_spatial_dims = ["lat", "lon", "lev", "latitude", "longitude", "level"]
-    spatial_dims = [dim for dim in possible_spatial_dims if dim in data.dims]
-    other_dimensions = [dim for dim in data.dims if dim not in spatial_dims and dim != 'time']
 
-    # latitudinal weighting for task 1 and task 2 
-    if 'lat' in spatial_dims:
-        weights = np.cos(np.deg2rad(data.lat))
-    if 'latitude' in spatial_dims:
-        weights = np.cos(np.deg2rad(data.latitude))
-    weights.name = "weights"
-    data_weighted = data.weighted(weights)
+def iter_figures(summary: xr.Dataset, path: str, new_figure: Callable = plt.figure, max_points: int = MAX_TIME_POINTS):
+    """
+    Draws the figures described in show_single() from the output of
+    summarize_single(), yielding each one as soon as it has been drawn.
+
+    Parameters
+    ----------
+    summary : xr.Dataset
+        Output of summarize_single()
+    path : str
+        File name printed at the bottom of every figure
+    new_figure : Callable [optional, default=plt.figure]
+        Function that returns a new, empty matplotlib Figure. Pass
+        tests.render.new_agg_figure to draw without pyplot, e.g. when rendering
+        to files in a batch.
+    max_points : int [optional, default=MAX_TIME_POINTS]
+        Maximum number of timesteps drawn in the time series plots
+
+    Yields
+    ------
+    name : str
+        Short name of the figure, e.g. "spatial_mean_lines"
+    fig : matplotlib.figure.Figure
+        The figure
+    """
+    spatial_mean = downsample_time(summary["spatial_mean"], max_points)
+    other_dimensions = list(summary.attrs["other_dims"])
 
+    def finish(fig, title):
+        fig.suptitle(title)
+        fig.text(0.5, 0, f"Plot generated for {path}", horizontalalignment='center', fontsize=7)
+        return fig
 
-    # Take the mean over the spatial dimensions and plot each combination of the other_dimensions as a line with the x-axis being "time"
+    # TASK 1
+    # Plot the mean over the spatial dimensions with each combination of the other_dimensions as a line with the x-axis being "time"
+    fig = new_figure()
+    ax = fig.subplots()
     if len(other_dimensions) > 1:
         # We need to group our dataarray so it has one singular new dimension that has all combinations of the other_dimensions
-        data_ = data.stack(new_dim=other_dimensions)
+        data_ = spatial_mean.stack(new_dim=other_dimensions)
         data_ = data_.rename({'new_dim': str(tuple(other_dimensions))})
-        data_ = data_.weighted(weights)
-        data_.mean(dim=spatial_dims).plot.line(x='time')
+        data_.plot.line(x='time', ax=ax)
     elif len(other_dimensions) == 1:
-        data_weighted.mean(dim=spatial_dims).plot.line(x='time', hue=other_dimensions[0])
+        spatial_mean.plot.line(x='time', hue=other_dimensions[0], ax=ax)
     else:
-        data_weighted.mean(dim=spatial_dims).plot()
-
-    plt.suptitle(f"Mean over spatial dimensions")
-    plt.figtext(0.5, 0, f"Plot generated for {path}", horizontalalignment='center', fontsize=7) 
-    plt.show()
+        spatial_mean.plot(ax=ax)
+    format_time_axis(ax, summary)
+    yield "spatial_mean_lines", finish(fig, "Mean over spatial dimensions")
 
     # TASK 2
     if len(other_dimensions) > 1:
         new_dim_name = str(tuple(other_dimensions))
-        data_ = data.stack(new_dim=other_dimensions, create_index=False)
+        data_ = spatial_mean.stack(new_dim=other_dimensions, create_index=False)
         data_ = data_.rename({'new_dim': new_dim_name})
-        all_coord_names = [data[dim].values for dim in other_dimensions]
-        combination_coord_labels = [tuple(str(x) for x in combo) for combo in itertools.product(*all_coord_names)]
-        data_ = data_.weighted(weights)
-        data_.mean(dim=spatial_dims).plot.pcolormesh(x='time', y=new_dim_name)
-        plt.yticks(ticks=range(len(combination_coord_labels)), labels=combination_coord_labels)
+        fig = new_figure()
+        ax = fig.subplots()
+        data_.plot.pcolormesh(x='time', y=new_dim_name, ax=ax)
+        # Only the combinations that get a tick are labelled, in the same order as stack() creates them
+        shape = [spatial_mean.sizes[dim] for dim in other_dimensions]
+        num_combinations = int(np.prod(shape))
+        ticks = range(0, num_combinations, int(np.ceil(num_combinations / MAX_LABELS)))
+        labels = [tuple(str(spatial_mean[dim].values[i]) for dim, i in zip(other_dimensions, np.unravel_index(tick, shape))) for tick in ticks]
+        ax.set_yticks(ticks, labels=labels)
+        format_time_axis(ax, summary)
+        yield "spatial_mean_mesh", finish(fig, "Mean over spatial dimensions")
     elif len(other_dimensions) == 1:
-        data_weighted.mean(dim=spatial_dims).plot.pcolormesh(x='time', y=other_dimensions[0])
+        fig = new_figure()
+        ax = fig.subplots()
+        spatial_mean.plot.pcolormesh(x='time', y=other_dimensions[0], ax=ax)
+        format_time_axis(ax, summary)
+        yield "spatial_mean_mesh", finish(fig, "Mean over spatial dimensions")
     else:
         print("Not enough dimensions for a color mesh plot.")
-        # data.mean(dim=spatial_dims).plot.pcolormesh()
-
-    if len(other_dimensions) >= 1:
-        plt.suptitle(f"Mean over spatial dimensions")
-        plt.figtext(0.5, 0, f"Plot generated for {path}", horizontalalignment='center', fontsize=7) 
-        plt.show()
 
     # TASK 3
-    other_dimensions = other_dimensions + ['time']
-    if 'lev' in spatial_dims:
-        other_dimensions += ['lev']
-    elif 'level' in spatial_dims:
-        other_dimensions += ['level']
-    data.mean(dim=other_dimensions).plot()
-    plt.suptitle(f"Mean over entire time period and all other dimensions")
-    plt.figtext(0.5, 0, f"Plot generated for {path}", horizontalalignment='center', fontsize=7) 
-    plt.show()
+    fig = new_figure()
+    summary["time_mean"].plot(ax=fig.subplots())
+    yield "time_mean", finish(fig, "Mean over entire time period and all other dimensions")
 
     # TASK 3.5
-    if 'lev' in spatial_dims or 'level' in spatial_dims:
-        other_dims = [dim for dim in data.dims if dim != 'lev' and dim != 'level']
-        data.mean(dim=other_dims).plot.line(y='lev')
-        plt.suptitle(f"Mean over every dimension except lev")
-        plt.figtext(0.5, 0, f"Plot generated for {path}", horizontalalignment='center', fontsize=7) 
-        plt.show()
+    if "level_profile" in summary:
+        level_dim = summary.attrs["level_dims"][0]
+        fig = new_figure()
+        summary["level_profile"].plot.line(y=level_dim, ax=fig.subplots())
+        yield "level_profile", finish(fig, f"Mean over every dimension except {level_dim}")
 
     # TASK 4
-    other_dimensions.remove('time')
-    data.isel(time=0).mean(dim=other_dimensions).plot()
-    plt.suptitle(f"First timestep, mean over all other dimensions ")
-    plt.figtext(0.5, 0, f"Plot generated for {path}", horizontalalignment='center', fontsize=7) 
-    plt.show() 
+    fig = new_figure()
+    summary["first_timestep"].plot(ax=fig.subplots())
+    yield "first_timestep", finish(fig, "First timestep, mean over all other dimensions ")
 
     # TASK 5
-    data.isel(time=-1).mean(dim=other_dimensions).plot()
-    plt.suptitle(f"Last timestep, mean over all other dimensions")
-    plt.figtext(0.5, 0, f"Plot generated for {path}", horizontalalignment='center', fontsize=7) 
-    plt.show() 
+    fig = new_figure()
+    summary["last_timestep"].plot(ax=fig.subplots())
+    yield "last_timestep", finish(fig, "Last timestep, mean over all other dimensions")
+
+
+def show_single(ds: xr.Dataset, verbose: bool=False, summaries: SummaryStore | str = None, grids: GridRegistry = None):
+    """
+    Given a single dataset, this function prints out several plots that show different aspects of the dataset.
+
+    Plot 1: A line plot of timeseries data averaged over all spatial dimensions. Other dimensions, such as
+        "member" are plotted as separate lines. If there are multiple other dimensions, then their combinations are plotted.
+    Plot 2: Instead of a line plot, a heat map is generated using the same specifications as #1.
+    Plot 3: A map of the mean of all dimensions other than latitude and longitude for the entire time period.
+    Plot 3.5 (Optional): If lev or level is a spatial dimension, then a map of the mean over all dimensions other
+        than lev/level.
+    Plot 4: A map of the mean of all dimensions other than latitude and longitude for the first timestep.
+    Plot 5: A map of the mean of all dimensions other than latitude and longitude for the last timestep.
+
+    If 'summaries' (a SummaryStore or its directory) is given, the statistics are read from the
+    stored summary of the dataset while it is unchanged, instead of from the data. The spatial
+    means are weighted with the area weights from 'grids' (see GridRegistry), if given.
+    """
+
+    path = get_filename(ds)
+
+    if verbose:
+        print("Checking single zarr store: ", path)
+        print(ds)
+        print("\n\n")
+        print(ds.info())
+        print("\n\n")
+
+    data_vars = get_data_vars(ds)
+
+    if len(data_vars) > 1:
+        print("More than one valid data variable in zarr store")
+        return
+
+    if verbose:
+        print(data_vars[0])
+        print()
+
+    # Every statistic plotted below is computed in a single pass over the data, or read from the store
+    if isinstance(summaries, str):
+        summaries = SummaryStore(summaries)
+    summary = get_summary(ds, summaries, grids)
+    for _, fig in iter_figures(summary, path):
+        plt.show()
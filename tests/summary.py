@@ -0,0 +1,92 @@
+import xarray as xr
+from tests.utils import get_filename, is_raw_time, possible_spatial_dims
+from tests.grids import GridRegistry, LEVEL_DIMS, get_area_weights, get_weight_source, get_cell_measure_names, get_horizontal_dims
+
+
+def get_data_vars(ds: xr.Dataset) -> list[xr.DataArray]:
+    """
+    Returns the data variables of a dataset, ignoring all data variables that
+    are actually bounds or cell areas.
+    """
+    cell_measures = get_cell_measure_names(ds)
+    return [ds[var] for var in ds.data_vars if 'bnds' not in ds[var].dims and var not in cell_measures]
+
+
+def summarize_single(ds: xr.Dataset, grids: GridRegistry = None) -> xr.Dataset:
+    """
+    Computes the statistics shown by show_single() for the single data variable
+    in a dataset. All statistics are built as one lazy graph and evaluated with
+    a single compute, so a dask-backed variable is only read once instead of
+    once per plot. The result is small and does not depend on matplotlib, so
+    it can also be used for scripted QC.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        Dataset with exactly one data variable that is not a bounds or cell
+        area variable
+    grids : GridRegistry [optional, default=None]
+        Registry to take the area weights from, see get_area_weights()
+
+    Returns
+    -------
+    summary : xr.Dataset
+        Dataset containing the following variables:
+            spatial_mean: area-weighted mean over the spatial dimensions,
+                keeping time and all other dimensions (e.g. "member")
+            time_mean: mean over time and all non-horizontal dimensions
+            level_profile: mean over every dimension except the level
+                dimension (only present if there is one)
+            first_timestep, last_timestep: mean over all non-horizontal
+                dimensions for the first and last timestep
+        The attributes record the variable name, the source file, which
+        dimensions were treated as spatial, level and other dimensions, and
+        the source of the area weights ("weight_source", see
+        WEIGHT_SOURCES). If
+        the times were not decoded, their units and calendar are recorded as
+        "time_units" and "time_calendar".
+    """
+    data_vars = get_data_vars(ds)
+    if len(data_vars) != 1:
+        raise ValueError(f"Expected exactly one valid data variable, found {len(data_vars)}")
+    data = data_vars[0]
+
+    # The horizontal dimensions of curvilinear grids (e.g. "j", "i") are spatial as well
+    spatial_dims = [dim for dim in possible_spatial_dims if dim in data.dims]
+    spatial_dims += [dim for dim in get_horizontal_dims(ds) if dim in data.dims and dim not in spatial_dims]
+    other_dimensions = [dim for dim in data.dims if dim not in spatial_dims and dim != 'time']
+    level_dims = [dim for dim in LEVEL_DIMS if dim in spatial_dims][:1]
+
+    # Variables that are not backed by dask are read one combination of the other dimensions
+    # and one chunk of timesteps at a time, so that every statistic is a reduction over the
+    # original dimensions whose memory use is bounded by the chunk size, not the variable size
+    if data.chunks is None and 'time' in data.dims:
+        data = data.chunk({'time': 'auto', **{dim: 1 for dim in other_dimensions}})
+
+    # Area weighting for the spatial mean, built once per grid. Grids without cell areas or
+    # latitudes are averaged without weights.
+    weights = get_area_weights(ds, grids)
+    statistics = {
+        "spatial_mean": data.mean(dim=spatial_dims) if weights is None else data.weighted(weights).mean(dim=spatial_dims),
+        "time_mean": data.mean(dim=other_dimensions + ['time'] + level_dims),
+        # the scalar time coordinates would conflict with the time dimension of spatial_mean
+        "first_timestep": data.isel(time=0, drop=True).mean(dim=other_dimensions + level_dims),
+        "last_timestep": data.isel(time=-1, drop=True).mean(dim=other_dimensions + level_dims),
+    }
+    if len(level_dims) > 0:
+        statistics["level_profile"] = data.mean(dim=[dim for dim in data.dims if dim not in level_dims])
+
+    summary = xr.Dataset(statistics)
+    summary.attrs = {
+        "variable": str(data.name),
+        "source": get_filename(ds),
+        "spatial_dims": spatial_dims,
+        "other_dims": other_dimensions,
+        "level_dims": level_dims,
+        "weight_source": get_weight_source(ds, grids),
+    }
+    if is_raw_time(ds):
+        summary.attrs["time_units"] = ds.time.attrs["units"]
+        summary.attrs["time_calendar"] = ds.time.attrs.get("calendar", "standard")
+    # Dataset.compute() evaluates every lazy variable in one pass over the data
+    return summary.compute()
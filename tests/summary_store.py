@@ -0,0 +1,170 @@
+import os
+import json
+import hashlib
+import xarray as xr
+from tests.utils import open_path, get_basename, report_path_failures
+from tests.summary import summarize_single
+from tests.grids import GridRegistry, WEIGHT_SOURCES, get_weight_source
+from tests.cache import get_cache_key, normalize_path
+from tests.parallel import get_process_pool
+
+# Attributes of summarize_single() that hold lists, which netCDF attributes cannot round-trip
+LIST_ATTRS = ["spatial_dims", "other_dims", "level_dims"]
+
+
+class SummaryStore:
+    r"""
+    Directory of precomputed summaries (see summarize_single()), one small
+    netCDF file per dataset, so that show_single() and scripted QC can look
+    at a dataset again without reading all of its data. Each summary records
+    the cache key of its source (see tests.cache.get_cache_key(), i.e. the
+    size and modification time) and is only returned while that key is
+    unchanged. It also records the source of its area weights, so that it is
+    rebuilt once more accurate weights are available for its grid.
+
+    Parameters
+    ----------
+    directory : str [optional, default=".ramip_summaries"]
+        Directory the summaries are written to. Can be shared by everyone
+        looking at the same datasets.
+    """
+    def __init__(self, directory: str = ".ramip_summaries"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get_summary_path(self, path: str) -> str:
+        # The hash of the full path keeps datasets with the same file name apart
+        digest = hashlib.sha1(normalize_path(path).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{get_basename(path)}.{digest}.nc")
+
+    def get(self, path: str, weight_source: str = None) -> xr.Dataset:
+        """
+        Returns the stored summary of 'path', or None if there is none or the
+        source has changed since it was written. If 'weight_source' is given
+        (see WEIGHT_SOURCES), also None if the summary was computed with less
+        accurate area weights.
+        """
+        summary_path = self.get_summary_path(path)
+        if not os.path.exists(summary_path):
+            return None
+        try:
+            key = get_cache_key(path)
+        except OSError:
+            return None
+        with xr.open_dataset(summary_path, decode_times=False) as summary:
+            if summary.attrs.get("source_key") != key:
+                return None
+            # Summaries written before the weight source was recorded count as unweighted
+            stored_source = summary.attrs.get("weight_source", WEIGHT_SOURCES[0])
+            if weight_source is not None and WEIGHT_SOURCES.index(stored_source) < WEIGHT_SOURCES.index(weight_source):
+                return None
+            summary = summary.load()
+        # Summaries of raw times keep their units in the attributes, see format_time_axis()
+        if "time_units" not in summary.attrs:
+            summary = xr.decode_cf(summary)
+        for name in LIST_ATTRS:
+            summary.attrs[name] = json.loads(summary.attrs[name])
+        del summary.attrs["source_key"]
+        return summary
+
+    def put(self, path: str, summary: xr.Dataset, key: str = None) -> None:
+        """
+        Stores the summary of 'path' under 'key', the cache key of the source
+        when the summary was computed (by default its current key).
+        """
+        summary = summary.copy()
+        summary.attrs = {**summary.attrs, "source_key": get_cache_key(path) if key is None else key}
+        for name in LIST_ATTRS:
+            summary.attrs[name] = json.dumps(list(summary.attrs[name]))
+        # Written to a temporary file first, so that readers never see a partial summary
+        summary_path = self.get_summary_path(path)
+        temporary_path = f"{summary_path}.{os.getpid()}.tmp"
+        summary.to_netcdf(temporary_path)
+        os.replace(temporary_path, summary_path)
+
+    def invalidate(self, paths: list[str] | str = None) -> None:
+        """
+        Removes the stored summaries of the given paths, or every summary if
+        'paths' is None.
+        """
+        if paths is None:
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".nc")]
+        else:
+            paths = [self.get_summary_path(path) for path in ([paths] if isinstance(paths, str) else paths)]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def get_summary(ds: xr.Dataset, store: SummaryStore = None, grids: GridRegistry = None) -> xr.Dataset:
+    """
+    Returns the summary of an opened dataset (see summarize_single()), read
+    from 'store' if the dataset has not changed since it was stored there
+    and no more accurate area weights are available from 'grids', and
+    otherwise computed and stored.
+    """
+    if store is None:
+        return summarize_single(ds, grids)
+    path = ds.encoding["source"]
+    summary = store.get(path, get_weight_source(ds, grids))
+    if summary is None:
+        # The key is taken before reading the data, so a change while summarizing triggers a rebuild
+        key = get_cache_key(path)
+        summary = summarize_single(ds, grids)
+        store.put(path, summary, key)
+    return summary
+
+
+def summarize_path(path: str, directory: str, grids: GridRegistry = None) -> None:
+    # Runs inside the worker processes of write_summaries(). Without a registry, the weights can
+    # only come from the dataset itself, so an existing summary is used without opening it.
+    store = SummaryStore(directory)
+    if grids is None and store.get(path) is not None:
+        return
+    ds = open_path(path, decode_times=False)
+    try:
+        get_summary(ds, store, grids)
+    finally:
+        ds.close()
+
+
+def try_summarize_path(path: str, directory: str, grids: GridRegistry = None) -> Exception:
+    try:
+        summarize_path(path, directory, grids)
+    except Exception as err:
+        return err
+    return None
+
+
+def write_summaries(paths: list[str], store: SummaryStore | str, workers: int = 1, failures: dict = None,
+                    grids: GridRegistry = None) -> None:
+    """
+    Summarizes every dataset whose stored summary is missing or outdated, one
+    dataset per worker process, so that show_single() can later read the
+    summaries instead of the data.
+
+    Parameters
+    ----------
+    paths : list[str]
+        List of file paths to netCDF files or zarr stores
+    store : SummaryStore or str
+        Store, or directory of the store, to write the summaries to
+    workers : int [optional, default=1]
+        Number of worker processes
+    failures : dict[str, Exception] [optional, default=None]
+        If given, datasets that could not be summarized are recorded here.
+        Otherwise, a ValueError listing every failed path is raised.
+    grids : GridRegistry [optional, default=None]
+        Registry to take the area weights from, e.g. with the cell areas of
+        the grids added. Stored summaries computed with less accurate weights
+        are rebuilt.
+    """
+    directory = store.directory if isinstance(store, SummaryStore) else SummaryStore(store).directory
+    if workers > 1 and len(paths) > 1:
+        with get_process_pool(workers) as executor:
+            errors = list(executor.map(try_summarize_path, paths, [directory] * len(paths), [grids] * len(paths)))
+    else:
+        errors = [try_summarize_path(path, directory, grids) for path in paths]
+
+    path_failures = {path: err for path, err in zip(paths, errors) if err is not None}
+    report_path_failures(path_failures, paths, failures, "summarize")
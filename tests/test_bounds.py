@@ -0,0 +1,190 @@
+import xarray as xr
+import numpy as np
+from colorama import Fore, Style
+from tests.utils import find_wrong_datasets, find_different_datasets, get_indiv_check_msg, get_consensus_check_msg, get_filename, get_fact, get_array_digest, get_time_offsets, get_time_labels, record_event
+from tests.registry import Check, register_check, individual, consensus
+
+# Coordinates whose bounds are checked, and the horizontal ones among them that are compared across datasets
+BOUNDED_COORDS = ["time", "lat", "lon", "latitude", "longitude"]
+HORIZONTAL_COORDS = ["lat", "lon", "latitude", "longitude"]
+# Bounds variables without a "bounds" attribute on their coordinate are found by these suffixes
+BOUNDS_SUFFIXES = ["_bnds", "_bounds"]
+# Adjacent bounds may differ by this fraction of the typical cell width, e.g. from rounding
+BOUNDS_TOLERANCE = 1e-6
+# Problems that get_bounds_problems() looks for, with their descriptions
+BOUNDS_PROBLEMS = {
+    "non_positive": "cells with a zero or negative width",
+    "not_enclosed": "coordinate values outside of their cell",
+    "gaps": "gaps between a cell and the next",
+    "overlaps": "cells that overlap the next",
+}
+
+
+def get_bounds_name(ds: xr.Dataset, coord: str) -> str:
+    # Name of the bounds variable of a coordinate, or None if it has none
+    names = [ds[coord].attrs.get("bounds"), ds[coord].encoding.get("bounds")] + [coord + suffix for suffix in BOUNDS_SUFFIXES]
+    return next((name for name in names if name is not None and name in ds.variables), None)
+
+
+def get_bounds_values(ds: xr.Dataset, coord: str, name: str) -> tuple:
+    # The coordinate and its bounds as float64 arrays. Times are converted to offsets in seconds, see get_time_offsets().
+    if coord == 'time':
+        return get_time_offsets(ds), get_time_offsets(ds, name)
+    record_event("bytes_loaded", ds[coord].nbytes + ds[name].nbytes, get_filename(ds))
+    return np.asarray(ds[coord].values, dtype=np.float64), np.asarray(ds[name].values, dtype=np.float64)
+
+
+def find_bounds_problems(values: np.ndarray, bounds: np.ndarray, eps: float = 0) -> dict:
+    """
+    Finds, in one vectorized pass over a coordinate and its (n, 2) bounds,
+    the cells with a zero or negative width, the coordinate values outside of
+    their cell and the gaps and overlaps between adjacent cells. Widths are
+    measured in the direction of the coordinate, so decreasing coordinates
+    (e.g. latitudes from north to south) need decreasing bounds.
+
+    Returns
+    -------
+    problems : dict
+        Maps each key of BOUNDS_PROBLEMS to the indices of the cells with that
+        problem
+    """
+    lower, upper = bounds[:, 0], bounds[:, 1]
+    widths = upper - lower
+    if len(values) > 1 and values[-1] != values[0]:
+        direction = np.sign(values[-1] - values[0])
+    else:
+        direction = np.sign(np.nanmedian(widths)) or 1
+    widths = widths * direction
+    # Bounds are compared with a tolerance relative to the typical width and to the precision they are stored in
+    tolerance = BOUNDS_TOLERANCE * np.nanmedian(np.abs(widths)) + eps * np.nanmax(np.abs(bounds))
+    steps = (lower[1:] - upper[:-1]) * direction
+
+    problems = {
+        "non_positive": np.where(~(widths > 0))[0],
+        "not_enclosed": np.where(~((values >= np.minimum(lower, upper) - tolerance) & (values <= np.maximum(lower, upper) + tolerance)))[0],
+        "gaps": np.where(steps > tolerance)[0],
+        "overlaps": np.where(steps < -tolerance)[0],
+    }
+    return {problem: tuple(int(i) for i in indices) for problem, indices in problems.items()}
+
+
+def get_bounds_problems(ds: xr.Dataset) -> dict:
+    """
+    Validates the bounds of the time, latitude and longitude coordinates of a
+    dataset, see find_bounds_problems().
+
+    Returns
+    -------
+    problems : dict
+        Maps each coordinate with bounds to a dictionary with the name of its
+        "bounds" variable and either its unexpected "shape" or the indices of
+        each problem
+    """
+    problems = {}
+    for coord in BOUNDED_COORDS:
+        if coord not in ds.dims or coord not in ds.coords:
+            continue
+        name = get_bounds_name(ds, coord)
+        if name is None:
+            continue
+        shape = tuple(int(size) for size in ds[name].shape)
+        if shape != (ds.sizes[coord], 2):
+            problems[coord] = {"bounds": name, "shape": shape}
+            continue
+        values, bounds = get_bounds_values(ds, coord, name)
+        eps = np.finfo(ds[name].dtype).eps if np.issubdtype(ds[name].dtype, np.floating) else 0
+        problems[coord] = {"bounds": name, **find_bounds_problems(values, bounds, eps)}
+    return problems
+
+
+def check_bounds(ds1: xr.Dataset, verbose = False):
+    problems = get_fact(ds1, get_bounds_problems)
+    wrong = {coord: entry for coord, entry in problems.items() if "shape" in entry or any(len(entry[problem]) > 0 for problem in BOUNDS_PROBLEMS)}
+
+    if verbose and len(wrong) > 0:
+        print(Fore.CYAN + f"Bounds Check Err Output: " + Style.RESET_ALL)
+        print(f"Dataset {get_filename(ds1)}:")
+        for coord, entry in wrong.items():
+            if "shape" in entry:
+                print(f"{entry['bounds']} has shape {tuple(entry['shape'])}, expected ({ds1.sizes[coord]}, 2).")
+                continue
+            # Only the printed timestamps are decoded
+            labels = get_time_labels(ds1, [i for problem in BOUNDS_PROBLEMS for i in entry[problem][:10]]) if coord == 'time' else None
+            for problem, description in BOUNDS_PROBLEMS.items():
+                indices = entry[problem]
+                if len(indices) == 0:
+                    continue
+                print(f"{entry['bounds']} has {len(indices)} {description}. Here are the first {min(len(indices), 10)}:")
+                for index in indices[:10]:
+                    value = labels[index] if labels is not None else ds1[coord].values[index]
+                    lower, upper = ds1[entry['bounds']].values[index]
+                    print(f"{coord}={value}: {lower} to {upper} (index {index})")
+        print()
+    return len(wrong) == 0
+
+
+def test_bounds(datasets: list, verbose = False, checks = None, fail_fast = False) -> str:
+    wrong_datasets = find_wrong_datasets(datasets, check_bounds, verbose, fail_fast)
+    msgs = ["Coordinate bounds are not contiguous or do not enclose their coordinates.",
+            "Coordinate bounds are contiguous and enclose their coordinates."]
+    return get_indiv_check_msg(wrong_datasets, "Bounds Check", msgs, checks, len(datasets))
+
+
+def get_horizontal_bounds(ds: xr.Dataset) -> dict:
+    # Names of the bounds variables of the horizontal coordinates
+    names = {coord: get_bounds_name(ds, coord) for coord in HORIZONTAL_COORDS if coord in ds.dims and coord in ds.coords}
+    return {coord: name for coord, name in names.items() if name is not None}
+
+
+def get_bounds_fingerprint(ds: xr.Dataset) -> tuple:
+    # The horizontal bounds are loaded once per dataset and reduced to a digest
+    names = get_horizontal_bounds(ds)
+    record_event("bytes_loaded", sum(ds[name].nbytes for name in names.values()), get_filename(ds))
+    return tuple((coord, ds[name].shape, get_array_digest(ds[name].values)) for coord, name in names.items())
+
+
+def check_bounds_equiv(ds1: xr.Dataset, ds2: xr.Dataset, verbose = False):
+    names_1 = get_horizontal_bounds(ds1)
+    names_2 = get_horizontal_bounds(ds2)
+
+    if list(names_1) != list(names_2):
+        if verbose:
+            print(Fore.CYAN + f"Bounds Consensus Err Output: ")
+            print(f"Comparing majority opinion {get_filename(ds1)} with {get_filename(ds2)}")
+            print("The horizontal coordinates with bounds are not the same." + Style.RESET_ALL)
+            print(f"Dataset 1 bounds: {names_1}")
+            print(f"Dataset 2 bounds: {names_2}\n")
+        return False
+
+    for coord in names_1:
+        bounds_1 = ds1[names_1[coord]].values
+        bounds_2 = ds2[names_2[coord]].values
+        if bounds_1.shape != bounds_2.shape or not np.array_equal(bounds_1, bounds_2):
+            if verbose:
+                print(Fore.CYAN + f"Bounds Consensus Err Output: ")
+                print(f"Comparing majority opinion {get_filename(ds1)} with {get_filename(ds2)}")
+                if bounds_1.shape != bounds_2.shape:
+                    print(f"The {coord} bounds do not have the same shape." + Style.RESET_ALL)
+                    print(f"Dataset 1 shape: {bounds_1.shape}")
+                    print(f"Dataset 2 shape: {bounds_2.shape}\n")
+                else:
+                    print(f"The {coord} bounds do not have the same values. Here are the first 10 cells that are different: " + Style.RESET_ALL)
+                    for index in np.where((bounds_1 != bounds_2).any(axis=-1))[0][:10]:
+                        print(f"{bounds_1[index]} != {bounds_2[index]} (index {index})")
+                    print()
+            return False
+
+    return True
+
+
+def test_bounds_consensus(datasets: list, verbose = False, checks = None, fail_fast = False) -> str:
+    different_datasets, num_opinions = find_different_datasets(datasets, get_bounds_fingerprint, check_bounds_equiv, verbose, fail_fast)
+    msgs = ["Latitude and longitude bounds are not equivalent across all datasets.",
+            "Latitude and longitude bounds are equivalent across all datasets."]
+    return get_consensus_check_msg(different_datasets, "Bounds Consensus Check", msgs, checks, len(datasets), num_opinions)
+
+
+register_check(Check("Bounds Check", test_bounds, [get_bounds_problems], individual(check_bounds),
+                     option="check_bounds", order=65))
+register_check(Check("Bounds Consensus Check", test_bounds_consensus, [get_bounds_fingerprint], consensus(get_bounds_fingerprint, check_bounds_equiv),
+                     level="model", option="check_bounds", order=66))
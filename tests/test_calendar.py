@@ -1,30 +1,41 @@
 import xarray as xr
-from tests.utils import find_different_datasets, get_consensus_check_msg, get_filename
+from colorama import Fore, Style
+from tests.utils import find_different_datasets, get_consensus_check_msg, get_filename, get_time_attr
+from tests.registry import Check, register_check, consensus
+
+
+def get_calendar_fingerprint(ds: xr.Dataset):
+    # None if the time coordinate has no calendar attribute
+    return get_time_attr(ds, 'calendar')
 
 
 def check_calendar(ds1: xr.Dataset, ds2: xr.Dataset, verbose = False):
-    if 'calendar' not in ds1.time.encoding or 'calendar' not in ds2.time.encoding:
-        if 'calendar' not in ds1.time.encoding and 'calendar' not in ds2.time.encoding:
+    calendar1, calendar2 = get_time_attr(ds1, 'calendar'), get_time_attr(ds2, 'calendar')
+    if calendar1 is None or calendar2 is None:
+        if calendar1 is None and calendar2 is None:
             return True
         else:
-            no_calendar_ds = get_filename(ds1) if 'calendar' not in ds1.time.encoding else get_filename(ds2)
+            no_calendar_ds = get_filename(ds1) if calendar1 is None else get_filename(ds2)
             if verbose:
                 print(Fore.CYAN + "Calendar Check Err Output: " + Style.RESET_ALL)
                 print(f"Dataset {no_calendar_ds} has no calendar attribute.\n")
             return False
     
     if verbose: 
-        if ds1.time.encoding['calendar'] != ds2.time.encoding['calendar']:
+        if calendar1 != calendar2:
             print(Fore.CYAN + "Calendar Check Err Output: ")
             print(f"Comparing majority opinion {get_filename(ds1)} with {get_filename(ds2)}" + Style.RESET_ALL)
-            print(f"{ds1.time.encoding['calendar']} vs {ds2.time.encoding['calendar']}\n")
+            print(f"{calendar1} vs {calendar2}\n")
 
-    return ds1.time.encoding['calendar'] == ds2.time.encoding['calendar']
+    return calendar1 == calendar2
 
 
-def test_calendar(datasets: list, verbose = False, checks = None):  
-    different_datasets = find_different_datasets(datasets, check_calendar, verbose)
+def test_calendar(datasets: list, verbose = False, checks = None, fail_fast = False):  
+    different_datasets, num_opinions = find_different_datasets(datasets, get_calendar_fingerprint, check_calendar, verbose, fail_fast)
     msgs = ["Time coordinates do not use the same calendar across all datasets.", 
             "Time coordinates use the same calendar across all datasets."]
-    return get_consensus_check_msg(different_datasets, "Calendar Check", msgs, checks, len(datasets))
+    return get_consensus_check_msg(different_datasets, "Calendar Check", msgs, checks, len(datasets), num_opinions)
+
 
+register_check(Check("Calendar Check", test_calendar, [get_calendar_fingerprint], consensus(get_calendar_fingerprint, check_calendar),
+                     level="model", needs_time=True, option="check_calendar", order=30))
@@ -0,0 +1,102 @@
+import xarray as xr
+import numpy as np
+from colorama import Fore, Style
+from tests.utils import find_wrong_datasets, get_indiv_check_msg, get_filename, get_fact, get_spatial_dims
+from tests.registry import Check, register_check, individual
+
+# Reading the full time series of one gridpoint should not take more than this many chunks
+MAX_TIME_SERIES_CHUNKS = 100
+# Chunks smaller than this are mostly request overhead, e.g. one small map per timestep
+MIN_CHUNK_BYTES = 2**20
+
+
+def get_disk_chunks(var: xr.DataArray) -> tuple:
+    # Chunk shape on disk from the zarr ("chunks") or netCDF ("chunksizes") encoding. None if the
+    # variable is stored contiguously.
+    chunks = var.encoding.get("chunks") or var.encoding.get("chunksizes")
+    return None if chunks is None else tuple(int(chunk) for chunk in chunks)
+
+
+def get_chunk_layout(ds: xr.Dataset) -> dict:
+    """
+    Describes the on-disk chunk layout of every data variable with a time
+    dimension and estimates how much more has to be read than is needed
+    ("read amplification") for the two common access patterns: the full
+    time series of one gridpoint and the full map of one timestep.
+
+    Returns
+    -------
+    layout : dict
+        Maps each variable name to a dictionary with its "dims", "shape",
+        "chunks" (None if stored contiguously), "chunk_bytes", "num_chunks",
+        "time_series_chunks" and "time_series_amplification" (chunks read and
+        bytes read per byte needed for one time series) and "map_chunks" and
+        "map_amplification" (the same for one map)
+    """
+    spatial_dims = get_fact(ds, get_spatial_dims)
+    layout = {}
+    for name in ds.data_vars:
+        var = ds[name]
+        if 'time' not in var.dims or 'bnds' in var.dims:
+            continue
+        chunks = get_disk_chunks(var)
+        entry = {"dims": tuple(var.dims), "shape": tuple(int(size) for size in var.shape), "chunks": chunks}
+        if chunks is not None:
+            grid = [int(np.ceil(size / chunk)) for size, chunk in zip(var.shape, chunks)]
+            chunk_size = int(np.prod(chunks))
+            time_axis = var.dims.index('time')
+            map_axes = [i for i, dim in enumerate(var.dims) if dim in spatial_dims]
+            map_chunks = int(np.prod([grid[i] for i in map_axes]))
+            entry.update({
+                "chunk_bytes": chunk_size * var.dtype.itemsize,
+                "num_chunks": int(np.prod(grid)),
+                "time_series_chunks": grid[time_axis],
+                "time_series_amplification": grid[time_axis] * chunk_size / var.shape[time_axis],
+                "map_chunks": map_chunks,
+                "map_amplification": map_chunks * chunk_size / max(int(np.prod([var.shape[i] for i in map_axes])), 1),
+            })
+        layout[str(name)] = entry
+    return layout
+
+
+def get_layout_problems(layout: dict) -> list[str]:
+    # Descriptions of the variables whose chunk layout makes reading slow
+    problems = []
+    for name, entry in layout.items():
+        if entry["chunks"] is None:
+            continue
+        if entry["time_series_chunks"] > MAX_TIME_SERIES_CHUNKS:
+            problems.append(f"Reading the time series of one gridpoint of {name} reads {entry['time_series_chunks']} chunks "
+                            f"({entry['time_series_amplification']:.0f}x the bytes needed).")
+        elif entry["chunk_bytes"] < MIN_CHUNK_BYTES and entry["num_chunks"] > MAX_TIME_SERIES_CHUNKS:
+            problems.append(f"{name} is stored in {entry['num_chunks']} chunks of only {entry['chunk_bytes']} bytes.")
+    return problems
+
+
+def check_chunk_layout(ds1: xr.Dataset, verbose = False):
+    layout = get_fact(ds1, get_chunk_layout)
+    problems = get_layout_problems(layout)
+    if verbose and len(problems) > 0:
+        print(Fore.CYAN + f"Chunk Layout Check Err Output: " + Style.RESET_ALL)
+        print(f"Dataset {get_filename(ds1)}:")
+        for problem in problems:
+            print(problem)
+        for name, entry in layout.items():
+            if entry["chunks"] is None:
+                continue
+            print(f"{name}: dims {entry['dims']}, shape {entry['shape']}, chunks {entry['chunks']}, "
+                  f"map reads {entry['map_chunks']} chunks ({entry['map_amplification']:.1f}x)")
+        print("tests.rechunk.rechunk_store() writes a copy that is contiguous in time.\n")
+    return len(problems) == 0
+
+
+def test_chunk_layout(datasets: list, verbose = False, checks = None, fail_fast = False) -> str:
+    wrong_datasets = find_wrong_datasets(datasets, check_chunk_layout, verbose, fail_fast)
+    msgs = ["Chunk layouts make time series reads slow (too many or too small chunks).",
+            "Chunk layouts allow time series to be read in few chunks."]
+    return get_indiv_check_msg(wrong_datasets, "Chunk Layout Check", msgs, checks, len(datasets))
+
+
+# Only reads the metadata, but what counts as slow depends on how the data is used, so it is off by default
+register_check(Check("Chunk Layout Check", test_chunk_layout, [get_chunk_layout], individual(check_chunk_layout),
+                     option="check_chunks", default=False, order=90))
@@ -1,20 +1,49 @@
 import xarray as xr
-from tests.utils import find_wrong_datasets, get_indiv_check_msg, get_filename
-from datetime import timedelta
+from tests.utils import find_wrong_datasets, get_indiv_check_msg, get_filename, get_fact, get_time_offsets, get_time_labels
+from tests.registry import Check, register_check, individual
 import numpy as np
 from colorama import Fore, Style
 import collections
 
+def find_time_problems(offsets: np.ndarray, typical_step: float = None) -> tuple:
+    # Finds, in one vectorized pass over numeric time offsets, the indices where the time values
+    # decrease, the indices of duplicated time values, and the indices of irregular steps
+    if len(offsets) < 2:
+        return ((), (), ())
+
+    steps = np.diff(offsets)
+    violations = np.where(steps < 0)[0]
+
+    _, inverse, counts = np.unique(offsets, return_inverse=True, return_counts=True)
+    duplicates = np.where(counts[inverse] > 1)[0]
+
+    # Steps are compared to the typical step, so that e.g. months of different lengths are fine
+    # but a missing month (or an extra timestep in between) is flagged
+    positive_steps = steps[steps > 0]
+    irregular = np.array([], dtype=int)
+    if typical_step is None and len(positive_steps) > 0:
+        typical_step = np.median(positive_steps)
+    if typical_step is not None:
+        irregular = np.where((steps > 0) & ((steps > 1.5 * typical_step) | (steps < 0.5 * typical_step)))[0]
+
+    return tuple(tuple(int(i) for i in indices) for indices in [violations, duplicates, irregular])
+
+
+def get_time_facts(ds1: xr.Dataset) -> tuple:
+    # Decodes the time axis once and finds all the problems checked for below
+    return find_time_problems(get_time_offsets(ds1))
+
+
 def check_monotonic(ds1: xr.Dataset, verbose = False):
-    if verbose and (not ds1.time.to_index().is_monotonic_increasing or not ds1.time.to_index().is_unique): 
+    violations, duplicates, _ = get_fact(ds1, get_time_facts)
+
+    if verbose and (len(violations) > 0 or len(duplicates) > 0):
         print(Fore.CYAN + f"Monotonic Check Err Output: " + Style.RESET_ALL)
+        # Only the printed timestamps are decoded
+        times = get_time_labels(ds1, [i for index in violations[:10] for i in (index, index + 1)] + list(duplicates))
 
-        if not ds1.time.to_index().is_monotonic_increasing:
-            # Find list of non-increasing indices 
-            times = ds1.time.to_index()
-            differences = np.diff(times)
-            violations = list(np.where(differences < timedelta(0)))[0]
-            
+        if len(violations) > 0:
+            # Print the non-increasing indices
             if(len(violations) > 10):
                 print(Fore.CYAN + f"The time values for {get_filename(ds1)} dataset are not fully increasing. Here are the first 10 time steps that violate the monotonic increasing condition: "  + Style.RESET_ALL)
                 violations = violations[:10]
@@ -23,26 +52,56 @@ def check_monotonic(ds1: xr.Dataset, verbose = False):
             for index in violations:
                 print(f"{times[index]} -> {times[index+1]} (index {index} -> {index+1})")
             print()
-        if not ds1.time.to_index().is_unique:
-            duplicates = collections.defaultdict(list)
-            for i, time in enumerate(ds1.time.to_index()):
-                duplicates[time].append(i)
-            duplicates = [(k, v) for k, v in duplicates.items() if len(v) >= 2]
-            if(len(duplicates) > 10):
+        if len(duplicates) > 0:
+            grouped = collections.defaultdict(list)
+            for i in duplicates:
+                grouped[times[i]].append(i)
+            grouped = list(grouped.items())
+            if(len(grouped) > 10):
                 print(Fore.CYAN + f"The time values for {get_filename(ds1)} dataset are not unique. Here are the first 10 time steps that are not unique: "  + Style.RESET_ALL)
-                duplicates = duplicates[:10]
+                grouped = grouped[:10]
             else:
                 print(Fore.CYAN + f"The time values for {get_filename(ds1)} dataset are not unique. Here are the time steps that are not unique: "  + Style.RESET_ALL)
-            for k, v in duplicates:
+            for k, v in grouped:
                 print(f"{k} (indices {v})")
             print()
 
-    return ds1.time.to_index().is_monotonic_increasing and ds1.time.to_index().is_unique
+    return len(violations) == 0 and len(duplicates) == 0
+
+
+def check_time_steps(ds1: xr.Dataset, verbose = False):
+    _, _, irregular = get_fact(ds1, get_time_facts)
+
+    if verbose and len(irregular) > 0:
+        print(Fore.CYAN + f"Time Step Check Err Output: " + Style.RESET_ALL)
+        times = get_time_labels(ds1, [i for index in irregular[:10] for i in (index, index + 1)])
+        if(len(irregular) > 10):
+            print(Fore.CYAN + f"The time steps for {get_filename(ds1)} dataset are not regular. Here are the first 10 steps that are much longer or shorter than the typical step: "  + Style.RESET_ALL)
+            irregular = irregular[:10]
+        else:
+            print(Fore.CYAN + f"The time steps for {get_filename(ds1)} dataset are not regular. Here are the steps that are much longer or shorter than the typical step: "  + Style.RESET_ALL)
+        for index in irregular:
+            print(f"{times[index]} -> {times[index+1]} (index {index} -> {index+1})")
+        print()
 
+    return len(irregular) == 0
 
-def test_monotonic(datasets: list, verbose = False, checks = None) -> str:
-    wrong_datasets = find_wrong_datasets(datasets, check_monotonic, verbose)
+
+def test_monotonic(datasets: list, verbose = False, checks = None, fail_fast = False) -> str:
+    wrong_datasets = find_wrong_datasets(datasets, check_monotonic, verbose, fail_fast)
     msgs = ["Time coordinates are not strictly increasing.", 
             "Time coordinates are strictly increasing."]
     return get_indiv_check_msg(wrong_datasets, "Monotonic Check", msgs, checks, len(datasets))
 
+
+def test_time_steps(datasets: list, verbose = False, checks = None, fail_fast = False) -> str:
+    wrong_datasets = find_wrong_datasets(datasets, check_time_steps, verbose, fail_fast)
+    msgs = ["Time coordinates have irregular steps (e.g. missing timesteps).",
+            "Time coordinates have regular steps."]
+    return get_indiv_check_msg(wrong_datasets, "Time Step Check", msgs, checks, len(datasets))
+
+
+register_check(Check("Monotonic Check", test_monotonic, [get_time_facts], individual(check_monotonic),
+                     needs_time=True, option="check_monotonic", order=10))
+register_check(Check("Time Step Check", test_time_steps, [get_time_facts], individual(check_time_steps),
+                     needs_time=True, option="check_time_steps", order=20))
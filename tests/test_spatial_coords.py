@@ -1,13 +1,20 @@
 import xarray as xr
 import numpy as np
 from colorama import Fore, Style
-from tests.utils import find_different_datasets, get_consensus_check_msg, get_filename
+from tests.utils import find_different_datasets, get_consensus_check_msg, get_filename, get_array_digest, get_spatial_dims, get_fact, record_event
+from tests.registry import Check, register_check, consensus
+
+
+def get_spatial_coords_fingerprint(ds: xr.Dataset) -> tuple:
+    # The coordinate values are loaded once per dataset and reduced to a digest
+    spatial_dims = get_fact(ds, get_spatial_dims)
+    record_event("bytes_loaded", sum(ds[dim].nbytes for dim in spatial_dims), get_filename(ds))
+    return tuple((dim, ds[dim].shape, get_array_digest(ds[dim].values)) for dim in spatial_dims)
 
 
 def check_spatial_coords(ds1: xr.Dataset, ds2: xr.Dataset, verbose=False):
-    possible_spatial_dims = ["lat", "lon", "lev", "latitude", "longitude", "level"]
-    spatial_dims_1 = [dim for dim in possible_spatial_dims if dim in ds1.dims]
-    spatial_dims_2 = [dim for dim in possible_spatial_dims if dim in ds2.dims]
+    spatial_dims_1 = get_fact(ds1, get_spatial_dims)
+    spatial_dims_2 = get_fact(ds2, get_spatial_dims)
 
     if spatial_dims_1 != spatial_dims_2:
         if verbose: 
@@ -44,9 +51,12 @@ def check_spatial_coords(ds1: xr.Dataset, ds2: xr.Dataset, verbose=False):
     return True
 
 
-def test_spatial_coords(datasets: list, verbose = False, checks = None) -> str:
-    different_datasets = find_different_datasets(datasets, check_spatial_coords, verbose)
+def test_spatial_coords(datasets: list, verbose = False, checks = None, fail_fast = False) -> str:
+    different_datasets, num_opinions = find_different_datasets(datasets, get_spatial_coords_fingerprint, check_spatial_coords, verbose, fail_fast)
     msgs = ["Spatial coordinates are not equivalent across all datasets.", 
             "Spatial coordinates are equivalent across all datasets."]
-    return get_consensus_check_msg(different_datasets, "Spatial Coord Check", msgs, checks, len(datasets))
+    return get_consensus_check_msg(different_datasets, "Spatial Coord Check", msgs, checks, len(datasets), num_opinions)
+
 
+register_check(Check("Spatial Coord Check", test_spatial_coords, [get_spatial_coords_fingerprint], consensus(get_spatial_coords_fingerprint, check_spatial_coords),
+                     level="model", option="check_spatial_coords", order=60))
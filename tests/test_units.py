@@ -1,7 +1,14 @@
 import xarray as xr
 from colorama import Fore, Style
 from tests.utils import find_different_datasets, get_consensus_check_msg, get_filename
-from tests.test_variable_name import check_vars_same_name
+from tests.test_variable_name import check_vars_same_name, get_var_names_fingerprint
+from tests.registry import Check, register_check, consensus
+
+
+def get_units_fingerprint(ds: xr.Dataset) -> tuple:
+    # Datasets with different variable names always fail the units check, so the names are part of the fingerprint
+    units = tuple(sorted((var, ds[var].attrs.get('units')) for var in ds.data_vars if 'bnds' not in var))
+    return (get_var_names_fingerprint(ds), units)
 
 
 def check_units(ds1: xr.Dataset, ds2: xr.Dataset, verbose=False):
@@ -37,8 +44,11 @@ def check_units(ds1: xr.Dataset, ds2: xr.Dataset, verbose=False):
     return True
 
 
-def test_units(datasets: list, verbose = False, checks = None) -> str:
-    different_datasets = find_different_datasets(datasets, check_units, verbose)
+def test_units(datasets: list, verbose = False, checks = None, fail_fast = False) -> str:
+    different_datasets, num_opinions = find_different_datasets(datasets, get_units_fingerprint, check_units, verbose, fail_fast)
     msgs = ["Units are not equivalent across all datasets.", "Units are equivalent across all datasets."]
-    return get_consensus_check_msg(different_datasets, "Units Check", msgs, checks, len(datasets))
+    return get_consensus_check_msg(different_datasets, "Units Check", msgs, checks, len(datasets), num_opinions)
+
 
+register_check(Check("Units Check", test_units, [get_units_fingerprint], consensus(get_units_fingerprint, check_units),
+                     level="all", option="check_units", order=40))
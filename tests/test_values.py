@@ -0,0 +1,215 @@
+import base64
+import xarray as xr
+import numpy as np
+from colorama import Fore, Style
+from tests.utils import find_wrong_datasets, get_indiv_check_msg, get_consensus_check_msg, get_filename, get_fact, get_time_labels, record_event
+from tests.summary import get_data_vars
+from tests.registry import Check, register_check, individual
+
+# Values at least this large are fill values (CMIP uses 1e20) that were not declared as _FillValue
+FILL_THRESHOLD = 1e19
+# Timesteps whose mean is further than this many median absolute deviations from the median are spikes
+SPIKE_THRESHOLD = 10
+# Datasets whose mean magnitude differs from the median across datasets by more than this factor fail
+MAGNITUDE_FACTOR = 100
+# In sample mode, the value statistics are computed from this many randomly chosen time chunks
+SAMPLE_CHUNKS = 10
+SAMPLE_SEED = 0
+
+
+def get_sampled_steps(chunks: tuple, num_chunks: int, seed: int = SAMPLE_SEED) -> np.ndarray:
+    # Indices of the timesteps in 'num_chunks' randomly chosen time chunks, so that only those chunks are read
+    if len(chunks) <= num_chunks:
+        return np.arange(sum(chunks))
+    starts = np.cumsum((0,) + tuple(chunks))
+    chosen = np.sort(np.random.default_rng(seed).choice(len(chunks), num_chunks, replace=False))
+    return np.concatenate([np.arange(starts[i], starts[i + 1]) for i in chosen])
+
+
+def pack_array(values: np.ndarray) -> tuple:
+    # Per-timestep arrays are kept in the facts as base64 text, which is compact both in memory and in the cache
+    return (values.dtype.str, base64.b64encode(np.ascontiguousarray(values).tobytes()).decode())
+
+
+def unpack_array(packed: tuple) -> np.ndarray:
+    dtype, text = packed
+    return np.frombuffer(base64.b64decode(text), dtype=dtype)
+
+
+def compute_value_stats(ds: xr.Dataset, sample_chunks: int = None, seed: int = SAMPLE_SEED) -> dict:
+    # Per-timestep statistics for every data variable, computed in one chunked pass so that memory
+    # use is bounded by the chunk size. Only dataset-level statistics, flagged timesteps and the
+    # extrema of each timestep (to compare with the valid ranges of a run) are kept.
+    stats = {}
+    for data in get_data_vars(ds):
+        if 'time' not in data.dims:
+            data = data.expand_dims('time')
+        if data.chunks is None:
+            data = data.chunk({'time': 'auto'})
+        num_steps = data.sizes['time']
+        steps = np.arange(num_steps)
+        if sample_chunks is not None:
+            steps = get_sampled_steps(data.chunks[data.get_axis_num('time')], sample_chunks, seed)
+            data = data.isel(time=steps)
+        dims = [dim for dim in data.dims if dim != 'time']
+
+        reductions = xr.Dataset({
+            "count": data.count(dim=dims),
+            "min": data.min(dim=dims),
+            "max": data.max(dim=dims),
+            "mean": data.mean(dim=dims),
+            "abs_mean": abs(data).mean(dim=dims),
+        }).compute()
+        record_event("bytes_loaded", data.nbytes, get_filename(ds))
+
+        count = reductions["count"].values
+        mean = reductions["mean"].values
+        valid = count > 0
+        all_nan_steps = np.where(~valid)[0]
+        fill_steps = np.where((reductions["max"].values >= FILL_THRESHOLD) | (reductions["min"].values <= -FILL_THRESHOLD))[0]
+
+        spike_steps = np.array([], dtype=int)
+        if valid.sum() > 2:
+            median = np.median(mean[valid])
+            deviation = np.median(np.abs(mean[valid] - median))
+            if deviation > 0:
+                spike_steps = np.where(valid & (np.abs(mean - median) > SPIKE_THRESHOLD * deviation))[0]
+
+        # The extrema of float32 data are exact in float32. Timesteps that were not sampled are NaN.
+        extrema_dtype = np.float32 if data.dtype == np.float32 else np.float64
+        step_min, step_max = np.full(num_steps, np.nan, dtype=extrema_dtype), np.full(num_steps, np.nan, dtype=extrema_dtype)
+        step_min[steps], step_max[steps] = reductions["min"].values, reductions["max"].values
+
+        total = int(count.sum())
+        stats[str(data.name)] = {
+            "min": float(np.nanmin(reductions["min"].values)) if total > 0 else None,
+            "max": float(np.nanmax(reductions["max"].values)) if total > 0 else None,
+            "mean": float((mean[valid] * count[valid]).sum() / total) if total > 0 else None,
+            "abs_mean": float((reductions["abs_mean"].values[valid] * count[valid]).sum() / total) if total > 0 else None,
+            "all_nan_steps": tuple(int(steps[i]) for i in all_nan_steps),
+            "fill_steps": tuple(int(steps[i]) for i in fill_steps),
+            "spike_steps": tuple(int(steps[i]) for i in np.setdiff1d(spike_steps, fill_steps)),
+            "step_min": pack_array(step_min),
+            "step_max": pack_array(step_max),
+        }
+    return stats
+
+
+def get_value_stats(ds: xr.Dataset) -> dict:
+    return compute_value_stats(ds)
+
+
+class SampledValueStats:
+    r"""
+    Fact with the statistics of get_value_stats() from SAMPLE_CHUNKS time
+    chunks chosen with 'seed'. Each seed is a separate fact, named after it,
+    so statistics of one sample are never mistaken for those of another
+    sample or of the whole dataset, e.g. in the cache.
+    """
+    def __init__(self, seed: int = SAMPLE_SEED):
+        self.seed = seed
+        self.__name__ = f"get_sampled_value_stats_{seed}"
+
+    def __call__(self, ds: xr.Dataset) -> dict:
+        return compute_value_stats(ds, SAMPLE_CHUNKS, self.seed)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SampledValueStats) and other.seed == self.seed
+
+    def __hash__(self) -> int:
+        return hash(self.__name__)
+
+
+def get_value_stats_fact(sample: bool = False, seed: int = SAMPLE_SEED):
+    # The fact the value checks read in a run with or without sampling
+    return SampledValueStats(seed) if sample else get_value_stats
+
+
+def print_steps(ds1: xr.Dataset, steps: tuple, msg: str):
+    if 'time' in ds1.dims:
+        times = get_time_labels(ds1, steps[:10])
+        labels = [f"{times[i]} (index {i})" for i in steps[:10]]
+    else:
+        labels = [f"index {i}" for i in steps[:10]]
+    first = "the first 10" if len(steps) > 10 else "the"
+    print(Fore.CYAN + f"{msg} Here are {first} time steps affected: " + Style.RESET_ALL)
+    for label in labels:
+        print(label)
+
+
+def check_values(ds1: xr.Dataset, verbose = False, valid_ranges: dict = None, sample: bool = False, seed: int = SAMPLE_SEED):
+    stats = get_fact(ds1, get_value_stats_fact(sample, seed))
+    valid_ranges = {} if valid_ranges is None else valid_ranges
+
+    passed = True
+    for var, var_stats in stats.items():
+        problems = []
+        if len(var_stats["all_nan_steps"]) > 0:
+            problems.append((var_stats["all_nan_steps"], f"{var} is entirely NaN at {len(var_stats['all_nan_steps'])} time steps."))
+        if len(var_stats["fill_steps"]) > 0:
+            problems.append((var_stats["fill_steps"], f"{var} contains fill values (magnitude >= {FILL_THRESHOLD:g}) that are not masked at {len(var_stats['fill_steps'])} time steps."))
+        if len(var_stats["spike_steps"]) > 0:
+            problems.append((var_stats["spike_steps"], f"{var} has spikes in its mean at {len(var_stats['spike_steps'])} time steps."))
+        if var in valid_ranges and var_stats["min"] is not None:
+            low, high = valid_ranges[var]
+            step_min, step_max = unpack_array(var_stats["step_min"]), unpack_array(var_stats["step_max"])
+            range_steps = tuple(int(i) for i in np.where((step_min < low) | (step_max > high))[0])
+            if len(range_steps) > 0:
+                problems.append((range_steps, f"{var} has values outside of the valid range [{low:g}, {high:g}] at {len(range_steps)} time steps (from {var_stats['min']:g} to {var_stats['max']:g} overall)."))
+
+        if len(problems) > 0:
+            passed = False
+            if verbose:
+                print(Fore.CYAN + f"Value Check Err Output: " + Style.RESET_ALL)
+                print(f"Dataset {get_filename(ds1)}:")
+                for steps, msg in problems:
+                    print_steps(ds1, steps, msg)
+                print()
+    return passed
+
+
+def find_magnitude_outliers(datasets: list, verbose = False, sample: bool = False, seed: int = SAMPLE_SEED) -> list:
+    # Datasets whose mean magnitude is far from the median of all datasets, e.g. because of a unit scaling error
+    magnitudes = {}
+    for ds in datasets:
+        for var, var_stats in get_fact(ds, get_value_stats_fact(sample, seed)).items():
+            if var_stats["abs_mean"] is not None:
+                magnitudes.setdefault(var, []).append((ds, var_stats["abs_mean"]))
+
+    different_datasets = []
+    for var, values in magnitudes.items():
+        median = np.median([value for _, value in values])
+        if median == 0:
+            continue
+        for ds, value in values:
+            ratio = value / median
+            if ratio > MAGNITUDE_FACTOR or ratio < 1 / MAGNITUDE_FACTOR:
+                if verbose:
+                    print(Fore.CYAN + f"Value Magnitude Check Err Output: " + Style.RESET_ALL)
+                    print(f"The mean magnitude of {var} in {get_filename(ds)} is {value:g}, {ratio:g} times the median across all datasets ({median:g}).\n")
+                if not any(ds is other for other in different_datasets):
+                    different_datasets.append(ds)
+    return different_datasets
+
+
+def test_values(datasets: list, verbose = False, checks = None, fail_fast = False, valid_ranges: dict = None, sample: bool = False, seed: int = SAMPLE_SEED) -> str:
+    wrong_datasets = find_wrong_datasets(datasets, lambda ds, verbose: check_values(ds, verbose, valid_ranges, sample, seed), verbose, fail_fast)
+    msgs = ["Data values contain all-NaN time steps, unmasked fill values, spikes or out-of-range values.",
+            "Data values contain no all-NaN time steps, unmasked fill values, spikes or out-of-range values."]
+    return get_indiv_check_msg(wrong_datasets, "Value Check", msgs, checks, len(datasets))
+
+
+def test_value_magnitudes(datasets: list, verbose = False, checks = None, fail_fast = False, sample: bool = False, seed: int = SAMPLE_SEED) -> str:
+    different_datasets = find_magnitude_outliers(datasets, verbose, sample, seed)
+    msgs = [f"Data values differ in magnitude by more than a factor of {MAGNITUDE_FACTOR} across datasets.",
+            "Data values have similar magnitudes across all datasets."]
+    return get_consensus_check_msg(different_datasets, "Value Magnitude Check", msgs, checks, len(datasets))
+
+
+# Both value checks read every data value once, in chunks, so they are off by default
+register_check(Check("Value Check", test_values, [get_value_stats], individual(check_values),
+                     option="check_values", default=False, parameters=["valid_ranges", "sample", "seed"],
+                     sampled_facts=lambda seed: [SampledValueStats(seed)], order=70))
+register_check(Check("Value Magnitude Check", test_value_magnitudes, [get_value_stats], find_magnitude_outliers,
+                     level="all", option="check_values", default=False, parameters=["sample", "seed"],
+                     sampled_facts=lambda seed: [SampledValueStats(seed)], order=80))
@@ -1,6 +1,11 @@
 import xarray as xr
 from colorama import Fore, Style
 from tests.utils import find_different_datasets, get_consensus_check_msg, get_filename
+from tests.registry import Check, register_check, consensus
+
+
+def get_var_names_fingerprint(ds: xr.Dataset) -> tuple:
+    return tuple(ds.data_vars.keys())
 
 
 def check_vars_same_name(ds1: xr.Dataset, ds2: xr.Dataset, verbose: bool) -> bool:
@@ -23,7 +28,11 @@ def check_vars_same_name(ds1: xr.Dataset, ds2: xr.Dataset, verbose: bool) -> boo
     return True
 
 
-def test_variable_name(datasets: list, verbose = False, checks = None) -> str:
-    different_datasets = find_different_datasets(datasets, check_vars_same_name, verbose)
+def test_variable_name(datasets: list, verbose = False, checks = None, fail_fast = False) -> str:
+    different_datasets, num_opinions = find_different_datasets(datasets, get_var_names_fingerprint, check_vars_same_name, verbose, fail_fast)
     msgs = ["Variables do not have the same name across all datasets.", "Variables have the same name across all datasets."]
-    return get_consensus_check_msg(different_datasets, "Var Name Check", msgs, checks, len(datasets))
+    return get_consensus_check_msg(different_datasets, "Var Name Check", msgs, checks, len(datasets), num_opinions)
+
+
+register_check(Check("Var Name Check", test_variable_name, [get_var_names_fingerprint], consensus(get_var_names_fingerprint, check_vars_same_name),
+                     level="all", option="check_variable_name", order=50))
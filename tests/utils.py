@@ -1,13 +1,43 @@
 import xarray
 import numpy as np
+import hashlib
 from colorama import Fore, Style
 from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from tests.results import CheckResult, CheckResults
+import json
+import time
+import glob
+import random
+import collections
+
+possible_spatial_dims = ["lat", "lon", "lev", "latitude", "longitude", "level"]
+
+# Length in seconds of the CF time units that have a fixed length
+TIME_UNIT_SECONDS = {
+    "seconds": 1, "second": 1, "secs": 1, "sec": 1, "s": 1,
+    "minutes": 60, "minute": 60, "mins": 60, "min": 60,
+    "hours": 3600, "hour": 3600, "hrs": 3600, "hr": 3600, "h": 3600,
+    "days": 86400, "day": 86400, "d": 86400,
+}
 
 
 class Logger:
+    r"""
+    Records profiling events (wall time, dataset open time, bytes loaded, 
+    number of check_equiv calls, ...) while the checks run. Events are 
+    recorded against the check that is currently being timed with 
+    Logger.timer() and, where known, the dataset they belong to.
+
+    A logger only records events while it is the active logger, see 
+    set_logger(). Instrumented code calls record_event(), which does nothing 
+    when no logger is active, so profiling is free when it is not enabled.
+    """
     def __init__(self):
         self.__logs = []
+        self.__checks = []
 
     def log(self, msg):
         self.__logs.append(msg)
@@ -15,84 +45,515 @@ class Logger:
     def getLogs(self):
         return self.__logs
 
-def find_majority_ds(datasets: list[xarray.Dataset], check_equiv: Callable, verbose: bool) -> int: 
+    def record(self, event: str, value: float, dataset: str = None, check: str = None):
+        if check is None:
+            check = self.__checks[-1] if len(self.__checks) > 0 else "other"
+        self.log({"check": check, "dataset": dataset, "event": event, "value": value})
+
+    @contextmanager
+    def timer(self, check: str, event: str = "wall_time", dataset: str = None):
+        self.__checks.append(check)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.__checks.pop()
+            self.record(event, time.perf_counter() - start, dataset, check)
+
+    def getTotals(self, by_dataset: bool = False) -> dict:
+        r"""
+        Sums the recorded events per check (and per dataset if by_dataset is 
+        True). Returns a dictionary mapping check names, or (check, dataset) 
+        pairs, to a dictionary of event totals.
+        """
+        totals = {}
+        for entry in self.__logs:
+            if not isinstance(entry, dict):
+                continue
+            key = (entry["check"], entry["dataset"]) if by_dataset else entry["check"]
+            event_totals = totals.setdefault(key, {})
+            event_totals[entry["event"]] = event_totals.get(entry["event"], 0) + entry["value"]
+        return totals
+
+    def getTable(self) -> str:
+        r"""
+        Returns the per-check totals formatted as a table.
+        """
+        totals = self.getTotals()
+        events = ["wall_time", "open_time", "fact_time", "bytes_loaded", "fact_computations", "check_equiv_calls"]
+        rows = [["check"] + events]
+        for check, event_totals in totals.items():
+            rows.append([check] + [f"{event_totals.get(event, 0):.3f}" if event.endswith("time") else str(int(event_totals.get(event, 0))) for event in events])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+    def dumpJSON(self, path: str):
+        r"""
+        Writes the recorded events and the per-check and per-dataset totals 
+        to a JSON file, e.g. for tracking timings over time.
+        """
+        by_dataset = [{"check": check, "dataset": dataset, **event_totals} for (check, dataset), event_totals in self.getTotals(by_dataset=True).items()]
+        with open(path, "w") as f:
+            json.dump({"totals": self.getTotals(), "by_dataset": by_dataset,
+                       "events": [entry for entry in self.__logs if isinstance(entry, dict)]}, f, indent=2)
+
+
+_active_logger = None
+
+
+def set_logger(logger: Logger) -> Logger:
+    r"""
+    Makes 'logger' the active logger that instrumented code records events 
+    to. Pass None to stop profiling. Returns the previously active logger.
+    """
+    global _active_logger
+    previous = _active_logger
+    _active_logger = logger
+    return previous
+
+
+def get_logger() -> Logger:
+    return _active_logger
+
+
+@contextmanager
+def time_check(check: str):
+    r"""
+    Times the enclosed block as 'check' on the active logger, if there is one.
+    """
+    if _active_logger is None:
+        yield
+    else:
+        with _active_logger.timer(check):
+            yield
+
+
+def record_event(event: str, value: float, dataset: str = None):
+    if _active_logger is not None:
+        _active_logger.record(event, value, dataset)
+
+
+_active_errors = None
+
+
+@contextmanager
+def collect_errors():
+    r"""
+    Collects the errors recorded with record_error() in the enclosed block
+    into the yielded dictionary, from the path of each dataset to its error.
+    """
+    global _active_errors
+    previous = _active_errors
+    _active_errors = {}
+    try:
+        yield _active_errors
+    finally:
+        _active_errors = previous
+
+
+def record_error(ds: xarray.Dataset, err: Exception):
+    # A dataset that made a check raise fails that check, and the error is kept for the report
+    if _active_errors is not None:
+        _active_errors[get_source(ds)] = f"{type(err).__name__}: {err}"
+
+
+class HandlePool:
     r"""
-    Determines the majority result from 'check_equiv' for a list of xarray
-    Datasets using the Boyer–Moore majority vote algorithm.
+    Least recently used pool of open datasets. DatasetHandles that use a pool 
+    register with it whenever their dataset is accessed, and the pool closes 
+    the datasets of the least recently used handles once more than 
+    'max_open' are open. A closed handle reopens its dataset transparently 
+    the next time it is accessed, so the number of open files (and their 
+    HDF5 metadata caches) stays bounded however many paths are checked.
 
     Parameters
     ----------
-    datasets : list[xarray.Dataset]
-        List of xarray Datasets to run 'check_equiv' on and compare results for
-    check_equiv : Callable
-        Function to run using datasets in 'datasets' as input.
-    verbose : bool
-        Whether or not to print full output.
+    max_open : int [optional, default=128]
+        Maximum number of datasets kept open at the same time. Must be at 
+        least 2, since the consensus checks compare datasets in pairs.
+    """
+    def __init__(self, max_open: int = 128):
+        if max_open < 2:
+            raise ValueError(f"A HandlePool needs to keep at least 2 datasets open, got max_open={max_open}")
+        self.max_open = max_open
+        self.handles = collections.OrderedDict()
+
+    def touch(self, handle) -> None:
+        """
+        Marks 'handle' as the most recently used and closes the least recently 
+        used datasets if too many are open.
+        """
+        self.handles[id(handle)] = handle
+        self.handles.move_to_end(id(handle))
+        while len(self.handles) > self.max_open:
+            _, oldest = self.handles.popitem(last=False)
+            oldest.close()
+
+    def discard(self, handle) -> None:
+        self.handles.pop(id(handle), None)
+
+    def close(self) -> None:
+        """
+        Closes every dataset that is still open.
+        """
+        for handle in list(self.handles.values()):
+            handle.close()
+
+    def __len__(self) -> int:
+        return len(self.handles)
+
+
+class DatasetHandle:
+    r"""
+    Lightweight stand-in for an xarray Dataset that holds its path and the 
+    facts (fingerprints, check results) already known about it. The checks 
+    can use a handle wherever they use a dataset: facts are looked up with 
+    get_fact(), and anything else opens the underlying dataset on demand.
+
+    Parameters
+    ----------
+    path : str
+        Path to the netCDF file or zarr store
+    facts : dict [optional, default=None]
+        Facts already known about the dataset, keyed by fact function name
+    ds : xarray.Dataset [optional, default=None]
+        The already opened dataset, if any
+    header_only : bool [optional, default=False]
+        Passed to open_path() when the dataset is opened on demand
+    pool : HandlePool [optional, default=None]
+        If given, the dataset is closed whenever the pool evicts the handle 
+        and reopened on the next access
+    """
+    def __init__(self, path: str, facts: dict = None, ds: xarray.Dataset = None, header_only: bool = False, pool: HandlePool = None):
+        self.path = path
+        self.facts = {} if facts is None else facts
+        self.header_only = header_only
+        self.pool = pool
+        self._ds = ds
+        if ds is not None and pool is not None:
+            pool.touch(self)
+
+    @property
+    def ds(self) -> xarray.Dataset:
+        if self._ds is None:
+            self._ds = open_path(self.path, self.header_only)
+        if self.pool is not None:
+            self.pool.touch(self)
+        return self._ds
+
+    def close(self) -> None:
+        """
+        Closes the underlying dataset, if it is open. The facts are kept and 
+        the dataset is reopened if it is needed again.
+        """
+        if self.pool is not None:
+            self.pool.discard(self)
+        if self._ds is not None:
+            ds, self._ds = self._ds, None
+            ds.close()
+
+    @property
+    def encoding(self) -> dict:
+        if self._ds is None:
+            return {"source": self.path}
+        return self._ds.encoding
+
+    def __getattr__(self, name):
+        # Only called for attributes not defined on the handle itself
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.ds, name)
+
+    def __getitem__(self, key):
+        return self.ds[key]
+
+    def __contains__(self, key):
+        return key in self.ds
+
+
+def get_fact(ds: xarray.Dataset, fact: Callable):
+    r"""
+    Returns the value of 'fact' for a dataset, reusing the value stored on a 
+    DatasetHandle if it has already been computed (or loaded from a cache).
+
+    Parameters
+    ----------
+    ds : xarray.Dataset or DatasetHandle
+        Dataset to compute the fact for
+    fact : Callable
+        Function that takes a single dataset and returns a hashable value, 
+        e.g. a check's fingerprint function
 
     Returns
     -------
-    majority_ds : xarray.Dataset
-        Dataset that produces majority result from 'check_equiv'. Returns None 
-        if no majority is found.
+    value
+        The value of fact(ds)
     """
-    majority_ds = None
-    counter = 0
+    if isinstance(ds, DatasetHandle) and fact.__name__ in ds.facts:
+        return ds.facts[fact.__name__]
 
-    for ds in datasets:
-        if counter == 0:
-            majority_ds = ds
-            counter += 1
-            continue
+    start = time.perf_counter()
+    value = fact(ds)
+    if _active_logger is not None:
+        record_event("fact_time", time.perf_counter() - start, get_filename(ds))
+        record_event("fact_computations", 1, get_filename(ds))
+
+    if isinstance(ds, DatasetHandle):
+        ds.facts[fact.__name__] = value
+    return value
+
+
+def get_spatial_dims(ds: xarray.Dataset) -> tuple:
+    """
+    Returns the dimensions of a dataset that are in possible_spatial_dims, in
+    the order they are listed there.
+    """
+    return tuple(dim for dim in possible_spatial_dims if dim in ds.dims)
 
-        if check_equiv(majority_ds, ds, False):
-            counter += 1
-        else:
-            counter -= 1
 
-    # count if majority_ds is actually the majority 
-    counter = 0
+def has_time_dim(ds: xarray.Dataset) -> bool:
+    return 'time' in ds.dims
+
+
+def get_time_attr(ds: xarray.Dataset, name: str):
+    # Decoded times keep their units and calendar in the encoding, raw times in the attributes
+    return ds.time.encoding.get(name, ds.time.attrs.get(name))
+
+
+def is_raw_time(ds: xarray.Dataset) -> bool:
+    """
+    Returns whether the time coordinate of a dataset was opened without
+    decoding (decode_times=False), i.e. is numeric with CF "<unit> since
+    <date>" units.
+    """
+    return np.issubdtype(ds.time.dtype, np.number) and " since " in str(ds.time.attrs.get("units", ""))
+
+
+def get_time_labels(ds: xarray.Dataset, indices: list[int]) -> dict:
+    """
+    Returns the timestamps at the given indices of the time coordinate, for
+    error messages and plot labels. Raw times are decoded only at these
+    indices, never along the whole time axis.
+    """
+    indices = sorted(set(int(i) for i in indices))
+    if len(indices) == 0:
+        return {}
+    if is_raw_time(ds):
+        import cftime
+        values = ds.time.values[indices]
+        dates = cftime.num2date(values, ds.time.attrs["units"], ds.time.attrs.get("calendar", "standard"))
+        return dict(zip(indices, dates))
+    times = ds.time.to_index()
+    return {i: times[i] for i in indices}
+
+
+def get_time_offsets(ds: xarray.Dataset, name: str = 'time') -> np.ndarray:
+    r"""
+    Converts the time coordinate of a dataset to numeric offsets in seconds 
+    since 1970-01-01 so that it can be analysed with vectorized NumPy 
+    operations, regardless of whether it was decoded to numpy datetimes or to 
+    cftime objects for a non-standard calendar (noleap, 360_day, ...). Raw 
+    times (see is_raw_time()) are scaled and shifted without decoding any 
+    timestamp but the reference date of their units.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Dataset with a 'time' coordinate
+    name : str [optional, default='time']
+        Variable to convert, e.g. the time bounds. It is stored in the units
+        and calendar of the time coordinate, as CF requires for bounds.
+
+    Returns
+    -------
+    offsets : np.ndarray
+        Float64 array of seconds since 1970-01-01 in the dataset's calendar
+    """
+    values = ds[name].values
+    record_event("bytes_loaded", values.nbytes, get_filename(ds))
+    units = str(get_time_attr(ds, "units"))
+    if np.issubdtype(values.dtype, np.number) and " since " in units:
+        # Raw times, or bounds that were not decoded along with a decoded time coordinate
+        import cftime
+        calendar = get_time_attr(ds, "calendar") or "standard"
+        unit = units.split(" since ")[0].strip().lower()
+        if unit in TIME_UNIT_SECONDS:
+            reference = cftime.date2num(cftime.num2date(0, units, calendar), "seconds since 1970-01-01", calendar=calendar)
+            return values.astype(np.float64) * TIME_UNIT_SECONDS[unit] + float(reference)
+        # Units without a fixed length (e.g. "months since") have to be decoded
+        values = cftime.num2date(values, units, calendar)
+        return np.asarray(cftime.date2num(values, "seconds since 1970-01-01", calendar=calendar), dtype=np.float64)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[ns]").astype(np.int64) / 1e9
+    if values.dtype == object and values.size > 0:
+        import cftime
+        return np.asarray(cftime.date2num(values, "seconds since 1970-01-01", calendar=values.flat[0].calendar), dtype=np.float64)
+    return np.asarray(values, dtype=np.float64)
+
+
+def get_array_digest(values: np.ndarray) -> str:
+    r"""
+    Computes a digest of an array's shape and values so that arrays can be
+    compared by hashing instead of element by element.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Array to compute the digest for. Numeric arrays are cast to float64 
+        so that, e.g., float32 and float64 copies of the same values match.
+
+    Returns
+    -------
+    digest : str
+        Hex digest of the array
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.number):
+        values = values.astype(np.float64)
+    else:
+        values = values.astype(str)
+    digest = hashlib.sha1(str(values.shape).encode())
+    digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+def group_datasets(datasets: list[xarray.Dataset], fingerprint: Callable) -> dict:
+    r"""
+    Groups datasets by the value 'fingerprint' returns for them. Every 
+    dataset is fingerprinted exactly once and grouped in a single pass.
+
+    Parameters
+    ----------
+    datasets : list[xarray.Dataset]
+        List of xarray Datasets to group
+    fingerprint : Callable
+        Function that takes a single dataset and returns a hashable value. Two 
+        datasets are considered equivalent if their fingerprints are equal.
+
+    Returns
+    -------
+    groups : dict
+        Maps each distinct fingerprint (or "opinion") to the list of datasets 
+        that produced it, in the order the fingerprints were first seen. 
+        Datasets whose fingerprint raises hold no opinion and are left out, 
+        see record_error().
+    """
+    groups = {}
     for ds in datasets:
-        if check_equiv(majority_ds, ds, verbose):
-            counter += 1
-            
-    if counter <= len(datasets) / 2:
+        try:
+            groups.setdefault(get_fact(ds, fingerprint), []).append(ds)
+        except Exception as err:
+            record_error(ds, err)
+    return groups
+
+
+def find_majority_ds(datasets: list[xarray.Dataset], fingerprint: Callable) -> xarray.Dataset: 
+    r"""
+    Determines the dataset that holds the majority opinion, i.e. the dataset
+    whose fingerprint is shared by more than half of the datasets.
+
+    Parameters
+    ----------
+    datasets : list[xarray.Dataset]
+        List of xarray Datasets to fingerprint and compare
+    fingerprint : Callable
+        Function that takes a single dataset and returns a hashable value.
+
+    Returns
+    -------
+    majority_ds : xarray.Dataset
+        Dataset that produces the majority fingerprint. Returns None if no 
+        majority is found.
+    """
+    groups = group_datasets(datasets, fingerprint)
+    if len(groups) == 0:
         return None
 
-    return majority_ds
+    largest_group = max(groups.values(), key=len)
+    if len(largest_group) <= len(datasets) / 2:
+        return None
+
+    return largest_group[0]
 
 
-def find_different_datasets(datasets: list[xarray.Dataset], check_equiv: Callable, verbose: bool) -> list:
+def find_different_datasets(datasets: list[xarray.Dataset], fingerprint: Callable, check_equiv: Callable, verbose: bool, fail_fast: bool = False) -> tuple:
     r"""
-    Finds datasets that return a value from 'check_equiv' that is different
-    from the majority. Used for consensus checks. 
+    Finds datasets whose fingerprint is different from the majority. Used for 
+    consensus checks. 
 
     Parameters
     ----------
     datasets : list[xarray.Dataset]
-        List of xarray Datasets to run 'check_equiv' on and compare results for
+        List of xarray Datasets to fingerprint and compare
+    fingerprint : Callable
+        Function that takes a single dataset and returns a hashable value.
     check_equiv : Callable
-        Function to run using datasets in 'datasets' as input.
+        Pairwise comparison function for the same check. Only used to print
+        the detailed error output when verbose is True, and then only once 
+        per distinct opinion rather than once per dataset.
     verbose : bool
         Whether or not to print full output.
+    fail_fast : bool [optional, default=False]
+        Whether to stop fingerprinting datasets as soon as the check is 
+        known to fail, i.e. once there are two distinct opinions and either 
+        one of them is held by a majority or no opinion can reach a majority 
+        any more. Only the datasets fingerprinted up to then are reported.
 
     Returns
     -------
     different_datasets : list[xarray.Dataset]
-        List of datasets that are different from the majority result from 'check_equiv'. 
-        Returns None if no majority dataset is found. 
+        List of datasets that are different from the majority opinion, 
+        including those whose fingerprint raised. Returns None if no 
+        majority is found. 
+    num_opinions : int
+        Number of distinct fingerprints found among the datasets.
     """
-    majority_ds = find_majority_ds(datasets, check_equiv, verbose)
-    if majority_ds is None:
-        return None
-
+    if fail_fast:
+        groups = {}
+        fingerprinted = []
+        for i, ds in enumerate(datasets):
+            fingerprinted.append(ds)
+            try:
+                groups.setdefault(get_fact(ds, fingerprint), []).append(ds)
+            except Exception as err:
+                record_error(ds, err)
+            largest = max((len(group) for group in groups.values()), default=0)
+            if len(groups) > 1 and (largest > len(datasets) / 2 or largest + len(datasets) - i - 1 <= len(datasets) / 2):
+                break
+    else:
+        fingerprinted = datasets
+        groups = group_datasets(datasets, fingerprint)
+    grouped = {id(ds) for group in groups.values() for ds in group}
+    errored = [ds for ds in fingerprinted if id(ds) not in grouped]
+    if len(groups) == 0:
+        return errored, 0
+
+    majority_group = max(groups.values(), key=len)
+    if len(majority_group) <= len(datasets) / 2:
+        if verbose:
+            representatives = [group[0] for group in groups.values()]
+            for ds in representatives[1:]:
+                record_event("check_equiv_calls", 1, get_filename(ds))
+                check_equiv(representatives[0], ds, verbose)
+        return None, len(groups)
+
+    majority_ds = majority_group[0]
     different_datasets = []
-    for ds in datasets:
-        if not check_equiv(majority_ds, ds, False):
-            different_datasets.append(ds)
-
-    return different_datasets
-
-def find_wrong_datasets(datasets: list[xarray.Dataset], check: Callable, verbose: bool) -> list:
+    for group in groups.values():
+        if group is majority_group:
+            continue
+        if verbose:
+            record_event("check_equiv_calls", 1, get_filename(group[0]))
+            check_equiv(majority_ds, group[0], verbose)
+        different_datasets.extend(group)
+    different_datasets.extend(errored)
+
+    # keep the input order so the output is easy to match against the paths
+    order = {id(ds): i for i, ds in enumerate(datasets)}
+    different_datasets.sort(key=lambda ds: order[id(ds)])
+    return different_datasets, len(groups)
+
+def find_wrong_datasets(datasets: list[xarray.Dataset], check: Callable, verbose: bool, fail_fast: bool = False) -> list:
     r"""
     Finds datasets that are incorrect when check() is called on them. Used for individual integrity checks. 
 
@@ -104,20 +565,50 @@ def find_wrong_datasets(datasets: list[xarray.Dataset], check: Callable, verbose
         Function to run which returns true if the dataset passes the test and false otherwise.
     verbose : bool
         Whether or not to print full output.
+    fail_fast : bool [optional, default=False]
+        Whether to stop at the first dataset that fails the check
 
     Returns
     -------
     wrong_datasets : list[xarray.Dataset]
-        List of datasets that are do not pass the check(). 
+        List of datasets that are do not pass the check(), including those 
+        on which check() raised (see record_error()). 
     """
 
     wrong_datasets = []
     for ds in datasets:
-        if not check(ds, verbose):
+        try:
+            passed = check(ds, verbose)
+        except Exception as err:
+            record_error(ds, err)
+            if verbose:
+                print(f"Dataset {get_filename(ds)} could not be checked: {type(err).__name__}: {err}\n")
+            passed = False
+        if not passed:
             wrong_datasets.append(ds)
+            if fail_fast:
+                break
     return wrong_datasets
 
 
+def sample_paths(paths: list[str], sample: int | float, seed: int = 0) -> list[str]:
+    """
+    Returns a random subset of 'paths' in their original order: 'sample'
+    paths if it is an int, or that fraction of the paths (rounded up) if it
+    is a float. The same seed always selects the same paths.
+    """
+    if isinstance(sample, float) and 0 < sample <= 1:
+        count = int(np.ceil(sample * len(paths)))
+    elif isinstance(sample, int) and sample >= 1:
+        count = sample
+    else:
+        raise ValueError(f"Invalid sample: {sample}. Expected a number of datasets (int >= 1) or a fraction (0 < float <= 1)")
+    if count >= len(paths):
+        return list(paths)
+    chosen = set(random.Random(seed).sample(range(len(paths)), count))
+    return [path for i, path in enumerate(paths) if i in chosen]
+
+
 def get_filename(ds: xarray.Dataset) -> str:
     """
     Gets file name associated with the given xarray Dataset.
@@ -132,10 +623,99 @@ def get_filename(ds: xarray.Dataset) -> str:
     filename : str
         File name of netCDF dataset
     """
-    return ds.encoding["source"].split("/")[-1]
+    return get_basename(ds.encoding["source"])
+
+
+def get_source(ds: xarray.Dataset) -> str:
+    # Path the dataset was opened from. Handles keep the path they were created with, whether or not they are open.
+    return ds.path if isinstance(ds, DatasetHandle) else ds.encoding["source"]
+
+
+def get_basename(path: str) -> str:
+    """
+    Returns the file name of a local path or fsspec URL, e.g. "x.zarr" for
+    both "/data/x.zarr/" and "s3://bucket/data/x.zarr".
+    """
+    return path.rstrip("/").split("/")[-1]
+
+
+def is_url(path: str) -> bool:
+    """
+    Returns whether 'path' is an fsspec URL such as "s3://bucket/x.zarr" or
+    "file:///data/x.zarr" rather than a plain local path.
+    """
+    return "://" in path
+
+
+def has_glob(path: str) -> bool:
+    """
+    Returns whether 'path' contains glob wildcards.
+    """
+    return any(char in path for char in "*?[")
+
+
+def expand_paths(paths: list[str] | str) -> list[str]:
+    """
+    Expands glob patterns in a list of local paths or fsspec URLs. Patterns in
+    URLs are expanded with fsspec (e.g. "s3://bucket/ramip/*/pr_*.zarr"), and
+    everything else is returned unchanged.
+
+    Parameters
+    ----------
+    paths : list[str] or str
+        Paths, URLs or glob patterns
+
+    Returns
+    -------
+    paths : list[str]
+        Paths and URLs, with the matches of each pattern in sorted order
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    expanded = []
+    for path in paths:
+        if not has_glob(path):
+            expanded.append(path)
+        elif "://" in path:
+            import fsspec
+            fs, _ = fsspec.core.url_to_fs(path)
+            expanded += sorted(fs.unstrip_protocol(match) for match in fs.glob(path))
+        else:
+            expanded += sorted(glob.glob(path))
+    return expanded
 
 
-def get_consensus_check_msg(different_datasets: list[xarray.Dataset], check_name: str, msgs: list, checks, total: int) -> str: 
+def parse_cmip_filename(filename: str) -> dict:
+    """
+    Parses a CMIP-style file name of the form
+    <variable>_<table>_<model>_<experiment>_<member>_<grid>[_<time range>].nc
+
+    Parameters
+    ----------
+    filename : str
+        File name (or path) of a netCDF file or zarr store
+
+    Returns
+    -------
+    parts : dict
+        Maps "variable", "table", "model", "experiment", "member", "grid" and
+        "time_range" to their values. Returns None if the name does not 
+        follow the pattern.
+    """
+    name = get_basename(filename)
+    for extension in [".nc", ".zarr"]:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    parts = name.split("_")
+    if len(parts) < 6:
+        return None
+    keys = ["variable", "table", "model", "experiment", "member", "grid"]
+    parsed = dict(zip(keys, parts[:6]))
+    parsed["time_range"] = "_".join(parts[6:]) if len(parts) > 6 else None
+    return parsed
+
+
+def get_consensus_check_msg(different_datasets: list[xarray.Dataset], check_name: str, msgs: list, checks, total: int, num_opinions: int = None) -> str: 
     """
     Returns a standardized message for a passed check or a failed check for consensus checks. 
 
@@ -152,13 +732,17 @@ def get_consensus_check_msg(different_datasets: list[xarray.Dataset], check_name
         An optional Dictionary that maps the check name to whether or not it passed 
     total: int 
         The total number of datasets that were checked 
+    num_opinions: int [optional, default=None]
+        The number of distinct opinions found among the datasets, if known
     """ 
 
+    opinions_msg = "" if num_opinions is None else f" ({num_opinions} distinct opinions were found)"
+
     if different_datasets is None:
         if checks is not None:
             checks[check_name] = False 
         check_msg = Style.BRIGHT + Fore.RED + f"{check_name} failed: " + Style.RESET_ALL
-        check_msg += Fore.RED + f"{msgs[0]} A majority of them are different from each other.\n" + Style.RESET_ALL
+        check_msg += Fore.RED + f"{msgs[0]} A majority of them are different from each other{opinions_msg}.\n" + Style.RESET_ALL
     elif len(different_datasets) == 0:
         if checks is not None:
             checks[check_name] = True 
@@ -169,8 +753,13 @@ def get_consensus_check_msg(different_datasets: list[xarray.Dataset], check_name
         if checks is not None:
             checks[check_name] = False 
         check_msg = Style.BRIGHT + Fore.RED + f"{check_name} failed: " + Style.RESET_ALL
-        check_msg += Fore.RED + f"{msgs[0]} The following datasets ({len(different_datasets)}/{total}) are different from the majority opinion: " + str(dataset_names) + "\n" + Style.RESET_ALL
+        check_msg += Fore.RED + f"{msgs[0]} The following datasets ({len(different_datasets)}/{total}) are different from the majority opinion{opinions_msg}: " + str(dataset_names) + "\n" + Style.RESET_ALL
 
+    if isinstance(checks, CheckResults):
+        # Without a majority, the datasets that failed are filled in by the caller, which knows them all
+        failed = [] if different_datasets is None else [get_source(ds) for ds in different_datasets]
+        passed = different_datasets is not None and len(different_datasets) == 0
+        checks.details[check_name] = CheckResult(check_name, passed, msgs[1] if passed else msgs[0], failed, total, num_opinions)
     return check_msg
 
 def get_indiv_check_msg(wrong_datasets: list[xarray.Dataset], check_name: str, msgs: list, checks, total: int) -> str: 
@@ -203,32 +792,199 @@ def get_indiv_check_msg(wrong_datasets: list[xarray.Dataset], check_name: str, m
         check_msg = Style.BRIGHT + Fore.RED + f"{check_name} failed: " + Style.RESET_ALL
         check_msg += Fore.RED + f"{msgs[0]} The following datasets ({len(wrong_datasets)}/{total}) failed the check: " + str(dataset_names) + "\n" + Style.RESET_ALL
 
+    if isinstance(checks, CheckResults):
+        passed = len(wrong_datasets) == 0
+        checks.details[check_name] = CheckResult(check_name, passed, msgs[1] if passed else msgs[0], [get_source(ds) for ds in wrong_datasets], total)
     return check_msg
 
-def convert_paths(paths: list[str] | str) -> list[xarray.Dataset]:
+def open_path(path: str, header_only: bool = False, prefetched: dict = None, decode_times: bool = None) -> xarray.Dataset:
+    """
+    Opens a single netCDF file or zarr store as an xarray Dataset.
+
+    Parameters
+    ----------
+    path : str
+        Path or fsspec URL to a netCDF file (.nc) or zarr store (.zarr)
+    header_only : bool [optional, default=False]
+        If True, the dataset is opened lazily with dask chunks and without 
+        building pandas indexes for its coordinates or decoding its times. 
+        This is all the metadata and coordinate checks need and is much 
+        cheaper than a full open.
+    prefetched : dict [optional, default=None]
+        For a zarr store at a URL, the contents of store keys that were
+        already fetched by tests.remote.prefetch_stores()
+    decode_times : bool [optional, default=None]
+        Whether to decode the time coordinate to datetimes or cftime objects. 
+        If False, times are kept as raw numbers with their units and calendar 
+        in the attributes (see is_raw_time()), which avoids building large 
+        arrays of cftime objects for non-standard calendars. Defaults to 
+        decoding unless 'header_only' is True.
+
+    Returns
+    -------
+    dataset : xarray.Dataset
+        The opened dataset
+    """
+    kwargs = {}
+    if header_only:
+        kwargs = {"chunks": {}, "create_default_indexes": False}
+    kwargs["decode_times"] = not header_only if decode_times is None else decode_times
+
+    start = time.perf_counter()
+    if is_url(path):
+        from tests.remote import open_url
+        ds = open_url(path, kwargs, prefetched)
+    elif path.endswith(".nc"):
+        ds = xarray.open_dataset(path, **kwargs)
+    elif path.rstrip("/").endswith(".zarr"):
+        ds = xarray.open_zarr(path, **kwargs)
+    else:
+        raise ValueError(f"File type not supported: {path}")
+    record_event("open_time", time.perf_counter() - start, get_basename(path))
+    return ds
+
+
+def report_path_failures(path_failures: dict, paths: list[str], failures: dict = None, verb: str = "open") -> None:
+    """
+    Reports the paths an operation over 'paths' failed on: they are recorded 
+    in 'failures' if it is given, and otherwise a ValueError listing every 
+    one of them is raised, e.g. "Could not open 2/10 paths".
+
+    Parameters
+    ----------
+    path_failures : dict[str, Exception]
+        Maps each path that failed to the exception that was raised
+    paths : list[str]
+        Every path the operation was run on
+    failures : dict[str, Exception] [optional, default=None]
+        Dictionary given by the caller to record the failures in
+    verb : str [optional, default="open"]
+        What could not be done to the paths, e.g. "rechunk"
+    """
+    if failures is not None:
+        failures.update(path_failures)
+    elif len(path_failures) > 0:
+        details = "\n".join(f"{path}: {err}" for path, err in path_failures.items())
+        raise ValueError(f"Could not {verb} {len(path_failures)}/{len(paths)} paths:\n{details}")
+
+
+def convert_paths_pooled(paths: list[str], pool: HandlePool, facts: list[Callable] = None, header_only: bool = False,
+                         failures: dict = None, known_facts: dict = None) -> list[DatasetHandle]:
+    """
+    Like convert_paths(), but returns DatasetHandles whose datasets are opened 
+    through 'pool', so at most pool.max_open datasets are open at any time. 
+    Each dataset is opened once, to find the paths that cannot be opened and 
+    to compute 'facts' while it is open, and is closed again when the pool 
+    evicts it.
+
+    Parameters
+    ----------
+    paths : list[str]
+        List of file paths to netCDF files or zarr stores
+    pool : HandlePool
+        Pool that bounds the number of open datasets
+    facts : list[Callable] [optional, default=None]
+        Fact functions needed by the checks that will be run
+    header_only : bool [optional, default=False]
+        Passed to open_path()
+    failures : dict[str, Exception] [optional, default=None]
+        If given, paths that could not be opened are skipped and recorded 
+        here. Otherwise, a ValueError listing every failed path is raised.
+    known_facts : dict [optional, default=None]
+        Maps paths to facts that are already known, e.g. from a cache. Paths 
+        that already have every fact in 'facts' are not opened.
+
+    Returns
+    -------
+    datasets : list[DatasetHandle]
+        List of handles, in the same order as 'paths'
+    """
+    facts = [] if facts is None else facts
+    known_facts = {} if known_facts is None else known_facts
+
+    handles = []
+    path_failures = {}
+    for path in paths:
+        handle = DatasetHandle(path, facts=dict(known_facts.get(path) or {}), header_only=header_only, pool=pool)
+        if len(handle.facts) == 0 or any(fact.__name__ not in handle.facts for fact in facts):
+            try:
+                handle.ds
+            except Exception as err:
+                path_failures[path] = err
+                continue
+            for fact in facts:
+                try:
+                    get_fact(handle, fact)
+                except Exception:
+                    # Recomputed (and raised again) if a check needs it
+                    continue
+        handles.append(handle)
+
+    report_path_failures(path_failures, paths, failures)
+    return handles
+
+
+def convert_paths(paths: list[str] | str, workers: int = 1, header_only: bool = False, failures: dict = None, max_requests: int = 32) -> list[xarray.Dataset]:
     """
     Converts a list of file paths to a list of xarray Datasets. These paths 
-    can be either netCDF files or zarr stores.
+    can be either netCDF files or zarr stores, given as local paths, fsspec 
+    URLs or glob patterns of either.
 
     Parameters
     ----------
     paths : list[str] or str
-        List of file paths to convert to xarray Datasets
+        List of file paths to convert to xarray Datasets. See expand_paths().
+    workers : int [optional, default=1]
+        Number of threads used to open the datasets concurrently
+    header_only : bool [optional, default=False]
+        Whether to open the datasets lazily without building coordinate 
+        indexes. See open_path().
+    failures : dict[str, Exception] [optional, default=None]
+        If given, paths that could not be opened are skipped and recorded here 
+        with the exception that was raised. Otherwise, a ValueError listing 
+        every path that failed is raised once all paths have been tried.
+    max_requests : int [optional, default=32]
+        Maximum number of concurrent requests when prefetching the metadata 
+        and coordinates of zarr stores at URLs
 
     Returns
     -------
     datasets : list[xarray.Dataset]
-        List of xarray Datasets
+        List of xarray Datasets, in the same order as the expanded 'paths'
     """
-    if isinstance(paths, str):
-        paths = [paths]
+    paths = expand_paths(paths)
+
+    # Opening remote stores one by one is dominated by request latency, so the small keys every
+    # open reads are fetched for all stores at once
+    prefetched = {}
+    urls = [path for path in paths if is_url(path) and path.rstrip("/").endswith(".zarr")]
+    if len(urls) > 0:
+        from tests.remote import prefetch_stores
+        try:
+            prefetched = prefetch_stores(urls, max_requests)
+        except Exception:
+            # Prefetching only saves time: every store is still opened, and fails, on its own
+            prefetched = {}
+
+    def try_open(path):
+        try:
+            return open_path(path, header_only, prefetched.get(path)), None
+        except Exception as err:
+            return None, err
+
+    if workers > 1 and len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(try_open, paths))
+    else:
+        results = [try_open(path) for path in paths]
+
     datasets = []
-    for path in paths:
-        if path.endswith(".nc"):
-            datasets.append(xarray.open_dataset(path))
-        elif path.endswith(".zarr"):
-            datasets.append(xarray.open_zarr(path))
+    path_failures = {}
+    for path, (ds, err) in zip(paths, results):
+        if err is None:
+            datasets.append(ds)
         else:
-            raise ValueError(f"File type not supported: {path}")
-    return datasets
+            path_failures[path] = err
 
+    report_path_failures(path_failures, paths, failures)
+    return datasets